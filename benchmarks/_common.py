@@ -0,0 +1,21 @@
+"""Shared helpers of the benchmark scripts."""
+import os
+import random
+
+from psycopgr import PgrNode
+
+
+def dsn():
+    """Database connection string of the benchmarks."""
+    return os.environ.get('PSYCOPGR_DSN', 'dbname=routing')
+
+
+def random_nodes(n, bbox=(116.20, 39.85, 116.55, 40.10), seed=0):
+    """n random PgrNodes uniformly distributed in bbox
+    (min_lon, min_lat, max_lon, max_lat).
+    """
+    rnd = random.Random(seed)
+    return [PgrNode(None,
+                    rnd.uniform(bbox[0], bbox[2]),
+                    rnd.uniform(bbox[1], bbox[3]))
+            for _ in range(n)]
@@ -0,0 +1,65 @@
+"""Benchmark of one-to-one routing latency with bidirectional ALT.
+
+Reports ALT preprocessing time and memory, then latency percentiles of
+one-to-one queries between random vertices: pgRouting's pgr_aStar, the
+plain in-process Dijkstra of the 'local' backend, and the 'alt' backend.
+
+Usage:
+    PSYCOPGR_DSN="dbname=mydb user=user" python benchmarks/bench_alt.py
+"""
+import time
+
+import numpy as np
+
+from psycopgr import PGRouting
+
+from _common import dsn, random_nodes
+
+
+def latencies(astar, pairs):
+    """Seconds per query, and the costs found."""
+    seconds, costs = [], []
+    for start_vid, end_vid in pairs:
+        t0 = time.perf_counter()
+        routing = astar(start_vid, end_vid)
+        seconds.append(time.perf_counter() - t0)
+        costs.extend(v['cost'] for v in routing.values())
+    return np.array(seconds), costs
+
+
+def main():
+    pgr = PGRouting(dsn())
+    graph = pgr.load_graph()
+
+    t0 = time.perf_counter()
+    alt = pgr.build_alt()
+    print('preprocessing: {} vertices, {} landmarks, {:.1f} s, '
+          'tables {:.1f} MB'.format(graph.num_vertices, len(alt.landmarks),
+                                    time.perf_counter() - t0,
+                                    alt.nbytes() / 1e6))
+
+    nodes = random_nodes(400)
+    node_vertex = pgr._snap_nodes(nodes)
+    vids = [node_vertex[node]['vertex'].id for node in nodes]
+    pairs = [(s, t) for s, t in zip(vids[::2], vids[1::2]) if s != t]
+
+    backends = [
+        ('pgrouting', pgr.astar),
+        ('local', lambda s, t: graph.dijkstra([s], [t])),
+        ('alt', alt.astar),
+    ]
+    print('{:>10} {:>8} {:>10} {:>10} {:>10} {:>10}'.format(
+        'backend', 'queries', 'p50 ms', 'p95 ms', 'p99 ms', 'max diff'))
+    base = None
+    for name, astar in backends:
+        seconds, costs = latencies(astar, pairs)
+        if base is None:
+            base = costs
+        diff = max([abs(a - b) for a, b in zip(costs, base)] or [0])
+        p50, p95, p99 = np.percentile(seconds, [50, 95, 99]) * 1e3
+        print('{:>10} {:>8} {:>10.2f} {:>10.2f} {:>10.2f} {:>10.2g}'.format(
+            name, len(pairs), p50, p95, p99, diff))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""Benchmark of bounding-box subgraph restriction.
+
+Routes pairs of nearby nodes with set_bbox at several margins, without
+retries, and reports latency per pair and how many costs differ from
+routing on the whole edge table (missing: unreachable within the bbox,
+worse: a longer path than the shortest one).
+
+Then checks, on directed and undirected graphs, that routing all pairs of
+nearby nodes at once with a wide enough bbox takes a single query: pairs
+found inside the bbox must not be retried.
+
+Usage:
+    PSYCOPGR_DSN="dbname=mydb user=user" python benchmarks/bench_bbox.py
+"""
+import random
+import time
+
+from psycopgr import PGRouting, Profiler
+
+from _common import dsn, random_nodes
+
+
+def local_pairs(pgr, n, radius=0.02, seed=0):
+    """n vertex pairs, each within radius degrees of a random center."""
+    rnd = random.Random(seed)
+    pairs = []
+    for center in random_nodes(n, seed=seed):
+        nodes = [center._replace(lon=center.lon + rnd.uniform(-radius, radius),
+                                 lat=center.lat + rnd.uniform(-radius, radius))
+                 for _ in range(2)]
+        vertices = pgr.find_nearest_vertices(nodes)
+        pairs.append((vertices[0].id, vertices[1].id))
+    return pairs
+
+
+def main(n=20):
+    pgr = PGRouting(dsn())
+    pairs = local_pairs(pgr, n)
+
+    print('{:>8} {:>12} {:>8} {:>8}'.format('margin', 'ms / pair', 'missing',
+                                            'worse'))
+    expected = {}
+    for margin in (None, 0.1, 0.05, 0.02, 0.01, 0.005):
+        pgr.set_bbox(margin, max_retries=0, fallback=False)
+        t0 = time.perf_counter()
+        costs = {}
+        for start_vid, end_vid in pairs:
+            costs.update(pgr.dijkstra_cost([start_vid], [end_vid]))
+        elapsed = time.perf_counter() - t0
+        if margin is None:
+            expected = costs
+        missing = sum(pair not in costs for pair in expected)
+        worse = sum(costs[pair] > cost + 1e-6
+                    for pair, cost in expected.items() if pair in costs)
+        print('{:>8} {:>12.1f} {:>8} {:>8}'.format(
+            str(margin), elapsed / n * 1e3, missing, worse))
+
+
+
+def check_round_trips(n=10, margin=0.1):
+    """Assert that routing n nearby nodes, all reachable in the bbox, takes
+    a single query with the bbox.
+    """
+    pgr = PGRouting(dsn())
+    profiler = pgr.set_profiler(Profiler())
+    vids = sorted({vid for pair in local_pairs(pgr, n // 2) for vid in pair})
+    print('{:>9} {:>8} {:>12} {:>6}'.format('directed', 'margin',
+                                             'round trips', 'pairs'))
+    for directed in (True, False):
+        pgr.set_meta_data(directed=directed)
+        expected = None
+        for bbox in (None, margin):
+            pgr.set_bbox(bbox)
+            costs = pgr.dijkstra_cost(vids, vids)
+            round_trips = profiler.calls[-1].round_trips
+            print('{:>9} {:>8} {:>12} {:>6}'.format(
+                str(directed), str(bbox), round_trips, len(costs)))
+            if expected is None:
+                expected = costs
+            elif costs.keys() == expected.keys():
+                assert round_trips == 1, \
+                    'pairs found in the bbox were retried'
+
+
+if __name__ == '__main__':
+    main()
+    check_round_trips()
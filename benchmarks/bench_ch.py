@@ -0,0 +1,56 @@
+"""Benchmark of Contraction Hierarchies preprocessing and queries.
+
+Reports preprocessing time and memory, and the speedup of cost matrix
+queries on the 'ch' backend against pgRouting's pgr_dijkstraCost and the
+plain in-process Dijkstra of the 'local' backend.
+
+Usage:
+    PSYCOPGR_DSN="dbname=mydb user=user" python benchmarks/bench_ch.py
+"""
+import time
+import tracemalloc
+
+from psycopgr import PGRouting
+
+from _common import dsn, random_nodes
+
+
+def main():
+    pgr = PGRouting(dsn())
+    graph = pgr.load_graph()
+
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    ch = pgr.build_contraction_hierarchy()
+    elapsed = time.perf_counter() - t0
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    print('preprocessing: {} vertices, {} arcs -> {} arcs, {:.1f} s, '
+          'peak {:.1f} MB, hierarchy {:.1f} MB'.format(
+              graph.num_vertices, len(graph.forward.heads), len(ch.heads),
+              elapsed, peak / 1e6, ch.nbytes() / 1e6))
+
+    print('{:>6} {:>12} {:>10} {:>10} {:>10} {:>10}'.format(
+        'N', 'backend', 'seconds', 'speedup', 'pairs', 'max diff'))
+    for n in (10, 100, 500):
+        nodes = random_nodes(n)
+        node_vertex = pgr._snap_nodes(nodes)
+        vids = [node_vertex[node]['vertex'].id for node in nodes]
+
+        results = {}
+        for backend in ('pgrouting', 'local', 'ch'):
+            t0 = time.perf_counter()
+            results[backend] = pgr._engine(backend).dijkstra_cost(vids, vids)
+            results[backend + ' s'] = time.perf_counter() - t0
+
+        base = results['pgrouting s']
+        for backend in ('pgrouting', 'local', 'ch'):
+            diff = max([abs(results[backend][k] - v)
+                        for k, v in results['pgrouting'].items()] or [0])
+            print('{:>6} {:>12} {:>10.4f} {:>10.1f} {:>10} {:>10.2g}'.format(
+                n, backend, results[backend + ' s'],
+                base / results[backend + ' s'], len(results[backend]), diff))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""Benchmark of applying live edge cost changes with a ChangeFeed.
+
+Loads a synthetic network into table bench_feed, installs the change feed
+on it, loads the graph and fills the cache with a cost matrix. Then it runs
+a scripted traffic workload: each step multiplies the costs of random edges
+by random factors in one transaction, and the feed applies the change. It
+reports the latency from commit to applied, the time applying, and the
+share of cached costs invalidated, and checks the costs after each step.
+
+The database needs the postgis and pgrouting extensions.
+
+Usage:
+    PSYCOPGR_DSN="dbname=mydb user=user" python benchmarks/bench_change_feed.py \\
+        --size 10000 --steps 50 --edges 20
+"""
+import argparse
+import random
+
+import numpy as np
+import psycopg2
+
+from psycopgr import ChangeFeed, LRUCache, PGRouting
+
+import synthetic
+from _common import dsn
+from suite import percentiles, query_nodes
+
+TABLE = 'bench_feed'
+FACTORS = (0.5, 0.8, 1.25, 2.0, 4.0)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--size', type=int, default=10000,
+                        help='number of vertices of the planar network')
+    parser.add_argument('--steps', type=int, default=50)
+    parser.add_argument('--edges', type=int, default=20,
+                        help='edges updated per step')
+    parser.add_argument('--nodes', type=int, default=30,
+                        help='nodes of the cached cost matrix')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    conn = psycopg2.connect(dsn())
+    network = synthetic.planar(args.size, args.seed)
+    synthetic.load(conn, network, TABLE, args.seed)
+
+    pgr = PGRouting(dsn())
+    pgr.set_meta_data(table=TABLE)
+    feed = ChangeFeed(pgr, dsn())
+    feed.install()
+    pgr.load_graph()
+    cache = pgr.set_cache(LRUCache())
+    rnd = random.Random(args.seed)
+    nodes = query_nodes(network, args.nodes, rnd)
+    pgr.get_costs(nodes, nodes)
+
+    latencies, applies, invalidated, mismatches = [], [], [], 0
+    num_edges = len(network.sources)
+    with conn.cursor() as cur:
+        for _ in range(args.steps):
+            for gid in rnd.sample(range(1, num_edges + 1), args.edges):
+                factor = rnd.choice(FACTORS)
+                cur.execute("""
+                    UPDATE {0} SET cost_s = cost_s * %s,
+                        reverse_cost_s = CASE WHEN reverse_cost_s < 0
+                            THEN reverse_cost_s
+                            ELSE reverse_cost_s * %s END
+                    WHERE gid = %s""".format(TABLE), (factor, factor, gid))
+            conn.commit()
+            size = len(cache)
+            stats = feed.wait(timeout=10)
+            latencies.append(stats['latency_s'])
+            applies.append(stats['apply_s'])
+            invalidated.append(stats['invalidated'] / max(size, 1))
+
+            costs = pgr.get_costs(nodes, nodes)
+            expected = pgr.get_costs(nodes, nodes, backend='local')
+            mismatches += sum(1 for key, cost in expected.items()
+                              if abs(costs[key] - cost) > 1e-6)
+
+    feed.uninstall()
+    feed.close()
+    print('latency ms ', percentiles(latencies))
+    print('apply ms   ', percentiles(applies))
+    print('invalidated {:.1%} of cached entries per step'.format(
+        float(np.mean(invalidated))))
+    print('mismatched costs', mismatches)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+"""Benchmark of all-pairs costs on clustered points.
+
+Points in a few tight clusters, like addresses along the same streets,
+snap to far fewer vertices than there are points. get_costs routes each
+vertex once, and on an undirected graph only one of (u, v) and (v, u).
+Shows, for directed and undirected meta data, the vertex pairs pgRouting
+routes (rows of the routing query), its server time, and the time of the
+whole get_costs call.
+
+The edge table should have two-way streets for the two to compare, as
+undirected routing ignores reverse_cost -1.
+
+Usage:
+    PSYCOPGR_DSN="dbname=mydb user=user" python benchmarks/bench_clustered.py
+"""
+import random
+import time
+
+from psycopgr import PGRouting, PgrNode, Profiler
+
+from _common import dsn, random_nodes
+
+
+def clustered_nodes(clusters, per_cluster, radius=0.001, seed=0):
+    """per_cluster random PgrNodes within radius degrees of each of
+    clusters random centers.
+    """
+    rnd = random.Random(seed)
+    return [PgrNode(None, center.lon + rnd.uniform(-radius, radius),
+                    center.lat + rnd.uniform(-radius, radius))
+            for center in random_nodes(clusters, seed=seed)
+            for _ in range(per_cluster)]
+
+
+def main():
+    pgr = PGRouting(dsn())
+    profiler = pgr.set_profiler(Profiler())
+    print('{:>6} {:>8} {:>10} {:>11} {:>10} {:>10}'.format(
+        'nodes', 'vertices', 'directed', 'pairs', 'server s', 'total s'))
+    for clusters, per_cluster in ((20, 5), (20, 25), (50, 20)):
+        nodes = clustered_nodes(clusters, per_cluster)
+        vids = list({vertex.id
+                     for vertex in pgr.find_nearest_vertices(nodes)})
+        for directed in (True, False):
+            pgr.set_meta_data(directed=directed)
+            pgr.dijkstra_cost(vids, vids)
+            routing = profiler.calls[-1]
+
+            t0 = time.perf_counter()
+            pgr.get_costs(nodes, nodes)
+            total = time.perf_counter() - t0
+            print('{:>6} {:>8} {:>10} {:>11} {:>10.3f} {:>10.3f}'.format(
+                len(nodes), len(vids), str(directed), routing.rows,
+                routing.server_s, total))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,42 @@
+"""Benchmark of memory of routes with compact paths.
+
+Measures with tracemalloc the memory held by the routes of get_routes, with
+paths as lists of PgrNode and as compact Path, and the time to get them.
+
+Usage:
+    PSYCOPGR_DSN="dbname=mydb user=user" python benchmarks/bench_compact_paths.py
+"""
+import time
+import tracemalloc
+
+from psycopgr import PGRouting
+
+from _common import dsn, random_nodes
+
+
+def measure(pgr, nodes):
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    routes = pgr.get_routes(nodes, nodes)
+    elapsed = time.perf_counter() - t0
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    points = sum(len(route['path']) for route in routes.values())
+    return elapsed, size, points
+
+
+def main():
+    pgr = PGRouting(dsn())
+    print('{:>6} {:>8} {:>10} {:>10} {:>12}'.format(
+        'N', 'compact', 'points', 'seconds', 'MB'))
+    for n in (10, 30, 100):
+        nodes = random_nodes(n)
+        for compact in (False, True):
+            pgr.set_compact_paths(compact)
+            elapsed, size, points = measure(pgr, nodes)
+            print('{:>6} {:>8} {:>10} {:>10.3f} {:>12.2f}'.format(
+                n, str(compact), points, elapsed, size / 1e6))
+
+
+if __name__ == '__main__':
+    main()
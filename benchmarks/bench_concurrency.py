@@ -0,0 +1,43 @@
+"""Benchmark of throughput of PGRouting called from many threads.
+
+Compares a single shared connection, where calls are serialized, with
+pooled mode of several sizes.
+
+Usage:
+    PSYCOPGR_DSN="dbname=mydb user=user" python benchmarks/bench_concurrency.py
+"""
+from concurrent.futures import ThreadPoolExecutor
+import time
+
+from psycopgr import PGRouting
+
+from _common import dsn, random_nodes
+
+
+def run(pgr, jobs, threads):
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        list(executor.map(lambda job: pgr.get_costs(*job), jobs))
+    return time.perf_counter() - t0
+
+
+def main(n_jobs=200, threads=16):
+    nodes = random_nodes(4 * n_jobs)
+    # each job is a small many-to-one request like a web worker would send
+    jobs = [(nodes[4*i:4*i+3], nodes[4*i+3]) for i in range(n_jobs)]
+
+    print('{:>12} {:>8} {:>10} {:>10}'.format(
+        'mode', 'threads', 'seconds', 'calls/s'))
+    configs = [('single', {})] + [
+        ('pool-{}'.format(size), {'pool_maxconn': size})
+        for size in (2, 4, 8, 16)]
+    for name, kwargs in configs:
+        pgr = PGRouting(dsn(), **kwargs)
+        elapsed = run(pgr, jobs, threads)
+        print('{:>12} {:>8} {:>10.3f} {:>10.1f}'.format(
+            name, threads, elapsed, n_jobs / elapsed))
+        del pgr
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,40 @@
+"""Benchmark of routes with edge geometries.
+
+Compares get_routes returning vertex paths with get_routes fetching the
+WKB geometries of the edges in the same query: time, and number of points
+drawn per route.
+
+Usage:
+    PSYCOPGR_DSN="dbname=mydb user=user" python benchmarks/bench_edge_geometry.py
+"""
+import time
+
+from psycopgr import PGRouting
+
+from _common import dsn, random_nodes
+
+
+def measure(pgr, nodes):
+    t0 = time.perf_counter()
+    routes = pgr.get_routes(nodes, nodes)
+    elapsed = time.perf_counter() - t0
+    points = sum(len(route.get('geometry', route['path']))
+                 for route in routes.values())
+    return elapsed, points / max(len(routes), 1)
+
+
+def main():
+    pgr = PGRouting(dsn())
+    print('{:>6} {:>9} {:>10} {:>14}'.format(
+        'N', 'geometry', 'seconds', 'points/route'))
+    for n in (10, 30, 100):
+        nodes = random_nodes(n)
+        for geometry in (False, True):
+            pgr.set_edge_geometry(geometry)
+            elapsed, points = measure(pgr, nodes)
+            print('{:>6} {:>9} {:>10.3f} {:>14.1f}'.format(
+                n, str(geometry), elapsed, points))
+
+
+if __name__ == '__main__':
+    main()
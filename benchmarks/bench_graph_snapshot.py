@@ -0,0 +1,64 @@
+"""Benchmark of worker startup from a graph snapshot.
+
+Times loading the graph from the edge table against opening a snapshot of
+it, in fresh worker processes, and the first get_costs of each worker,
+with the private memory of the worker after it (Linux only): workers
+routing on a snapshot read its shared pages instead of copying the graph.
+
+Usage:
+    PSYCOPGR_DSN="dbname=mydb user=user" python benchmarks/bench_graph_snapshot.py
+"""
+from multiprocessing import Pool
+import os
+import tempfile
+import time
+
+from psycopgr import PGRouting
+
+from _common import dsn, random_nodes
+
+
+def private_mb():
+    """Memory of the process not shared with others, in MB."""
+    try:
+        with open('/proc/self/smaps_rollup') as f:
+            return sum(int(line.split()[1]) for line in f
+                       if line.startswith('Private')) / 1e3
+    except OSError:
+        return float('nan')
+
+
+def start(file):
+    """Start a worker routing on the 'local' backend: seconds to load the
+    graph and to compute the first costs, and private memory after them.
+    """
+    pgr = PGRouting(dsn())
+    t0 = time.perf_counter()
+    if file is None:
+        pgr.load_graph()
+    else:
+        pgr.load_graph_snapshot(file, check_table=False)
+    loaded = time.perf_counter() - t0
+    pgr.get_costs(random_nodes(10), random_nodes(10), backend='local')
+    return loaded, time.perf_counter() - t0 - loaded, private_mb()
+
+
+def main(workers=4):
+    file = os.path.join(tempfile.mkdtemp(), 'graph.snap')
+    t0 = time.perf_counter()
+    PGRouting(dsn()).save_graph_snapshot(file)
+    print('snapshot of {:.1f} MB saved in {:.3f} s'.format(
+        os.path.getsize(file) / 1e6, time.perf_counter() - t0))
+
+    print('{:>10} {:>10} {:>12} {:>12}'.format('source', 'load s',
+                                               'first call s', 'private MB'))
+    with Pool(workers) as pool:
+        for source, arg in (('table', None), ('snapshot', file)):
+            for loaded, first, private in pool.map(start, [arg] * workers):
+                print('{:>10} {:>10.3f} {:>12.3f} {:>12.1f}'.format(
+                    source, loaded, first, private))
+    os.remove(file)
+
+
+if __name__ == '__main__':
+    main()
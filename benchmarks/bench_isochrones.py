@@ -0,0 +1,46 @@
+"""Benchmark of isochrones against thresholding a cost matrix.
+
+Coverage of depots within a maximum cost, computed by get_isochrones in a
+single pgr_drivingDistance query, and by get_cost_matrix from the depots to
+a dense grid of points whose costs are then thresholded.
+
+Usage:
+    PSYCOPGR_DSN="dbname=mydb user=user" python benchmarks/bench_isochrones.py
+"""
+import time
+
+from psycopgr import PGRouting, PgrNode
+
+from _common import dsn, random_nodes
+
+
+def grid_nodes(n, bbox=(116.20, 39.85, 116.55, 40.10)):
+    """n x n PgrNodes on a regular grid over bbox."""
+    return [PgrNode(None,
+                    bbox[0] + (bbox[2] - bbox[0]) * i / (n - 1),
+                    bbox[1] + (bbox[3] - bbox[1]) * j / (n - 1))
+            for i in range(n) for j in range(n)]
+
+
+def main(max_cost=600.0):
+    pgr = PGRouting(dsn())
+    print('{:>7} {:>12} {:>10}'.format('depots', 'method', 'seconds'))
+    for num_depots in (1, 10, 50):
+        depots = random_nodes(num_depots)
+        for n in (20, 50):
+            grid = grid_nodes(n)
+            t0 = time.perf_counter()
+            m = pgr.get_cost_matrix(depots, grid)
+            (m.costs <= max_cost).any(axis=0)  # grid points covered
+            print('{:>7} {:>12} {:>10.3f}'.format(
+                num_depots, 'grid {}'.format(n * n),
+                time.perf_counter() - t0))
+        for method, hull in (('isochrones', None), ('hulls', 0.9)):
+            t0 = time.perf_counter()
+            pgr.get_isochrones(depots, max_cost, hull=hull)
+            print('{:>7} {:>12} {:>10.3f}'.format(
+                num_depots, method, time.perf_counter() - t0))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,40 @@
+"""Benchmark of the in-process 'local' backend against pgRouting.
+
+Loads the edge table once, then times get_costs on both backends and
+checks that they return the same costs.
+
+Usage:
+    PSYCOPGR_DSN="dbname=mydb user=user" python benchmarks/bench_local_graph.py
+"""
+import time
+
+from psycopgr import PGRouting
+
+from _common import dsn, random_nodes
+
+
+def main():
+    pgr = PGRouting(dsn())
+
+    t0 = time.perf_counter()
+    graph = pgr.load_graph()
+    print('loaded {} vertices, {} arcs in {:.3f} s'.format(
+        graph.num_vertices, len(graph.forward.heads),
+        time.perf_counter() - t0))
+
+    print('{:>6} {:>12} {:>12} {:>10}'.format(
+        'N', 'pgrouting s', 'local s', 'max diff'))
+    for n in (2, 10, 50):
+        nodes = random_nodes(n)
+        t0 = time.perf_counter()
+        expected = pgr.get_costs(nodes, nodes)
+        t1 = time.perf_counter()
+        costs = pgr.get_costs(nodes, nodes, backend='local')
+        t2 = time.perf_counter()
+        diff = max([abs(costs[k] - v) for k, v in expected.items()] or [0])
+        print('{:>6} {:>12.4f} {:>12.4f} {:>10.2g}'.format(
+            n, t1 - t0, t2 - t1, diff))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+"""Benchmark of routing explicit pairs against all combinations.
+
+Costs from each order to its k nearest candidates, computed by
+get_costs_for_pairs, and by get_costs over all orders x candidates.
+
+Usage:
+    PSYCOPGR_DSN="dbname=mydb user=user" python benchmarks/bench_pairs.py
+"""
+import time
+
+import numpy as np
+
+from psycopgr import PGRouting
+
+from _common import dsn, random_nodes
+
+
+def nearest_pairs(orders, candidates, k):
+    """(order, candidate) pairs of each order and its k nearest candidates
+    as the crow flies.
+    """
+    lons = np.array([node.lon for node in candidates])
+    lats = np.array([node.lat for node in candidates])
+    pairs = []
+    for order in orders:
+        distances = (lons - order.lon) ** 2 + (lats - order.lat) ** 2
+        pairs += [(order, candidates[j]) for j in np.argsort(distances)[:k]]
+    return pairs
+
+
+def main(k=5):
+    pgr = PGRouting(dsn())
+    print('{:>7} {:>10} {:>7} {:>10} {:>10}'.format(
+        'orders', 'candidates', 'pairs', 'all s', 'pairs s'))
+    for num_orders, num_candidates in ((100, 100), (300, 300), (1000, 500)):
+        orders = random_nodes(num_orders, seed=1)
+        candidates = random_nodes(num_candidates, seed=2)
+        pairs = nearest_pairs(orders, candidates, k)
+
+        t0 = time.perf_counter()
+        pgr.get_costs(orders, candidates)
+        every = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        pgr.get_costs_for_pairs(pairs)
+        chosen = time.perf_counter() - t0
+        print('{:>7} {:>10} {:>7} {:>10.3f} {:>10.3f}'.format(
+            num_orders, num_candidates, len(pairs), every, chosen))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,38 @@
+"""Benchmark of prepared statements against plain queries.
+
+Reports the latency per call of small queries, where planning and sending
+the query text weigh most, with prepare_statements on and off.
+
+Usage:
+    PSYCOPGR_DSN="dbname=mydb user=user" python benchmarks/bench_prepared.py
+"""
+import time
+
+from psycopgr import PGRouting
+
+from _common import dsn, random_nodes
+
+
+def main(repeat=50):
+    nodes = random_nodes(2)
+    print('{:>10} {:>12} {:>12}'.format('prepared', 'snap ms', 'cost ms'))
+    for prepare in (False, True):
+        pgr = PGRouting(dsn(), prepare_statements=prepare)
+        vertices = pgr.find_nearest_vertices(nodes)
+        vids = [v.id for v in vertices]
+        pgr.dijkstra_cost(vids, vids)  # warm up
+
+        t0 = time.perf_counter()
+        for _ in range(repeat):
+            pgr.find_nearest_vertices(nodes)
+        t1 = time.perf_counter()
+        for _ in range(repeat):
+            pgr.dijkstra_cost(vids, vids)
+        t2 = time.perf_counter()
+        print('{:>10} {:>12.3f} {:>12.3f}'.format(
+            str(prepare), (t1 - t0) / repeat * 1e3,
+            (t2 - t1) / repeat * 1e3))
+
+
+if __name__ == '__main__':
+    main()
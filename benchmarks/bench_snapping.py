@@ -0,0 +1,54 @@
+"""Benchmark of batched nearest vertex snapping.
+
+Shows how the number of SQL round trips and the elapsed time of
+PGRouting.find_nearest_vertices scale with the number of nodes.
+
+Usage:
+    PSYCOPGR_DSN="dbname=mydb user=user" python benchmarks/bench_snapping.py
+"""
+import time
+
+from psycopgr import PGRouting
+
+from _common import dsn, random_nodes
+
+
+class CountingCursor(object):
+    """Cursor proxy counting execute calls (i.e. round trips)."""
+
+    def __init__(self, cur):
+        self._cur = cur
+        self.executes = 0
+
+    def execute(self, *args, **kwargs):
+        self.executes += 1
+        return self._cur.execute(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._cur, name)
+
+
+def main():
+    pgr = PGRouting(dsn())
+    counter = CountingCursor(pgr._cur)
+    pgr._cur = counter
+
+    print('{:>6} {:>8} {:>10} {:>10}'.format(
+        'N', 'chunk', 'round trips', 'seconds'))
+    for n in (10, 100, 1000, 5000):
+        nodes = random_nodes(n)
+        for chunk_size in (1, 1000):
+            if chunk_size == 1 and n > 1000:
+                continue  # the per-node baseline gets too slow
+            counter.executes = 0
+            t0 = time.perf_counter()
+            pgr.find_nearest_vertices(nodes, chunk_size=chunk_size)
+            elapsed = time.perf_counter() - t0
+            print('{:>6} {:>8} {:>10} {:>10.3f}'.format(
+                n, chunk_size, counter.executes, elapsed))
+
+    pgr._cur = counter._cur
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,43 @@
+"""Scaling benchmark of tiled parallel many-to-many costs.
+
+Computes one cost matrix with get_costs, untiled and with Tiling over
+several numbers of workers and tile sizes, on PGRouting in pooled mode
+with as many connections as workers.
+
+Usage:
+    PSYCOPGR_DSN="dbname=mydb user=user" python benchmarks/bench_tiling.py
+"""
+import time
+
+from psycopgr import PGRouting, Tiling
+
+from _common import dsn, random_nodes
+
+
+def main(n=400):
+    nodes = random_nodes(n)
+
+    print('{:>8} {:>10} {:>10} {:>10}'.format(
+        'workers', 'tile', 'seconds', 'speedup'))
+    pgr = PGRouting(dsn())
+    t0 = time.perf_counter()
+    expected = pgr.get_costs(nodes, nodes)
+    baseline = time.perf_counter() - t0
+    print('{:>8} {:>10} {:>10.3f} {:>10.2f}'.format(1, '-', baseline, 1.0))
+    del pgr
+
+    for workers in (2, 4, 8):
+        pgr = PGRouting(dsn(), pool_minconn=workers, pool_maxconn=workers)
+        for tile_size in (50, 100, 200):
+            tiling = Tiling(tile_size, workers)
+            t0 = time.perf_counter()
+            costs = pgr.get_costs(nodes, nodes, tiling=tiling)
+            elapsed = time.perf_counter() - t0
+            assert costs == expected
+            print('{:>8} {:>10} {:>10.3f} {:>10.2f}'.format(
+                workers, tile_size, elapsed, baseline / elapsed))
+        del pgr
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,42 @@
+"""Benchmark of in-process nearest vertex snapping against SQL.
+
+Reports the memory of the vertex index and the latency of
+find_nearest_vertices with and without it, and checks that both return
+the same vertices.
+
+Usage:
+    PSYCOPGR_DSN="dbname=mydb user=user" python benchmarks/bench_vertex_index.py
+"""
+import time
+
+from psycopgr import PGRouting
+
+from _common import dsn, random_nodes
+
+
+def main():
+    pgr = PGRouting(dsn())
+
+    t0 = time.perf_counter()
+    index = pgr.load_vertex_index()
+    print('index of {} vertices: {:.3f} s to load, {:.1f} MB'.format(
+        len(index.ids), time.perf_counter() - t0, index.nbytes() / 1e6))
+
+    print('{:>6} {:>10} {:>10} {:>10}'.format(
+        'N', 'sql s', 'index s', 'mismatch'))
+    for n in (10, 1000, 10000):
+        nodes = random_nodes(n)
+        pgr.drop_vertex_index()
+        t0 = time.perf_counter()
+        expected = pgr.find_nearest_vertices(nodes)
+        t1 = time.perf_counter()
+        pgr._vertex_index = index
+        vertices = pgr.find_nearest_vertices(nodes)
+        t2 = time.perf_counter()
+        mismatch = sum(a.id != b.id for a, b in zip(expected, vertices))
+        print('{:>6} {:>10.4f} {:>10.4f} {:>10}'.format(
+            n, t1 - t0, t2 - t1, mismatch))
+
+
+if __name__ == '__main__':
+    main()
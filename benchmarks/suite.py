@@ -0,0 +1,221 @@
+"""Routing benchmark suite on synthetic road networks.
+
+Generates networks of several kinds and sizes (see synthetic.py), loads
+them into the database, and times the public calls of PGRouting on each.
+For every call it reports latency percentiles, the number of SQL round
+trips, and the peak memory allocated by the call, as JSON, so that the
+results of two runs can be compared.
+
+The database needs the postgis and pgrouting extensions.
+
+Usage:
+    PSYCOPGR_DSN="dbname=mydb user=user" python benchmarks/suite.py \\
+        --kinds grid,planar --sizes 1000,10000 --output before.json
+"""
+import argparse
+import datetime
+import json
+import platform
+import random
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import psycopg2
+import psycopg2.extensions
+
+from psycopgr import PgrNode, PGRouting
+
+import synthetic
+from _common import dsn
+
+
+class CountingConnection(psycopg2.extensions.connection):
+    """Connection counting the execute calls (i.e. round trips) of all its
+    cursors in executes.
+    """
+    executes = 0
+    _factories = {}
+
+    def cursor(self, *args, cursor_factory=None, **kwargs):
+        factory = cursor_factory or psycopg2.extensions.cursor
+        if factory not in self._factories:
+            class CountingCursor(factory):
+                def execute(self, *args, **kwargs):
+                    self.connection.executes += 1
+                    return super().execute(*args, **kwargs)
+            self._factories[factory] = CountingCursor
+        return super().cursor(*args, cursor_factory=self._factories[factory],
+                              **kwargs)
+
+
+def query_nodes(network, n, rnd):
+    """n nodes next to distinct random vertices of network, so they snap to
+    them.
+    """
+    vertices = rnd.sample(range(len(network.lons)), n)
+    return [PgrNode(None,
+                    float(network.lons[v]) + synthetic.SPACING * 0.01,
+                    float(network.lats[v]) + synthetic.SPACING * 0.01)
+            for v in vertices]
+
+
+def scenarios(m):
+    """(name, setup, call) of the timed calls. setup(pgr, nodes) returns the
+    argument of call(pgr, argument), and is not timed. nodes holds 2 * m
+    nodes.
+    """
+    def nodes_of(pgr, nodes):
+        return nodes
+
+    def routes_of(pgr, nodes):
+        return pgr.get_routes(nodes[:m], nodes[m:])
+
+    return [
+        ('find_nearest_vertices', nodes_of,
+         lambda pgr, nodes: pgr.find_nearest_vertices(nodes)),
+        ('get_costs one-to-one', nodes_of,
+         lambda pgr, nodes: pgr.get_costs(nodes[0], nodes[1])),
+        ('get_costs many-to-one', nodes_of,
+         lambda pgr, nodes: pgr.get_costs(nodes[:m], nodes[m])),
+        ('get_costs many-to-many', nodes_of,
+         lambda pgr, nodes: pgr.get_costs(nodes[:m], nodes[m:])),
+        ('get_routes one-to-one', nodes_of,
+         lambda pgr, nodes: pgr.get_routes(nodes[0], nodes[1])),
+        ('get_routes many-to-one', nodes_of,
+         lambda pgr, nodes: pgr.get_routes(nodes[:m], nodes[m])),
+        ('get_routes many-to-many', nodes_of,
+         lambda pgr, nodes: pgr.get_routes(nodes[:m], nodes[m:])),
+        ('get_gpx many-to-many', routes_of,
+         lambda pgr, routes: pgr.get_gpx(routes)),
+    ]
+
+
+def percentiles(latencies):
+    latencies = np.array(latencies) * 1e3
+    return {'mean': float(latencies.mean()),
+            'min': float(latencies.min()),
+            'p50': float(np.percentile(latencies, 50)),
+            'p90': float(np.percentile(latencies, 90)),
+            'p99': float(np.percentile(latencies, 99)),
+            'max': float(latencies.max())}
+
+
+def peak_alloc_kb(call, pgr, argument):
+    """Peak memory in KB allocated by call(pgr, argument), traced by
+    tracemalloc in an untimed run, as the peak RSS of the process would
+    carry over from earlier calls.
+    """
+    tracemalloc.start()
+    try:
+        baseline, _ = tracemalloc.get_traced_memory()
+        call(pgr, argument)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return (peak - baseline) / 1024
+
+
+def run(pgr, network, repeat, m, seed=0):
+    """Time all scenarios on network, which pgr routes on.
+
+    Returns:
+        list of result dicts, one per scenario.
+    """
+    rnd = random.Random(seed)
+    node_sets = [query_nodes(network, 2 * m, rnd) for _ in range(repeat)]
+    results = []
+    for name, setup, call in scenarios(m):
+        latencies = []
+        round_trips = []
+        for nodes in node_sets:
+            argument = setup(pgr, nodes)
+            executes = pgr._conn.executes
+            t0 = time.perf_counter()
+            call(pgr, argument)
+            latencies.append(time.perf_counter() - t0)
+            round_trips.append(pgr._conn.executes - executes)
+        results.append({
+            'call': name,
+            'repeat': repeat,
+            'latency_ms': percentiles(latencies),
+            'round_trips': float(np.mean(round_trips)),
+            'peak_alloc_kb': peak_alloc_kb(
+                call, pgr, setup(pgr, node_sets[0])),
+        })
+    return results
+
+
+def server_info(conn):
+    info = {'server_version': conn.server_version}
+    with conn.cursor() as cur:
+        for key, query in (('postgis', 'SELECT postgis_lib_version()'),
+                           ('pgrouting', 'SELECT pgr_version()')):
+            try:
+                cur.execute(query)
+                info[key] = str(cur.fetchone()[0])
+            except psycopg2.Error:
+                conn.rollback()
+                info[key] = None
+    return info
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--kinds', default='grid,planar,scale_free',
+                        help='comma separated network kinds of '
+                             'synthetic.GENERATORS')
+    parser.add_argument('--sizes', default='1000,10000,100000',
+                        help='comma separated numbers of vertices')
+    parser.add_argument('--repeat', type=int, default=20,
+                        help='calls timed per scenario')
+    parser.add_argument('--nodes', type=int, default=10,
+                        help='start and end nodes of many-to-* calls')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--skip-load', action='store_true',
+                        help='reuse the tables loaded by a previous run')
+    parser.add_argument('--output', default='-',
+                        help='JSON file of the results, - for stdout')
+    args = parser.parse_args(argv)
+
+    pgr = PGRouting(dsn(), connection_factory=CountingConnection)
+    report = {
+        'started': datetime.datetime.now().isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'server': server_info(pgr._conn),
+        'args': vars(args),
+        'results': [],
+    }
+    for kind in args.kinds.split(','):
+        for size in (int(size) for size in args.sizes.split(',')):
+            network = synthetic.GENERATORS[kind](size, seed=args.seed)
+            table = 'bench_{}_{}'.format(kind, size)
+            load_s = None
+            if not args.skip_load:
+                t0 = time.perf_counter()
+                synthetic.load(pgr._conn, network, table, seed=args.seed)
+                load_s = time.perf_counter() - t0
+            pgr.set_meta_data(table=table)
+            print('{} {}: {} vertices, {} edges'.format(
+                kind, size, len(network.lons), len(network.sources)),
+                file=sys.stderr)
+            for result in run(pgr, network, args.repeat, args.nodes,
+                              args.seed):
+                result.update({'network': kind, 'size': size,
+                               'vertices': len(network.lons),
+                               'edges': len(network.sources),
+                               'load_s': load_s})
+                report['results'].append(result)
+
+    output = json.dumps(report, indent=2)
+    if args.output == '-':
+        print(output)
+    else:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+
+
+if __name__ == '__main__':
+    main()
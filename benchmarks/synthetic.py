@@ -0,0 +1,185 @@
+"""Synthetic road networks for the benchmarks.
+
+Networks are loaded into an edge table and a vertex table shaped like those
+of osm2pgrouting (see the default meta data of PGRouting), so PGRouting
+routes on them after set_meta_data(table=...).
+"""
+from collections import namedtuple
+import io
+import math
+import random
+
+import numpy as np
+import psycopg2.sql as sql
+
+from psycopgr.geo import haversine
+
+# Vertex coordinates, and edges as arrays of source and target indices into
+# them. oneway marks edges that cannot be traversed from target to source.
+Network = namedtuple('Network',
+                     ['lons', 'lats', 'sources', 'targets', 'oneway'])
+
+ORIGIN = (116.30, 39.90)
+SPACING = 0.001  # degrees between neighboring vertices, about 100 m
+SPEEDS = (30.0, 50.0, 80.0)  # km/h of road classes
+
+
+def _network(lons, lats, edges, oneway):
+    edges = np.array(edges, dtype=np.int64).reshape(-1, 2)
+    return Network(np.asarray(lons), np.asarray(lats), edges[:, 0],
+                   edges[:, 1], np.asarray(oneway, dtype=bool))
+
+
+def _grid_edges(side, rnd, keep=1.0):
+    """Edges to the right and upper neighbors on a side x side grid."""
+    edges = []
+    for i in range(side):
+        for j in range(side):
+            v = i * side + j
+            if j + 1 < side and rnd.random() < keep:
+                edges.append((v, v + 1))
+            if i + 1 < side and rnd.random() < keep:
+                edges.append((v, v + side))
+    return edges
+
+
+def grid(n, seed=0):
+    """Regular grid of about n vertices with two-way streets."""
+    rnd = random.Random(seed)
+    side = int(math.ceil(math.sqrt(n)))
+    j, i = np.meshgrid(np.arange(side), np.arange(side))
+    edges = _grid_edges(side, rnd)
+    return _network(ORIGIN[0] + j.ravel() * SPACING,
+                    ORIGIN[1] + i.ravel() * SPACING,
+                    edges, [False] * len(edges))
+
+
+def planar(n, seed=0, oneway=0.3):
+    """Random planar network of about n vertices: a jittered grid with a
+    diagonal across half of the cells. Diagonals are one-way with
+    probability oneway, grid streets are two-way so that every vertex
+    reaches every other.
+    """
+    rnd = random.Random(seed)
+    side = int(math.ceil(math.sqrt(n)))
+    j, i = np.meshgrid(np.arange(side), np.arange(side))
+    jitter = np.array([rnd.uniform(-0.3, 0.3)
+                       for _ in range(2 * side * side)])
+    edges = _grid_edges(side, rnd)
+    flags = [False] * len(edges)
+    for a in range(side - 1):
+        for b in range(side - 1):
+            if rnd.random() < 0.5:
+                v = a * side + b
+                diagonal = (v, v + side + 1) if rnd.random() < 0.5 \
+                    else (v + 1, v + side)
+                edges.append(diagonal)
+                flags.append(rnd.random() < oneway)
+    return _network(ORIGIN[0] + (j.ravel() + jitter[::2]) * SPACING,
+                    ORIGIN[1] + (i.ravel() + jitter[1::2]) * SPACING,
+                    edges, flags)
+
+
+def scale_free(n, seed=0, m=2, oneway=0.3):
+    """Scale-free-ish network of n vertices by preferential attachment:
+    each new vertex links to m existing ones picked with probability
+    proportional to their degree, which grows a few hubs. Vertices are
+    scattered uniformly. The first link of each vertex is two-way, the
+    others are one-way with probability oneway.
+    """
+    rnd = random.Random(seed)
+    width = math.sqrt(n) * SPACING
+    lons = [ORIGIN[0] + rnd.uniform(0, width) for _ in range(n)]
+    lats = [ORIGIN[1] + rnd.uniform(0, width) for _ in range(n)]
+    edges = []
+    flags = []
+    ends = [0]  # each vertex once per incident edge
+    for v in range(1, n):
+        targets = []
+        for _ in range(min(m, v)):
+            u = rnd.choice(ends)
+            if u not in targets:
+                targets.append(u)
+        for k, u in enumerate(targets):
+            edges.append((v, u))
+            flags.append(k > 0 and rnd.random() < oneway)
+            ends += [u, v]
+    return _network(lons, lats, edges, flags)
+
+
+GENERATORS = {'grid': grid, 'planar': planar, 'scale_free': scale_free}
+
+
+def load(conn, network, table, seed=0):
+    """Load network into table and table_vertices_pgr, replacing them.
+
+    Edge costs are driving times in second at a random speed of SPEEDS,
+    reverse costs are -1 for one-way edges.
+
+    Args:
+        conn: psycopg2 connection to a database with PostGIS.
+        network: Network.
+        table: name of the edge table.
+        seed: seed of the random speeds.
+    """
+    rng = np.random.default_rng(seed)
+    s, t = network.sources, network.targets
+    x1, y1 = network.lons[s], network.lats[s]
+    x2, y2 = network.lons[t], network.lats[t]
+    lengths = haversine(x1, y1, x2, y2)
+    costs = lengths / (rng.choice(SPEEDS, len(s)) / 3.6)
+    reverse_costs = np.where(network.oneway, -1.0, costs)
+
+    edges = io.StringIO()
+    for k in range(len(s)):
+        edges.write(
+            '{}\t{}\t{}\t{}\t{}\t{}\t{}\t{}\t{}\t{}\t'
+            'SRID=4326;LINESTRING({} {},{} {})\n'.format(
+                k + 1, s[k] + 1, t[k] + 1, costs[k], reverse_costs[k],
+                lengths[k], x1[k], y1[k], x2[k], y2[k],
+                x1[k], y1[k], x2[k], y2[k]))
+    vertices = io.StringIO()
+    for v, (lon, lat) in enumerate(zip(network.lons, network.lats)):
+        vertices.write('{}\t{}\t{}\tSRID=4326;POINT({} {})\n'.format(
+            v + 1, lon, lat, lon, lat))
+    edges.seek(0)
+    vertices.seek(0)
+
+    names = {'table': sql.Identifier(table),
+             'vertex_table': sql.Identifier(table + '_vertices_pgr'),
+             'edge_index': sql.Identifier(table + '_the_geom_idx'),
+             'vertex_index': sql.Identifier(
+                 table + '_vertices_pgr_the_geom_idx')}
+    with conn.cursor() as cur:
+        cur.execute(sql.SQL("""
+            DROP TABLE IF EXISTS {table}, {vertex_table};
+            CREATE TABLE {table} (
+                gid BIGINT PRIMARY KEY,
+                source BIGINT,
+                target BIGINT,
+                cost_s DOUBLE PRECISION,
+                reverse_cost_s DOUBLE PRECISION,
+                length_m DOUBLE PRECISION,
+                x1 DOUBLE PRECISION,
+                y1 DOUBLE PRECISION,
+                x2 DOUBLE PRECISION,
+                y2 DOUBLE PRECISION,
+                the_geom geometry(LineString, 4326));
+            CREATE TABLE {vertex_table} (
+                id BIGINT PRIMARY KEY,
+                lon NUMERIC(11, 8),
+                lat NUMERIC(11, 8),
+                the_geom geometry(Point, 4326));
+            """).format(**names))
+        cur.copy_expert(sql.SQL('COPY {table} FROM STDIN').format(
+            **names).as_string(conn), edges)
+        cur.copy_expert(sql.SQL('COPY {vertex_table} FROM STDIN').format(
+            **names).as_string(conn), vertices)
+        cur.execute(sql.SQL("""
+            CREATE INDEX {edge_index} ON {table} USING GIST (the_geom);
+            CREATE INDEX {vertex_index} ON {vertex_table}
+                USING GIST (the_geom);
+            ANALYZE {table};
+            ANALYZE {vertex_table};
+            """).format(**names))
+    conn.commit()
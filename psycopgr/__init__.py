@@ -1,7 +1,10 @@
-from .psycopgr import PgrNode, PGRouting
+from .psycopgr import CostMatrix, Isochrone, PgrNode, PGRouting
+from .aio import AsyncPGRouting
+from .cache import DiskCache, LRUCache
+from .changes import ChangeFeed
+from .stats import Profiler
+from .tiling import Tiling
 
-__all__ = ["PgrNode", "PGRouting"]
-__title__ = 'psycopgr'
-__description__ = 'Routing on real map for humans'
-__url__ = 'https://github.com/herrkaefer/psycopgr'
-__copyright__ = 'Copyright 2016-2019 Yang Liu'
+__all__ = ["PgrNode", "PGRouting", "AsyncPGRouting", "ChangeFeed",
+           "CostMatrix", "DiskCache", "Isochrone", "LRUCache", "Profiler",
+           "Tiling"]
@@ -0,0 +1,324 @@
+"""Native asyncio client of pgRouting, built on psycopg 3."""
+import asyncio
+from typing import List
+
+try:
+    import psycopg
+    import psycopg.sql
+    from psycopg.rows import dict_row
+    from psycopg_pool import AsyncConnectionPool
+except ImportError:  # optional dependency, see AsyncPGRouting
+    psycopg = None
+
+from . import queries
+from .cache import fingerprint
+from .psycopgr import (PgrNode, PGRouting, _all_pairs_nodes, _astar_output,
+                       _bbox_margins, _dijkstra_cost_output,
+                       _dijkstra_output,
+                       _nearest_vertices_output, _node_distances_args,
+                       _node_distances_local, _pair_costs, _pair_routings,
+                       _snap_output, _unique_vids)
+
+
+class AsyncPGRouting(object):
+    """asyncio counterpart of PGRouting with the same methods as coroutines.
+
+    Queries run on a psycopg 3 async connection pool. Independent
+    sub-queries (snapping chunks) are issued concurrently, with at most
+    max_concurrency of them in flight. psycopg 3 prepares queries executed
+    repeatedly on a connection by itself (see its prepare_threshold).
+
+    Usage:
+        async with AsyncPGRouting('dbname=mydb user=user') as pgr:
+            costs = await pgr.get_costs(nodes, nodes)
+    """
+    # SQL templates, meta data and its setter are shared with PGRouting
+    _meta_data = PGRouting._meta_data
+    _cache = None
+    _bbox = None
+    _profiler = None  # not instrumented, see PGRouting.set_profiler
+    _compact_paths = False
+    _edge_geometry = False
+    set_meta_data = PGRouting.set_meta_data
+    set_bbox = PGRouting.set_bbox
+    set_compact_paths = PGRouting.set_compact_paths
+    set_edge_geometry = PGRouting.set_edge_geometry
+    _geometry_variant = PGRouting._geometry_variant
+    get_gpx = PGRouting.get_gpx
+    write_routes = PGRouting.write_routes
+
+    def __init__(self, conninfo='', min_size=1, max_size=4, timeout=30.0,
+                 max_concurrency=None, **kwargs):
+        """
+        Args:
+            conninfo: connection string that psycopg accepts.
+            min_size, max_size: bounds of the number of pooled connections.
+            timeout: seconds to wait for a free connection.
+            max_concurrency: max number of queries in flight issued by one
+                call (default max_size).
+            kwargs: connection arguments that psycopg accepts.
+
+        Ref: https://www.psycopg.org/psycopg3/docs/api/pool.html
+        """
+        if psycopg is None:
+            raise ImportError("AsyncPGRouting requires psycopg 3: "
+                              "pip install psycopgr[async]")
+        kwargs['row_factory'] = dict_row
+        self._pool = AsyncConnectionPool(
+            conninfo, min_size=min_size, max_size=max_size, timeout=timeout,
+            kwargs=kwargs, open=False)
+        self._max_concurrency = max_concurrency or max_size
+        # compiled SQL by meta data fingerprint, then by template name
+        self._statements = {}
+
+    async def open(self):
+        await self._pool.open()
+
+    async def close(self):
+        await self._pool.close()
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    def _statement(self, name, conn):
+        """SQL of template name compiled for the current meta data."""
+        fp = fingerprint(self._meta_data)
+        statements = self._statements.setdefault(fp, {})
+        if name not in statements:
+            statements[name] = queries.compile_statement(
+                name, self._meta_data, 'psycopgr_' + fp, conn, psycopg.sql)
+        return statements[name]
+
+    async def _fetchall(self, name, args, bbox=None):
+        """Execute template name and fetch all result rows.
+
+        See PGRouting._execute for bbox.
+        """
+        async with self._pool.connection() as conn:
+            statement = self._statement(name, conn)
+            if statement.edges is not None:
+                edges_sql = statement.edges
+                if bbox is not None:
+                    edges_sql = queries.TEMPLATES[name].edges(
+                        self._meta_data, psycopg.sql, queries.bbox(
+                            self._meta_data, *bbox, psycopg.sql)
+                    ).as_string(conn)
+                args = (edges_sql,) + tuple(args)
+            async with conn.cursor() as cur:
+                await cur.execute(statement.query, args)
+                return await cur.fetchall()
+
+    async def _gather(self, coros):
+        """Await coroutines concurrently, at most max_concurrency at a time,
+        and return their results in order.
+        """
+        semaphore = asyncio.Semaphore(self._max_concurrency)
+
+        async def bounded(coro):
+            async with semaphore:
+                return await coro
+
+        return await asyncio.gather(*(bounded(coro) for coro in coros))
+
+    async def _restricted(self, query, start_vids, end_vids):
+        """Results of query between vertices with edges restricted as set
+        by set_bbox. See PGRouting._restricted, query is a coroutine
+        function here.
+        """
+        if self._bbox is None:
+            return await query(start_vids, end_vids, None)
+
+        output = {}
+        pairs = {(start_vid, end_vid) for start_vid in start_vids
+                 for end_vid in end_vids if start_vid != end_vid}
+        for margin in _bbox_margins(self._bbox):
+            if not pairs:
+                break
+            starts = list({pair[0] for pair in pairs})
+            ends = list({pair[1] for pair in pairs})
+            bbox = None if margin is None else (starts + ends, margin)
+            output.update(await query(starts, ends, bbox))
+            pairs -= output.keys()
+        return output
+
+    async def find_nearest_vertices(self, nodes: List[PgrNode],
+                                    chunk_size: int = 1000) -> List[PgrNode]:
+        """Find nearest vertex of nodes on the way. Chunks are snapped
+        concurrently.
+
+        Args:
+            nodes: list of PgrNode.
+            chunk_size: max number of nodes snapped per query.
+
+        Returns:
+            list of PgrNode, in the same order as nodes.
+        """
+        chunks = [nodes[i:i+chunk_size]
+                  for i in range(0, len(nodes), chunk_size)]
+        try:
+            results = await self._gather(
+                self._fetchall('nearest_vertices',
+                               ([node.lon for node in chunk],
+                                [node.lat for node in chunk]))
+                for chunk in chunks)
+        except psycopg.Error as e:
+            print(e)
+            return None
+
+        output = []
+        for chunk, chunk_results in zip(chunks, results):
+            output += _nearest_vertices_output(chunk, chunk_results)
+        return output
+
+    async def node_distances(self, nodes1: List[PgrNode],
+                             nodes2: List[PgrNode],
+                             backend: str = 'local') -> List[float]:
+        """Get great-circle distances between nodes pairwise (unit: m).
+
+        See PGRouting.node_distances.
+        """
+        if len(nodes1) != len(nodes2):
+            raise ValueError("node_distances: lengths of nodes differ")
+
+        if backend == 'local':
+            return _node_distances_local(nodes1, nodes2)
+        if backend != 'db':
+            raise ValueError("node_distances: invalid backend {}".format(
+                             backend))
+
+        try:
+            results = await self._fetchall(
+                'node_distances', _node_distances_args(nodes1, nodes2))
+            return [r['distance'] for r in results]
+        except psycopg.Error as e:
+            print(e)
+            return None
+
+    async def dijkstra_cost(self, start_vids, end_vids):
+        """Get all-pairs costs among way nodes without paths using
+        pgr_dijkstraCost function.
+        """
+        async def query(starts, ends, bbox):
+            return _dijkstra_cost_output(await self._fetchall(
+                'dijkstra_cost', (starts, ends), bbox))
+
+        try:
+            return await self._restricted(query, start_vids, end_vids)
+        except psycopg.Error as e:
+            print(e)
+            return {}
+
+    async def dijkstra(self, start_vids, end_vids):
+        """Get all-pairs shortest paths with costs among way nodes using
+        pgr_dijkstra function.
+        """
+        async def query(starts, ends, bbox):
+            return _dijkstra_output(await self._fetchall(
+                self._geometry_variant('dijkstra'), (starts, ends), bbox),
+                self._compact_paths, self._edge_geometry)
+
+        try:
+            return await self._restricted(query, start_vids, end_vids)
+        except psycopg.Error as e:
+            print(e)
+            return {}
+
+    async def astar(self, start_vid, end_vid):
+        """Get one-to-one shortest path between way nodes using pgr_AStar
+        function.
+        """
+        async def query(starts, ends, bbox):
+            return _astar_output(await self._fetchall(
+                self._geometry_variant('astar'), (start_vid, end_vid), bbox),
+                (start_vid, end_vid), self._compact_paths,
+                self._edge_geometry)
+
+        try:
+            return await self._restricted(query, [start_vid], [end_vid])
+        except psycopg.Error as e:
+            print(e)
+            return {}
+
+    async def _snap_nodes(self, nodes, end_speed=10.0):
+        vertices = await self.find_nearest_vertices(nodes)
+        distances = await self.node_distances(nodes, vertices)
+        return _snap_output(nodes, vertices, distances, end_speed)
+
+    async def _get_one_to_one_routing(self, start_node, end_node,
+                                      end_speed=10.0):
+        if start_node == end_node:
+            return {}
+
+        node_vertex = await self._snap_nodes([start_node, end_node],
+                                             end_speed)
+        main_routing = await self.astar(node_vertex[start_node]['vertex'].id,
+                                        node_vertex[end_node]['vertex'].id)
+        return _pair_routings([start_node], [end_node], node_vertex,
+                              main_routing, self._compact_paths,
+                              self._edge_geometry)
+
+    async def _get_all_pairs_routings(self, start_nodes, end_nodes=None,
+                                      end_speed=10.0):
+        node_list, end_nodes = _all_pairs_nodes(start_nodes, end_nodes)
+        node_vertex = await self._snap_nodes(node_list, end_speed)
+        main_routings = await self.dijkstra(
+            _unique_vids(start_nodes, node_vertex),
+            _unique_vids(end_nodes, node_vertex))
+        return _pair_routings(start_nodes, end_nodes, node_vertex,
+                              main_routings, self._compact_paths,
+                              self._edge_geometry)
+
+    async def _get_all_pairs_costs(self, start_nodes, end_nodes=None,
+                                   end_speed=10.0):
+        node_list, end_nodes = _all_pairs_nodes(start_nodes, end_nodes)
+        node_vertex = await self._snap_nodes(node_list, end_speed)
+        main_costs = await self.dijkstra_cost(
+            _unique_vids(start_nodes, node_vertex),
+            _unique_vids(end_nodes, node_vertex))
+        return _pair_costs(start_nodes, end_nodes, node_vertex, main_costs)
+
+    async def get_routes(self, start_nodes, end_nodes, end_speed=10.0,
+                         gpx_file=None):
+        """Get shortest paths from nodes to nodes. See PGRouting.get_routes.
+        """
+        if not isinstance(start_nodes, list):
+            start_nodes = [start_nodes]
+        if not isinstance(end_nodes, list):
+            end_nodes = [end_nodes]
+
+        # one-to-one
+        if len(start_nodes) == 1 and len(end_nodes) == 1:
+            routes = await self._get_one_to_one_routing(
+                start_nodes[0], end_nodes[0], end_speed)
+
+        # many-to-one, one-to-many or many-to-many
+        else:
+            routes = await self._get_all_pairs_routings(
+                start_nodes, end_nodes, end_speed)
+
+        if gpx_file is not None:
+            self.get_gpx(routes, gpx_file)
+
+        return routes
+
+    async def get_costs(self, start_nodes, end_nodes, end_speed=10.0):
+        """Get costs from nodes to nodes without paths. See
+        PGRouting.get_costs.
+        """
+        if not isinstance(start_nodes, list):
+            start_nodes = [start_nodes]
+        if not isinstance(end_nodes, list):
+            end_nodes = [end_nodes]
+
+        # one-to-one
+        if len(start_nodes) == 1 and len(end_nodes) == 1:
+            routing = await self._get_one_to_one_routing(
+                start_nodes[0], end_nodes[0], end_speed)
+            return {k: v['cost'] for k, v in routing.items()}
+
+        return await self._get_all_pairs_costs(start_nodes, end_nodes,
+                                               end_speed)
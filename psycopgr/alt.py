@@ -0,0 +1,258 @@
+"""Bidirectional ALT (A*, Landmarks, Triangle inequality) for fast
+in-process one-to-one routing.
+
+Ref: Goldberg and Harrelson, Computing the Shortest Path: A* Search Meets
+Graph Theory, 2005. Ikeda et al., A Fast Algorithm for Finding Better
+Routes by AI Search Techniques, 1994, for the average potentials that make
+the search in both directions consistent.
+"""
+from heapq import heappop, heappush
+import json
+
+import numpy as np
+
+from .graph import CSR, Graph, paths_output
+
+
+def _table(dist, n):
+    """Column of a distance table from the dict a search returns."""
+    column = np.full(n, np.inf)
+    column[np.fromiter(dist.keys(), np.int64, len(dist))] = np.fromiter(
+        dist.values(), np.float64, len(dist))
+    return column
+
+
+class ALT(object):
+    """Graph with the distance tables of a few landmarks.
+
+    from_landmarks[v, k] is the cost from landmark k to vertex v, and
+    to_landmarks[v, k] the cost from v to landmark k. By the triangle
+    inequality they bound the cost between any two vertices from below,
+    which guides an A* search from both ends. Costs of vertices a landmark
+    does not reach, or is not reached from, are clamped to a finite bound,
+    which keeps the bounds valid.
+
+    The tables are computed on the weights of the graph at build time. They
+    remain valid if weights increase but not if they decrease, so ALT must
+    be built again after costs drop.
+    """
+
+    def __init__(self, graph, landmarks, from_landmarks, to_landmarks,
+                 meta_data=None, active=4):
+        """
+        Args:
+            graph: Graph.
+            landmarks: array of the vertex indices of the landmarks.
+            from_landmarks, to_landmarks: float64 arrays of shape
+                (num_vertices, num_landmarks).
+            meta_data: meta data of the edge table the graph is loaded from,
+                saved with the tables to detect a stale file.
+            active: number of landmarks used by a query, those giving the
+                best bound between its start and end vertices.
+        """
+        self.graph = graph
+        self.landmarks = landmarks
+        self.from_landmarks = from_landmarks
+        self.to_landmarks = to_landmarks
+        self.meta_data = meta_data
+        self.active = active
+
+    @classmethod
+    def build(cls, graph, num_landmarks=16, meta_data=None, active=4):
+        """Select landmarks and compute their distance tables.
+
+        Each landmark is the vertex farthest from those picked before (the
+        first one, farthest from vertex 0), so landmarks lie around the
+        border of the network, where they give the tightest bounds. Each
+        takes a search of the whole graph in both directions, and 16 bytes
+        per vertex.
+
+        Args:
+            graph: Graph to preprocess.
+            num_landmarks: number of landmarks.
+            meta_data, active: see ALT.
+        """
+        n = graph.num_vertices
+        k = min(num_landmarks, n)
+        from_landmarks = np.full((n, k), np.inf)
+        to_landmarks = np.full((n, k), np.inf)
+        landmarks = np.zeros(k, dtype=np.int64)
+        if k:
+            farthest = _table(graph.forward.search(0)[0], n)
+            nearest = np.full(n, np.inf)  # from any landmark picked so far
+        for j in range(k):
+            farthest[~np.isfinite(farthest)] = -1.0
+            landmarks[j] = int(np.argmax(farthest))
+            from_landmarks[:, j] = _table(
+                graph.forward.search(int(landmarks[j]))[0], n)
+            to_landmarks[:, j] = _table(
+                graph.backward.search(int(landmarks[j]))[0], n)
+            nearest = np.minimum(nearest, np.minimum(from_landmarks[:, j],
+                                                     to_landmarks[:, j]))
+            farthest = nearest.copy()
+
+        # min(cost, bound) satisfies the triangle inequality as the costs do
+        finite = np.isfinite(from_landmarks) & np.isfinite(to_landmarks)
+        bound = 2.0 * max(from_landmarks[finite].max(initial=0.0),
+                          to_landmarks[finite].max(initial=0.0)) + 1.0
+        np.minimum(from_landmarks, bound, out=from_landmarks)
+        np.minimum(to_landmarks, bound, out=to_landmarks)
+        return cls(graph, landmarks, from_landmarks, to_landmarks, meta_data,
+                   active)
+
+    def save(self, file):
+        """Save to a .npz file."""
+        forward = self.graph.forward
+        np.savez(file, vids=self.graph.vids, lons=self.graph.lons,
+                 lats=self.graph.lats, offsets=forward.offsets,
+                 heads=forward.heads, tails=forward.tails,
+                 weights=forward.weights, edges=forward.edges,
+                 landmarks=self.landmarks,
+                 from_landmarks=self.from_landmarks,
+                 to_landmarks=self.to_landmarks,
+                 meta_data=json.dumps(self.meta_data, sort_keys=True))
+
+    @classmethod
+    def load(cls, file, active=4):
+        """Load from a .npz file written by save."""
+        with np.load(file) as data:
+            forward = CSR(data['offsets'], data['heads'], data['tails'],
+                          data['weights'], data['edges'])
+            graph = Graph(data['vids'], forward, lons=data['lons'],
+                          lats=data['lats'])
+            return cls(graph, data['landmarks'], data['from_landmarks'],
+                       data['to_landmarks'],
+                       json.loads(str(data['meta_data'])), active)
+
+    @property
+    def num_vertices(self):
+        return self.graph.num_vertices
+
+    def nbytes(self):
+        """Memory held by the landmark tables."""
+        return (self.landmarks.nbytes + self.from_landmarks.nbytes
+                + self.to_landmarks.nbytes)
+
+    def _potential(self, source, target):
+        """Function of vertex index v giving the forward potential of the
+        search from source to target, (pi_t(v) - pi_s(v)) / 2, where pi_t
+        bounds the cost from v to target and pi_s the cost from source to
+        v. The backward search uses its opposite.
+        """
+        F, T = self.from_landmarks, self.to_landmarks
+        # landmarks giving the best bounds between source and target
+        scores = np.maximum(T[source] - T[target], F[target] - F[source])
+        active = np.argsort(-scores)[:self.active].tolist()
+        # scalar access: numpy calls on rows of 4 values cost 10x more
+        F_item, T_item = F.item, T.item
+        ends = [(k, F_item(source, k), T_item(source, k),
+                 F_item(target, k), T_item(target, k)) for k in active]
+        potentials = {}
+
+        def potential(v):
+            p = potentials.get(v)
+            if p is None:
+                to_target = from_source = 0.0
+                for k, F_s, T_s, F_t, T_t in ends:
+                    F_v, T_v = F_item(v, k), T_item(v, k)
+                    to_target = max(to_target, T_v - T_t, F_t - F_v)
+                    from_source = max(from_source, F_v - F_s, T_s - T_v)
+                p = potentials[v] = (to_target - from_source) / 2.0
+            return p
+        return potential
+
+    def _search(self, source, target):
+        """Bidirectional A* search between vertex indices.
+
+        Returns:
+            (cost, list of vertex indices of the path), or None if target is
+            not reachable.
+        """
+        potential = self._potential(source, target)
+        csrs = (self.graph.forward, self.graph.backward)
+        lists = [csr.lists() for csr in csrs]
+        signs = (1.0, -1.0)
+        dists = ({source: 0.0}, {target: 0.0})
+        preds = ({source: -1}, {target: -1})
+        heaps = ([(potential(source), 0.0, source)],
+                 [(-potential(target), 0.0, target)])
+        best = float('inf')
+        meet = None
+        while heaps[0] and heaps[1]:
+            # keys of the two searches add up to the cost of a path
+            if heaps[0][0][0] + heaps[1][0][0] >= best:
+                break
+            side = 0 if heaps[0][0][0] <= heaps[1][0][0] else 1
+            _, d, u = heappop(heaps[side])
+            dist, other = dists[side], dists[1 - side]
+            if d > dist[u]:
+                continue  # stale entry
+            offsets, heads, weights = lists[side]
+            for i in range(offsets[u], offsets[u + 1]):
+                v = heads[i]
+                nd = d + weights[i]
+                if v in other and nd + other[v] < best:
+                    # the best path so far takes the arc from u to v
+                    best = nd + other[v]
+                    meet = (u, v) if side == 0 else (v, u)
+                if nd < dist.get(v, float('inf')):
+                    dist[v] = nd
+                    preds[side][v] = i
+                    heappush(heaps[side], (nd + signs[side] * potential(v),
+                                           nd, v))
+        if meet is None:
+            return None
+
+        forward, backward = csrs
+        tail, head = meet
+        path = [source] + forward.heads[
+            forward.unpack(preds[0], tail)].tolist()
+        if head != tail:
+            path.append(head)
+        i = preds[1][head]
+        while i >= 0:
+            v = int(backward.tails[i])
+            path.append(v)
+            i = preds[1][v]
+        return best, path
+
+    def _pairs(self, start_vids, end_vids):
+        """dict mapping (start_vid, end_vid) to (cost, path) with a search
+        per pair. Pairs of the same vertex and unreachable pairs are left
+        out.
+        """
+        output = {}
+        for start_vid in dict.fromkeys(start_vids):
+            source = self.graph.index(start_vid)
+            if source is None:
+                continue
+            for end_vid in dict.fromkeys(end_vids):
+                target = self.graph.index(end_vid)
+                if target is None or target == source:
+                    continue
+                result = self._search(source, target)
+                if result is not None:
+                    output[(start_vid, end_vid)] = result
+        return output
+
+    def dijkstra_cost(self, start_vids, end_vids):
+        """Get costs among vertices, in the same format as
+        PGRouting.dijkstra_cost, with a search per pair.
+        """
+        return {key: cost for key, (cost, _) in
+                self._pairs(start_vids, end_vids).items()}
+
+    def dijkstra(self, start_vids, end_vids, compact=False):
+        """Get shortest paths with costs among vertices, in the same format
+        as PGRouting.dijkstra, with a search per pair. See
+        graph.paths_output for compact.
+        """
+        return paths_output(self.graph.vids, self.graph.lons,
+                            self.graph.lats,
+                            self._pairs(start_vids, end_vids), compact)
+
+    def astar(self, start_vid, end_vid, compact=False):
+        """Get the shortest path between two vertices, in the same format as
+        PGRouting.astar.
+        """
+        return self.dijkstra([start_vid], [end_vid], compact)
@@ -0,0 +1,277 @@
+"""Caches of routing results between vertices.
+
+Keys are tuples (fingerprint, kind, start_vid, end_vid), where fingerprint
+identifies the meta data the result was computed with, and kind is 'cost'
+or the kind of routes, e.g. 'route_geometry_compact', see
+PGRouting._route_kind. Both backends count hits, misses and evictions, and
+can drop all entries of one fingerprint, or some of them as
+changes.ChangeFeed does. The results of a query are looked up and stored
+with get_many and set_many, which DiskCache runs in one transaction each.
+"""
+import ast
+from collections import OrderedDict
+from contextlib import contextmanager
+import hashlib
+import json
+import pickle
+import sqlite3
+import threading
+import time
+
+# max number of parameters of a statement in SQLite before 3.32
+_SQLITE_MAX_VARIABLES = 999
+
+
+def fingerprint(meta_data):
+    """Short stable hash of meta data."""
+    return hashlib.sha1(
+        json.dumps(meta_data, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+
+
+class LRUCache(object):
+    """Thread-safe in-memory cache evicting the least recently used entries.
+    """
+
+    def __init__(self, maxsize=1000000, ttl=None):
+        """
+        Args:
+            maxsize: max number of entries.
+            ttl: seconds an entry stays valid, None for no expiry.
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()  # key -> (expires, value)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and item[0] is not None \
+                    and item[0] < time.monotonic():
+                del self._data[key]
+                self.evictions += 1
+                item = None
+            if item is None:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[1]
+
+    def get_many(self, keys):
+        """dict mapping the keys found in cache to their values."""
+        with self._lock:
+            now = time.monotonic()
+            output = {}
+            for key in keys:
+                item = self._data.get(key)
+                if item is not None and item[0] is not None \
+                        and item[0] < now:
+                    del self._data[key]
+                    self.evictions += 1
+                    item = None
+                if item is None:
+                    self.misses += 1
+                    continue
+                self._data.move_to_end(key)
+                self.hits += 1
+                output[key] = item[1]
+            return output
+
+    def set(self, key, value):
+        self.set_many([(key, value)])
+
+    def set_many(self, items):
+        """Set the (key, value) of items."""
+        expires = None if self.ttl is None else time.monotonic() + self.ttl
+        with self._lock:
+            for key, value in items:
+                self._data[key] = (expires, value)
+                self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, fingerprint):
+        """Drop all entries computed with meta data of fingerprint."""
+        with self._lock:
+            for key in [k for k in self._data if k[0] == fingerprint]:
+                del self._data[key]
+
+    def items(self, fingerprint):
+        """List of (key, value) of the entries of fingerprint."""
+        with self._lock:
+            return [(key, item[1]) for key, item in self._data.items()
+                    if key[0] == fingerprint]
+
+    def delete(self, keys):
+        """Drop the entries of keys."""
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        return {'size': len(self._data), 'hits': self.hits,
+                'misses': self.misses, 'evictions': self.evictions}
+
+
+class DiskCache(object):
+    """Cache in a SQLite file, which survives restarts and can be shared by
+    processes. When it is full, the oldest entries are evicted first, a
+    tenth of maxsize at a time so that evictions are rare.
+    """
+
+    def __init__(self, path, maxsize=None, ttl=None):
+        """
+        Args:
+            path: SQLite database file.
+            maxsize: max number of entries, None for no limit.
+            ttl: seconds an entry stays valid, None for no expiry.
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False,
+                                   isolation_level=None)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS psycopgr_cache (
+                key TEXT PRIMARY KEY,
+                fingerprint TEXT NOT NULL,
+                created REAL NOT NULL,
+                value BLOB NOT NULL)""")
+        self._db.execute("""
+            CREATE INDEX IF NOT EXISTS psycopgr_cache_fingerprint
+            ON psycopgr_cache (fingerprint)""")
+        self._db.execute("""
+            CREATE INDEX IF NOT EXISTS psycopgr_cache_created
+            ON psycopgr_cache (created)""")
+        # upper bound of the number of entries, counted again only when it
+        # exceeds maxsize
+        self._size = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute(
+                'SELECT count(*) FROM psycopgr_cache').fetchone()[0]
+
+    def close(self):
+        self._db.close()
+
+    @contextmanager
+    def _transaction(self):
+        self._db.execute('BEGIN')
+        try:
+            yield
+        except BaseException:
+            self._db.execute('ROLLBACK')
+            raise
+        self._db.execute('COMMIT')
+
+    def get(self, key, default=None):
+        return self.get_many([key]).get(key, default)
+
+    def get_many(self, keys):
+        """dict mapping the keys found in cache to their values, looked up
+        in one transaction.
+        """
+        names = {repr(key): key for key in keys}
+        rows = []
+        with self._lock, self._transaction():
+            batch = list(names)
+            for i in range(0, len(batch), _SQLITE_MAX_VARIABLES):
+                chunk = batch[i:i+_SQLITE_MAX_VARIABLES]
+                rows += self._db.execute(
+                    'SELECT key, created, value FROM psycopgr_cache '
+                    'WHERE key IN ({})'.format(','.join('?' * len(chunk))),
+                    chunk).fetchall()
+            if self.ttl is not None:
+                oldest = time.time() - self.ttl
+                expired = [(name,) for name, created, _ in rows
+                           if created < oldest]
+                self._db.executemany(
+                    'DELETE FROM psycopgr_cache WHERE key = ?', expired)
+                self.evictions += len(expired)
+                rows = [row for row in rows if row[1] >= oldest]
+            self.hits += len(rows)
+            self.misses += len(names) - len(rows)
+        return {names[name]: pickle.loads(value) for name, _, value in rows}
+
+    def set(self, key, value):
+        self.set_many([(key, value)])
+
+    def set_many(self, items):
+        """Set the (key, value) of items in one transaction."""
+        now = time.time()
+        rows = [(repr(key), key[0], now, pickle.dumps(value))
+                for key, value in items]
+        with self._lock, self._transaction():
+            self._db.executemany(
+                'INSERT OR REPLACE INTO psycopgr_cache VALUES (?, ?, ?, ?)',
+                rows)
+            if self.maxsize is not None:
+                self._evict(len(rows))
+
+    def _evict(self, inserted):
+        """Evict the oldest entries down to 90% of maxsize once there are
+        more than maxsize.
+        """
+        if self._size is not None:
+            self._size += inserted
+        if self._size is None or self._size > self.maxsize:
+            # entries replaced and those of other processes are counted here
+            self._size = self._db.execute(
+                'SELECT count(*) FROM psycopgr_cache').fetchone()[0]
+        if self._size <= self.maxsize:
+            return
+        evicted = self._db.execute("""
+            DELETE FROM psycopgr_cache WHERE key IN (
+                SELECT key FROM psycopgr_cache ORDER BY created LIMIT ?)""",
+                                   (self._size - self.maxsize * 9 // 10,)
+                                   ).rowcount
+        self._size -= evicted
+        self.evictions += evicted
+
+    def invalidate(self, fingerprint):
+        """Drop all entries computed with meta data of fingerprint."""
+        with self._lock:
+            self._db.execute(
+                'DELETE FROM psycopgr_cache WHERE fingerprint = ?',
+                (fingerprint,))
+
+    def items(self, fingerprint):
+        """List of (key, value) of the entries of fingerprint."""
+        with self._lock:
+            rows = self._db.execute(
+                'SELECT key, value FROM psycopgr_cache WHERE fingerprint = ?',
+                (fingerprint,)).fetchall()
+        return [(ast.literal_eval(key), pickle.loads(value))
+                for key, value in rows]
+
+    def delete(self, keys):
+        """Drop the entries of keys."""
+        with self._lock:
+            self._db.executemany(
+                'DELETE FROM psycopgr_cache WHERE key = ?',
+                [(repr(key),) for key in keys])
+
+    def clear(self):
+        with self._lock:
+            self._db.execute('DELETE FROM psycopgr_cache')
+
+    def stats(self):
+        return {'size': len(self), 'hits': self.hits,
+                'misses': self.misses, 'evictions': self.evictions}
@@ -0,0 +1,271 @@
+"""Contraction Hierarchies (CH) for fast in-process many-to-many routing.
+
+Ref: Geisberger et al., Contraction Hierarchies: Faster and Simpler
+Hierarchical Routing in Road Networks, 2008.
+"""
+from heapq import heapify, heappop, heappush
+import json
+
+import numpy as np
+
+from .graph import CSR, paths_output
+
+
+class ContractionHierarchy(object):
+    """Graph preprocessed by contracting vertices in order of importance.
+
+    Every arc of the hierarchy, original or shortcut, is kept in the arrays
+    tails, heads, weights and mids, where mids is the contracted vertex a
+    shortcut bypasses (-1 for original arcs). Searches only go upwards in
+    rank: the up CSR holds arcs to higher ranked vertices, the down CSR the
+    arcs from higher ranked vertices, reversed.
+    """
+
+    def __init__(self, vids, lons, lats, rank, tails, heads, weights, mids,
+                 meta_data=None):
+        self.vids = vids
+        self.lons = lons
+        self.lats = lats
+        self.rank = rank
+        self.tails = tails
+        self.heads = heads
+        self.weights = weights
+        self.mids = mids
+        self.meta_data = meta_data
+        n = len(vids)
+        arcs = np.arange(len(tails), dtype=np.int64)
+        up = rank[tails] < rank[heads]
+        self.up = CSR.build(n, tails[up], heads[up], weights[up], arcs[up])
+        self.down = CSR.build(n, heads[~up], tails[~up], weights[~up],
+                              arcs[~up])
+        self._arc_index = None
+
+    @classmethod
+    def build(cls, graph, witness_settle_limit=500, meta_data=None):
+        """Contract all vertices of a Graph.
+
+        Args:
+            graph: Graph to preprocess.
+            witness_settle_limit: max number of vertices settled by a witness
+                search. A shortcut is added when no witness path is found
+                within the limit, so a small limit only costs extra
+                shortcuts, never correctness.
+            meta_data: meta data of the edge table the graph is loaded from,
+                saved with the hierarchy to detect a stale file.
+        """
+        n = graph.num_vertices
+        out = [dict() for _ in range(n)]
+        inn = [dict() for _ in range(n)]
+        # all arcs of the hierarchy: (tail, head) -> [weight, mid]
+        arcs = {}
+        fwd = graph.forward
+        for u, v, w in zip(fwd.tails.tolist(), fwd.heads.tolist(),
+                           fwd.weights.tolist()):
+            if u == v or w >= out[u].get(v, float('inf')):
+                continue
+            out[u][v] = w
+            inn[v][u] = w
+            arcs[(u, v)] = [w, -1]
+
+        def witness(source, excluded, max_cost):
+            """Distances from source avoiding excluded, up to max_cost."""
+            dist = {source: 0.0}
+            heap = [(0.0, source)]
+            settled = 0
+            while heap and settled < witness_settle_limit:
+                d, u = heappop(heap)
+                if d > dist[u]:
+                    continue
+                if d > max_cost:
+                    break
+                settled += 1
+                for v, w in out[u].items():
+                    nd = d + w
+                    if v != excluded and nd < dist.get(v, float('inf')):
+                        dist[v] = nd
+                        heappush(heap, (nd, v))
+            return dist
+
+        def shortcuts(x):
+            """Shortcuts (u, v, weight) needed when contracting x."""
+            output = []
+            if not out[x]:
+                return output
+            max_out = max(out[x].values())
+            for u, w_ux in inn[x].items():
+                dist = witness(u, x, w_ux + max_out)
+                for v, w_xv in out[x].items():
+                    if v != u and w_ux + w_xv < dist.get(v, float('inf')):
+                        output.append((u, v, w_ux + w_xv))
+            return output
+
+        contracted_neighbors = [0] * n
+
+        def priority(x):
+            # edge difference plus uniformity term
+            return (len(shortcuts(x)) - len(inn[x]) - len(out[x])
+                    + contracted_neighbors[x])
+
+        heap = [(priority(x), x) for x in range(n)]
+        heapify(heap)
+        rank = np.zeros(n, dtype=np.int64)
+        order = 0
+        while heap:
+            p, x = heappop(heap)
+            # lazy update: re-queue x if its priority got worse
+            p_now = priority(x)
+            if heap and p_now > heap[0][0]:
+                heappush(heap, (p_now, x))
+                continue
+
+            for u, v, w in shortcuts(x):
+                if w < out[u].get(v, float('inf')):
+                    out[u][v] = w
+                    inn[v][u] = w
+                    arcs[(u, v)] = [w, x]
+            for u in inn[x]:
+                del out[u][x]
+                contracted_neighbors[u] += 1
+            for v in out[x]:
+                del inn[v][x]
+                contracted_neighbors[v] += 1
+            out[x] = {}
+            inn[x] = {}
+            rank[x] = order
+            order += 1
+
+        keys = list(arcs.keys())
+        values = list(arcs.values())
+        return cls(graph.vids, graph.lons, graph.lats, rank,
+                   np.array([k[0] for k in keys], dtype=np.int64),
+                   np.array([k[1] for k in keys], dtype=np.int64),
+                   np.array([v[0] for v in values], dtype=np.float64),
+                   np.array([v[1] for v in values], dtype=np.int64),
+                   meta_data)
+
+    def save(self, file):
+        """Save to a .npz file."""
+        np.savez(file, vids=self.vids, lons=self.lons, lats=self.lats,
+                 rank=self.rank, tails=self.tails, heads=self.heads,
+                 weights=self.weights, mids=self.mids,
+                 meta_data=json.dumps(self.meta_data, sort_keys=True))
+
+    @classmethod
+    def load(cls, file):
+        """Load from a .npz file written by save."""
+        with np.load(file) as data:
+            return cls(data['vids'], data['lons'], data['lats'],
+                       data['rank'], data['tails'], data['heads'],
+                       data['weights'], data['mids'],
+                       json.loads(str(data['meta_data'])))
+
+    @property
+    def num_vertices(self):
+        return len(self.vids)
+
+    def nbytes(self):
+        """Memory held by the arrays of the hierarchy."""
+        arrays = [self.vids, self.lons, self.lats, self.rank, self.tails,
+                  self.heads, self.weights, self.mids]
+        for csr in (self.up, self.down):
+            arrays += [csr.offsets, csr.heads, csr.tails, csr.weights,
+                       csr.edges]
+        return sum(a.nbytes for a in arrays)
+
+    def index(self, vid):
+        """Compact index of vertex id, or None if it is not in the graph."""
+        i = int(np.searchsorted(self.vids, vid))
+        if i < len(self.vids) and self.vids[i] == vid:
+            return i
+        return None
+
+    def _unpack_arc(self, arc):
+        """Original vertices after the tail of a hierarchy arc."""
+        if self._arc_index is None:
+            self._arc_index = {
+                (u, v): i for i, (u, v) in enumerate(
+                    zip(self.tails.tolist(), self.heads.tolist()))}
+        output = []
+        stack = [arc]
+        while stack:
+            i = stack.pop()
+            mid = int(self.mids[i])
+            if mid < 0:
+                output.append(int(self.heads[i]))
+            else:
+                stack.append(self._arc_index[(mid, int(self.heads[i]))])
+                stack.append(self._arc_index[(int(self.tails[i]), mid)])
+        return output
+
+    def _path(self, source, meet, target, fwd_pred, bwd_pred):
+        """Vertex indices of the path source -> meet -> target."""
+        arcs = [self.up.edges[i] for i in self.up.unpack(fwd_pred, meet)]
+        i = bwd_pred[meet]
+        while i >= 0:
+            arcs.append(self.down.edges[i])
+            i = bwd_pred[int(self.down.tails[i])]
+        path = [source]
+        for arc in arcs:
+            path += self._unpack_arc(int(arc))
+        return path
+
+    def _many_to_many(self, start_vids, end_vids, with_paths):
+        """Bucket-based many-to-many query.
+
+        One backward upward search per target fills buckets of the vertices
+        it reaches, then one forward upward search per source scans the
+        buckets of the vertices it reaches.
+
+        Returns:
+            dict mapping (start_vid, end_vid) to (cost, path), path is a list
+            of vertex indices or None if with_paths is False.
+        """
+        buckets = {}
+        bwd_preds = {}
+        ends = {}
+        for end_vid in dict.fromkeys(end_vids):
+            target = self.index(end_vid)
+            if target is None:
+                continue
+            ends[end_vid] = target
+            dist, pred = self.down.search(target)
+            if with_paths:
+                bwd_preds[end_vid] = pred
+            for v, d in dist.items():
+                buckets.setdefault(v, []).append((end_vid, d))
+
+        output = {}
+        for start_vid in dict.fromkeys(start_vids):
+            source = self.index(start_vid)
+            if source is None:
+                continue
+            dist, pred = self.up.search(source)
+            best = {}
+            for v, d in dist.items():
+                for end_vid, d_t in buckets.get(v, ()):
+                    if d + d_t < best.get(end_vid, (float('inf'),))[0]:
+                        best[end_vid] = (d + d_t, v)
+            for end_vid, (cost, meet) in best.items():
+                target = ends[end_vid]
+                if target == source:
+                    continue
+                path = self._path(source, meet, target, pred,
+                                  bwd_preds[end_vid]) if with_paths else None
+                output[(start_vid, end_vid)] = (cost, path)
+        return output
+
+    def dijkstra_cost(self, start_vids, end_vids):
+        """Get all-pairs costs among vertices, in the same format as
+        PGRouting.dijkstra_cost.
+        """
+        return {key: cost for key, (cost, _) in
+                self._many_to_many(start_vids, end_vids, False).items()}
+
+    def dijkstra(self, start_vids, end_vids, compact=False):
+        """Get all-pairs shortest paths with costs among vertices, in the
+        same format as PGRouting.dijkstra. See graph.paths_output for
+        compact.
+        """
+        return paths_output(
+            self.vids, self.lons, self.lats,
+            self._many_to_many(start_vids, end_vids, True), compact)
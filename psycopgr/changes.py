@@ -0,0 +1,409 @@
+"""Feed of edge cost changes, applied to in-process graphs and caches.
+
+ChangeFeed.install adds to the edge table a trigger recording each change
+of cost or reverse cost in a delta table, {table}_changes, and notifying a
+channel. A ChangeFeed reads the new rows of the delta table, when notified
+or when polled, and applies them to the PGRouting it is attached to:
+
+- the weights of the arcs of the 'local' graph are set in place. The graph
+  is reloaded only if an edge gains an arc it did not have, e.g. a one-way
+  street opened both ways;
+- the 'ch' Contraction Hierarchies, whose shortcuts depend on all weights,
+  are dropped, and so are the 'alt' landmarks, whose bounds no longer hold
+  once a weight decreases;
+- the cached costs and routes that may have changed are dropped, see
+  _affected. Others are kept.
+
+Changes of the topology (edges inserted or deleted, sources or targets
+updated) are not tracked, call load_graph after them.
+"""
+from heapq import heappop, heappush
+import select
+import time
+
+import numpy as np
+import psycopg2
+import psycopg2.extras
+import psycopg2.sql
+
+from . import queries
+from .cache import fingerprint
+
+# relative tolerance comparing sums of weights to cached costs
+_TOLERANCE = 1e-9
+
+
+def _edge_arcs(source, target, cost, reverse_cost, directed):
+    """(tail, head, weight) of the arcs of an edge, with the semantics of
+    Graph.from_edges.
+    """
+    arcs = [(source, target, cost), (target, source, reverse_cost)]
+    if not directed:
+        arcs += [(head, tail, weight) for tail, head, weight in arcs]
+    return [arc for arc in arcs if arc[2] is not None and arc[2] >= 0]
+
+
+class _ArcIndex(object):
+    """Arcs of a CSR by the id of the edge they come from."""
+
+    def __init__(self, csr):
+        self.order = np.argsort(csr.edges, kind='stable')
+        self.edges = csr.edges[self.order]
+
+    def arcs(self, edge):
+        lo = np.searchsorted(self.edges, edge, side='left')
+        hi = np.searchsorted(self.edges, edge, side='right')
+        return self.order[lo:hi].tolist()
+
+
+def _assignment(csr, arcs, expected, reverse=False):
+    """New weights of the arcs of an edge in csr.
+
+    Parallel arcs are interchangeable, so the expected weights between two
+    vertices are assigned to the existing arcs between them in any order,
+    and arcs left over get np.inf, which no path takes.
+
+    Args:
+        csr: graph.CSR.
+        arcs: indices of the arcs of the edge in csr.
+        expected: (tail, head, weight) of the arcs the edge should have.
+        reverse: csr is a backward CSR, whose arcs are reversed.
+
+    Returns:
+        dict mapping arc index to weight, or None if an expected arc does
+        not exist in csr.
+    """
+    weights = {}
+    for tail, head, weight in expected:
+        weights.setdefault((head, tail) if reverse else (tail, head),
+                           []).append(weight)
+    slots = {}
+    for i in arcs:
+        slots.setdefault((int(csr.tails[i]), int(csr.heads[i])),
+                         []).append(i)
+    if any(len(ws) > len(slots.get(key, ())) for key, ws in weights.items()):
+        return None
+    output = {}
+    for key, indices in slots.items():
+        ws = sorted(weights.get(key, ()))
+        for k, i in enumerate(indices):
+            output[i] = ws[k] if k < len(ws) else np.inf
+    return output
+
+
+def _distances(csr, source, limit, overrides):
+    """Distances of the vertices settled by a Dijkstra search from vertex
+    index source, up to limit, with the weights of arcs in overrides
+    replaced.
+    """
+    offsets, heads, weights = csr.lists()
+    dist = {source: 0.0}
+    settled = {}
+    heap = [(0.0, source)]
+    while heap:
+        d, u = heappop(heap)
+        if u in settled:
+            continue
+        if limit is not None and d > limit:
+            break
+        settled[u] = d
+        for i in range(offsets[u], offsets[u + 1]):
+            v = heads[i]
+            nd = d + overrides.get(i, weights[i])
+            if nd < dist.get(v, float('inf')):
+                dist[v] = nd
+                heappush(heap, (nd, v))
+    return settled
+
+
+def _cached_cost(value):
+    if isinstance(value, dict):
+        return value['cost']
+    if isinstance(value, str):  # PGRouting._UNREACHABLE
+        return float('inf')
+    return value
+
+
+def _affected(graph, entries, forward, backward):
+    """Keys of the cached entries whose cost or route may have changed.
+
+    Distances are searched on the graph whose changed arcs weigh the lower
+    of their old and new weights, which are lower bounds of the distances
+    before and after the change. A pair (s, t) of cost c is affected if for
+    some changed arc u->v of weight w there, d(s, u) + w + d(v, t) <= c:
+    this holds if its old path took a changed arc, or if its new path does
+    and is shorter. Other pairs keep the same cost and path.
+
+    Args:
+        graph: graph.Graph before the change.
+        entries: list of (key, value) of the cache.
+        forward, backward: dicts mapping the changed arcs of graph.forward
+            and graph.backward to their lower weight.
+    """
+    pairs = []
+    keys = []
+    for key, value in entries:
+        s, t = graph.index(key[2]), graph.index(key[3])
+        if s is None or t is None:
+            keys.append(key)
+        else:
+            pairs.append((key, s, t, _cached_cost(value)))
+    if not pairs or not forward:
+        return keys
+
+    costs = [c for _, _, _, c in pairs]
+    limit = max(costs) if np.isfinite(costs).all() else None
+    to_vertex = {}
+    from_vertex = {}
+    for i, w in forward.items():
+        if not np.isfinite(w):
+            continue
+        u, v = int(graph.forward.tails[i]), int(graph.forward.heads[i])
+        if u not in to_vertex:
+            to_vertex[u] = _distances(graph.backward, u, limit, backward)
+        if v not in from_vertex:
+            from_vertex[v] = _distances(graph.forward, v, limit, forward)
+        to_u, from_v = to_vertex[u], from_vertex[v]
+        remaining = []
+        for pair in pairs:
+            key, s, t, c = pair
+            if s in to_u and t in from_v and to_u[s] + w + from_v[t] \
+                    <= c + _TOLERANCE * max(1.0, c):
+                keys.append(key)
+            else:
+                remaining.append(pair)
+        pairs = remaining
+        if not pairs:
+            break
+    return keys
+
+
+def _touched(entries, changes):
+    """Keys of the cached routes whose path takes a changed edge, and of all
+    cached costs, whose paths are not known, when no edge got cheaper.
+    """
+    ends = {frozenset((r['source'], r['target'])) for r in changes}
+    keys = []
+    for key, value in entries:
+        if isinstance(value, str):  # unreachable stays so
+            continue
+        if not isinstance(value, dict):
+            keys.append(key)
+            continue
+        path = value['path']
+        vids = path.ids[path.start:path.stop].tolist() \
+            if hasattr(path, 'ids') else [node.id for node in path]
+        if any(frozenset(pair) in ends for pair in zip(vids, vids[1:])):
+            keys.append(key)
+    return keys
+
+
+def _decreased(r):
+    """Whether a change made an edge cheaper, or traversable in a new
+    direction, which may shorten any path.
+    """
+    for old, new in ((r['old_cost'], r['cost']),
+                     (r['old_reverse_cost'], r['reverse_cost'])):
+        if new is not None and new >= 0 \
+                and (old is None or old < 0 or new < old):
+            return True
+    return False
+
+
+class ChangeFeed(object):
+    """Listener of the cost changes of the edge table of a PGRouting,
+    applying them to its 'local' graph and its cache.
+
+    It runs on its own connection, in autocommit mode so that notifications
+    are delivered as soon as the updates commit.
+
+    Usage:
+        feed = ChangeFeed(pgr, dbname='mydb', user='user')
+        feed.install()  # once, by the owner of the edge table
+        pgr.load_graph()
+        while True:
+            stats = feed.wait(timeout=60)
+    """
+
+    def __init__(self, pgr, *args, channel=None, since=None, **kwargs):
+        """
+        Args:
+            pgr: the PGRouting to update.
+            channel: name of the notification channel, by default
+                psycopgr_{table}_changes.
+            since: seq of the delta table after which changes are applied,
+                by default the last one when the feed is created.
+            args, kwargs: database connection arguments that psycopg2
+                accepts.
+        """
+        self.pgr = pgr
+        if channel is None:
+            channel = 'psycopgr_{}_changes'.format(
+                pgr._meta_data['table'].split('.')[-1])
+        self.channel = channel
+        self._conn = psycopg2.connect(*args, **kwargs)
+        self._conn.autocommit = True
+        self._indexes = None  # (graph, _ArcIndex of forward, of backward)
+        with self._conn.cursor() as cur:
+            cur.execute(psycopg2.sql.SQL('LISTEN {}').format(
+                psycopg2.sql.Identifier(self.channel)))
+        self.seq = since
+        if since is None:
+            try:
+                with self._conn.cursor() as cur:
+                    cur.execute(queries.last_change(pgr._meta_data))
+                    self.seq = cur.fetchone()[0]
+            except psycopg2.Error:  # not installed yet
+                self.seq = 0
+
+    def close(self):
+        self._conn.close()
+
+    def install(self):
+        """Create the delta table and the trigger on the edge table."""
+        with self._conn.cursor() as cur:
+            cur.execute(queries.install_changes(self.pgr._meta_data,
+                                                self.channel))
+
+    def uninstall(self):
+        """Drop the delta table and the trigger on the edge table."""
+        with self._conn.cursor() as cur:
+            cur.execute(queries.uninstall_changes(self.pgr._meta_data))
+
+    def prune(self, older_than=3600.0):
+        """Delete changes older than older_than seconds from the delta
+        table, which is shared by all feeds on the edge table.
+
+        Returns:
+            Number of changes deleted.
+        """
+        with self._conn.cursor() as cur:
+            cur.execute(queries.prune_changes(self.pgr._meta_data,
+                                              [psycopg2.sql.Literal(
+                                                  float(older_than))]))
+            return cur.rowcount
+
+    def wait(self, timeout=None):
+        """Wait until changes are notified or timeout seconds pass, then
+        apply the pending changes. See poll.
+        """
+        if select.select([self._conn], [], [], timeout) != ([], [], []):
+            self._conn.poll()
+            self._conn.notifies.clear()
+        return self.poll()
+
+    def poll(self):
+        """Apply the changes made since the last ones applied.
+
+        Returns:
+            dict of statistics, or None on database error:
+            - changes: number of changes read, edges: number of edges
+              changed, arcs: number of arcs of the graph updated;
+            - reloaded: whether the graph had to be reloaded;
+            - invalidated: number of cache entries dropped;
+            - lag_s: seconds between the oldest change and reading it;
+            - apply_s: seconds applying the changes;
+            - latency_s: lag_s + apply_s, the staleness of the graph and
+              cache right before they were updated.
+        """
+        try:
+            with self._conn.cursor(
+                    cursor_factory=psycopg2.extras.DictCursor) as cur:
+                cur.execute(queries.changes(self.pgr._meta_data,
+                                            [psycopg2.sql.Literal(self.seq)]))
+                rows = cur.fetchall()
+        except psycopg2.Error as e:
+            print(e.pgerror)
+            return None
+
+        t0 = time.perf_counter()
+        stats = {'changes': len(rows), 'edges': 0, 'arcs': 0,
+                 'reloaded': False, 'invalidated': 0,
+                 'lag_s': max([r['lag_s'] for r in rows], default=0.0)}
+        if rows:
+            self.seq = rows[-1]['seq']
+            # the first old and the last new costs of each edge
+            changes = {}
+            for r in rows:
+                r = dict(r)
+                if r['edge'] in changes:
+                    r['old_cost'] = changes[r['edge']]['old_cost']
+                    r['old_reverse_cost'] = \
+                        changes[r['edge']]['old_reverse_cost']
+                changes[r['edge']] = r
+            stats['edges'] = len(changes)
+            self._apply(list(changes.values()), stats)
+        stats['apply_s'] = time.perf_counter() - t0
+        stats['latency_s'] = stats['lag_s'] + stats['apply_s']
+        return stats
+
+    def _arc_indexes(self, graph):
+        if self._indexes is None or self._indexes[0] is not graph:
+            self._indexes = (graph, _ArcIndex(graph.forward),
+                             _ArcIndex(graph.backward))
+        return self._indexes[1:]
+
+    def _apply(self, changes, stats):
+        pgr = self.pgr
+        pgr._engines.pop('ch', None)
+        pgr._engines.pop('alt', None)
+        graph = pgr._engines.get('local')
+        cache = pgr._cache
+        fp = fingerprint(pgr._meta_data)
+
+        forward = backward = None  # new weights by arc index
+        if graph is not None:
+            forward, backward = {}, {}
+            forward_index, backward_index = self._arc_indexes(graph)
+            for r in changes:
+                s, t = graph.index(r['source']), graph.index(r['target'])
+                if s is None or t is None:
+                    forward = None
+                    break
+                expected = _edge_arcs(s, t, r['cost'], r['reverse_cost'],
+                                      pgr._meta_data['directed'])
+                f = _assignment(graph.forward,
+                                forward_index.arcs(r['edge']), expected)
+                b = _assignment(graph.backward,
+                                backward_index.arcs(r['edge']), expected,
+                                reverse=True)
+                if f is None or b is None:
+                    forward = None
+                    break
+                forward.update(f)
+                backward.update(b)
+
+        if graph is not None and forward is None:
+            # an edge gained an arc, which cannot be added in place
+            stats['reloaded'] = True
+            pgr.load_graph()
+            if cache is not None:
+                stats['invalidated'] = len(cache.items(fp))
+                cache.invalidate(fp)
+            return
+
+        if cache is not None:
+            entries = cache.items(fp)
+            if graph is not None:
+                keys = _affected(
+                    graph, entries,
+                    {i: min(w, graph.forward.weights[i])
+                     for i, w in forward.items()
+                     if w != graph.forward.weights[i]},
+                    {i: min(w, graph.backward.weights[i])
+                     for i, w in backward.items()
+                     if w != graph.backward.weights[i]})
+            elif any(_decreased(r) for r in changes):
+                keys = [key for key, _ in entries]
+            else:
+                keys = _touched(entries, changes)
+            cache.delete(keys)
+            stats['invalidated'] = len(keys)
+
+        if graph is not None:
+            for csr, weights in ((graph.forward, forward),
+                                 (graph.backward, backward)):
+                arcs = [i for i, w in weights.items() if w != csr.weights[i]]
+                csr.set_weights(arcs, [weights[i] for i in arcs])
+                if csr is graph.forward:
+                    stats['arcs'] = len(arcs)
@@ -0,0 +1,149 @@
+"""Streaming export of routes to GPX, GeoJSON and encoded polylines.
+
+Writers take routes as returned by PGRouting.get_routes, or an iterable of
+(start_node, end_node, route) such as iter_routes yields, and write each
+route to a file-like object as soon as it is read, so memory does not grow
+with the number of routes.
+"""
+import json
+import math
+
+GPX_HEADER = ("<?xml version='1.0'?>\n"
+              "<gpx version='1.1' creator='psycopgr' "
+              "xmlns='http://www.topografix.com/GPX/1/1' "
+              "xmlns:xsi='http://www.w3.org/2001/XMLSchema-instance' "
+              "xsi:schemaLocation='http://www.topografix.com/GPX/1/1 "
+              "http://www.topografix.com/GPX/1/1/gpx.xsd'>\n")
+
+
+def _route_items(routes):
+    """((start_node, end_node), route) of routes in either form."""
+    if isinstance(routes, dict):
+        return routes.items()
+    return (((start, end), route) for start, end, route in routes)
+
+
+def _coordinates(path):
+    """(lon, lat) of the points of a path, read from the arrays of compact
+    paths without building PgrNode.
+    """
+    if hasattr(path, 'tolist'):  # edge geometry array of shape (n, 2)
+        return path.tolist()
+    if hasattr(path, 'coordinates'):
+        lons, lats = path.coordinates()
+        return zip(lons.tolist(), lats.tolist())
+    return ((node.lon, node.lat) for node in path)
+
+
+def _line(route):
+    """Edge geometry of a route if it was fetched, else its path."""
+    return route['geometry'] if 'geometry' in route else route['path']
+
+
+def write_gpx(routes, f):
+    """Write routes to f as a GPX document with a track per route."""
+    f.write(GPX_HEADER)
+    for key, value in _route_items(routes):
+        f.write(" <trk>\n  <name>{},{}->{},{}: {}</name>\n  <trkseg>\n".format(
+            key[0].lon, key[0].lat, key[1].lon, key[1].lat,
+            value.get('cost', None)))
+        for lon, lat in _coordinates(_line(value)):
+            f.write("   <trkpt lat='{}' lon='{}'>\n   </trkpt>\n".format(
+                lat, lon))
+        f.write("  </trkseg>\n  </trk>\n")
+    f.write("</gpx>\n")
+
+
+def _feature(key, value):
+    return {
+        'type': 'Feature',
+        'geometry': {
+            'type': 'LineString',
+            'coordinates': [[lon, lat]
+                            for lon, lat in _coordinates(_line(value))]
+        },
+        'properties': {
+            'start': [key[0].lon, key[0].lat],
+            'end': [key[1].lon, key[1].lat],
+            'cost': value.get('cost', None)
+        }
+    }
+
+
+def write_geojson(routes, f):
+    """Write routes to f as a GeoJSON FeatureCollection with a LineString
+    feature per route, whose properties are start, end and cost.
+    """
+    f.write('{"type": "FeatureCollection", "features": [\n')
+    separator = ''
+    for key, value in _route_items(routes):
+        f.write(separator)
+        f.write(json.dumps(_feature(key, value)))
+        separator = ',\n'
+    f.write('\n]}\n')
+
+
+def _round(value):
+    # round half away from zero, as the reference implementation does
+    return int(math.floor(abs(value) + 0.5)) * (1 if value >= 0 else -1)
+
+
+def encode_polyline(path, precision=5):
+    """Encode a path of PgrNode, or an array of shape (n, 2) of longitudes
+    and latitudes, in the Google encoded polyline format.
+
+    Ref: https://developers.google.com/maps/documentation/utilities/polylinealgorithm
+    """
+    factor = 10 ** precision
+    chars = []
+    last_lat = last_lon = 0
+    for lon, lat in _coordinates(path):
+        lat = _round(lat * factor)
+        lon = _round(lon * factor)
+        for delta in (lat - last_lat, lon - last_lon):
+            delta = ~(delta << 1) if delta < 0 else delta << 1
+            while delta >= 0x20:
+                chars.append(chr((0x20 | (delta & 0x1f)) + 63))
+                delta >>= 5
+            chars.append(chr(delta + 63))
+        last_lat, last_lon = lat, lon
+    return ''.join(chars)
+
+
+def write_polylines(routes, f, precision=5):
+    """Write routes to f as JSON lines, one object per route with start,
+    end, cost and the path as encoded polyline.
+    """
+    for key, value in _route_items(routes):
+        f.write(json.dumps({
+            'start': [key[0].lon, key[0].lat],
+            'end': [key[1].lon, key[1].lat],
+            'cost': value.get('cost', None),
+            'polyline': encode_polyline(_line(value), precision)
+        }))
+        f.write('\n')
+
+
+WRITERS = {
+    'gpx': write_gpx,
+    'geojson': write_geojson,
+    'polyline': write_polylines,
+}
+
+
+def write_routes(routes, file, format='gpx'):
+    """Write routes to file in format.
+
+    Args:
+        routes: routes returned by get_routes, or an iterable of
+            (start_node, end_node, route) such as iter_routes returns.
+        file: name of the file, or a file-like object to write to.
+        format: 'gpx', 'geojson' or 'polyline'.
+    """
+    if format not in WRITERS:
+        raise ValueError("write_routes: invalid format {}".format(format))
+    if isinstance(file, str):
+        with open(file, 'w') as f:
+            WRITERS[format](routes, f)
+    else:
+        WRITERS[format](routes, file)
@@ -0,0 +1,99 @@
+"""Geographic helpers computed in-process with NumPy."""
+import struct
+
+import numpy as np
+
+
+# mean earth radius (unit: m), the same sphere PostGIS uses for geography
+# distances with use_spheroid=false
+EARTH_RADIUS = 6371008.7714
+
+
+def haversine(lons1, lats1, lons2, lats2):
+    """Great-circle distances between two sets of points (unit: m).
+
+    Args:
+        lons1, lats1, lons2, lats2: scalars or array-likes of longitudes and
+            latitudes in degrees, broadcastable against each other.
+
+    Returns:
+        numpy array of distances.
+    """
+    lons1, lats1, lons2, lats2 = (
+        np.radians(np.asarray(a, dtype=np.float64))
+        for a in (lons1, lats1, lons2, lats2))
+    a = (np.sin((lats2 - lats1) / 2.0) ** 2
+         + np.cos(lats1) * np.cos(lats2)
+         * np.sin((lons2 - lons1) / 2.0) ** 2)
+    return 2.0 * EARTH_RADIUS * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def _wkb_header(wkb):
+    """Byte order, geometry type without Z and M, and number of ordinates
+    per point of a WKB geometry.
+    """
+    byteorder = '<' if wkb[0] == 1 else '>'
+    geometry_type, = struct.unpack_from(byteorder + 'I', wkb, 1)
+    # PostGIS flags of Z and M in the high bits, ISO Z, M and ZM as +1000s
+    dims = 2 + bool(geometry_type & 0x80000000) \
+        + bool(geometry_type & 0x40000000)
+    geometry_type &= 0x0fffffff
+    if geometry_type >= 4000:
+        raise ValueError('unknown WKB geometry type {}'.format(geometry_type))
+    dims += (0, 1, 1, 2)[geometry_type // 1000]
+    return byteorder, geometry_type % 1000, dims
+
+
+def _wkb_points(wkb, byteorder, dims, n, offset):
+    return np.frombuffer(wkb, dtype=byteorder + 'f8', count=n * dims,
+                         offset=offset).reshape(n, dims)[:, :2]
+
+
+def wkb_linestring(wkb):
+    """Decode a WKB LineString, as ST_AsBinary returns, without copying.
+
+    Z and M ordinates, in ISO or PostGIS extended WKB, are dropped.
+
+    Args:
+        wkb: bytes-like WKB, e.g. memoryview of a bytea.
+
+    Returns:
+        numpy array of shape (n, 2) of longitudes and latitudes (x, y), a
+        view into wkb.
+    """
+    wkb = memoryview(wkb).cast('B')  # psycopg2 bytea has format 'c'
+    byteorder, geometry_type, dims = _wkb_header(wkb)
+    if geometry_type != 2:
+        raise ValueError('wkb_linestring: geometry type {} is not a '
+                         'LineString'.format(geometry_type))
+    n, = struct.unpack_from(byteorder + 'I', wkb, 5)
+    return _wkb_points(wkb, byteorder, dims, n, 9)
+
+
+def wkb_polygon(wkb):
+    """Decode the exterior ring of a WKB Polygon without copying.
+
+    The hull of fewer than three distinct points is a Point or LineString,
+    whose points are returned as well.
+
+    Args:
+        wkb: bytes-like WKB, e.g. memoryview of a bytea.
+
+    Returns:
+        numpy array of shape (n, 2) of longitudes and latitudes (x, y), a
+        view into wkb, closed (first point equal to last) for a Polygon.
+    """
+    wkb = memoryview(wkb).cast('B')
+    byteorder, geometry_type, dims = _wkb_header(wkb)
+    if geometry_type == 1:
+        return _wkb_points(wkb, byteorder, dims, 1, 5)
+    if geometry_type == 2:
+        return wkb_linestring(wkb)
+    if geometry_type != 3:
+        raise ValueError('wkb_polygon: geometry type {} is not a '
+                         'Polygon'.format(geometry_type))
+    rings, = struct.unpack_from(byteorder + 'I', wkb, 5)
+    if rings == 0:
+        return np.empty((0, 2))
+    n, = struct.unpack_from(byteorder + 'I', wkb, 9)
+    return _wkb_points(wkb, byteorder, dims, n, 13)
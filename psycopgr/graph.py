@@ -0,0 +1,292 @@
+"""In-memory road graph in compressed sparse row (CSR) arrays, with
+Dijkstra shortest paths computed in-process.
+"""
+from heapq import heappop, heappush
+
+import numpy as np
+
+from .node import PgrNode
+from .route import Path
+
+
+def paths_output(vids, lons, lats, paths, compact=False):
+    """Routings in the format of PGRouting.dijkstra.
+
+    Args:
+        vids, lons, lats: arrays of vertex ids and coordinates by index.
+        paths: dict mapping (start_vid, end_vid) to (cost, list of vertex
+            indices).
+        compact: return the paths as route.Path sharing one set of arrays,
+            instead of lists of PgrNode.
+    """
+    if not compact:
+        return {key: {'path': [PgrNode(int(vids[i]), float(lons[i]),
+                                       float(lats[i])) for i in path],
+                      'cost': cost}
+                for key, (cost, path) in paths.items()}
+
+    indices = np.fromiter((i for _, path in paths.values() for i in path),
+                          np.int64)
+    ids = vids[indices]
+    path_lons = lons[indices]
+    path_lats = lats[indices]
+    output = {}
+    start = 0
+    for key, (cost, path) in paths.items():
+        output[key] = {'path': Path(ids, path_lons, path_lats, start,
+                                    start + len(path)),
+                       'cost': cost}
+        start += len(path)
+    return output
+
+
+class CSR(object):
+    """Adjacency of a directed graph in CSR arrays.
+
+    The arcs leaving vertex u are arcs[offsets[u]:offsets[u+1]]. For each arc
+    heads is the vertex it enters, tails the vertex it leaves, weights its
+    cost and edges the id of the edge in the edge table it comes from.
+    Vertices are compact indices 0..n-1.
+
+    A shared CSR holds arrays memory-mapped from a snapshot file, whose
+    pages are shared by the processes mapping it. Its searches read the
+    arrays in place rather than copying them to Python lists.
+    """
+
+    def __init__(self, offsets, heads, tails, weights, edges, shared=False):
+        self.offsets = offsets
+        self.heads = heads
+        self.tails = tails
+        self.weights = weights
+        self.edges = edges
+        self.shared = shared
+        self._lists = None
+
+    @classmethod
+    def build(cls, n, tails, heads, weights, edges):
+        """Build from arc arrays in any order."""
+        order = np.argsort(tails, kind='stable')
+        offsets = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(tails, minlength=n), out=offsets[1:])
+        return cls(offsets,
+                   heads[order].astype(np.int64),
+                   tails[order].astype(np.int64),
+                   weights[order].astype(np.float64),
+                   edges[order].astype(np.int64))
+
+    def transpose(self):
+        """CSR of the graph with all arcs reversed."""
+        return CSR.build(len(self.offsets) - 1, self.heads, self.tails,
+                         self.weights, self.edges)
+
+    @property
+    def num_vertices(self):
+        return len(self.offsets) - 1
+
+    def lists(self):
+        """(offsets, heads, weights) as Python lists, which are much faster
+        than NumPy arrays to index element by element in a search loop.
+
+        A shared CSR gets memoryviews of its arrays instead, which index
+        nearly as fast without a private copy of the arrays, about 10 times
+        their size as lists.
+        """
+        if self._lists is None:
+            arrays = (self.offsets, self.heads, self.weights)
+            self._lists = tuple(memoryview(array) for array in arrays) \
+                if self.shared else tuple(array.tolist() for array in arrays)
+        return self._lists
+
+    def invalidate(self):
+        """Drop the cached lists after weights are changed in place."""
+        self._lists = None
+
+    def set_weights(self, arcs, weights):
+        """Set the weights of arcs in place, in the arrays and in the cached
+        lists, which are kept.
+        """
+        self.weights[arcs] = weights
+        if self._lists is not None and not self.shared:
+            lists = self._lists[2]
+            for i, w in zip(arcs, weights):
+                lists[i] = float(w)
+
+    def search(self, source, targets=None, limit=None):
+        """Dijkstra search from vertex index source.
+
+        Args:
+            source: vertex index.
+            targets: vertex indices to reach. The search stops once all of
+                them are settled. None searches the whole graph.
+            limit: max distance of the vertices settled. Vertices farther
+                may be reached but not settled.
+
+        Returns:
+            (dist, pred): dicts mapping reached vertex index to its distance
+            from source, and to the index of the arc entering it on the
+            shortest path tree (-1 for source).
+        """
+        offsets, heads, weights = self.lists()
+        dist = {source: 0.0}
+        pred = {source: -1}
+        remaining = None if targets is None else set(targets)
+        heap = [(0.0, source)]
+        while heap:
+            d, u = heappop(heap)
+            if d > dist[u]:
+                continue  # stale entry
+            if limit is not None and d > limit:
+                break
+            if remaining is not None:
+                remaining.discard(u)
+                if not remaining:
+                    break
+            for i in range(offsets[u], offsets[u + 1]):
+                v = heads[i]
+                nd = d + weights[i]
+                if nd < dist.get(v, float('inf')):
+                    dist[v] = nd
+                    pred[v] = i
+                    heappush(heap, (nd, v))
+        return dist, pred
+
+    def unpack(self, pred, target):
+        """Arc indices of the path to target in a shortest path tree."""
+        arcs = []
+        i = pred[target]
+        while i >= 0:
+            arcs.append(i)
+            i = pred[int(self.tails[i])]
+        arcs.reverse()
+        return arcs
+
+
+class Graph(object):
+    """Edge table of a road network held in memory.
+
+    The forward CSR holds the arcs the way they are traversed, the backward
+    CSR is its transpose, which is used by searches towards a target. Vertex
+    ids of the table are mapped to compact indices by the sorted array vids.
+    """
+
+    def __init__(self, vids, forward, backward=None, lons=None, lats=None):
+        self.vids = vids
+        self.forward = forward
+        self.backward = backward if backward is not None \
+            else forward.transpose()
+        n = len(vids)
+        self.lons = lons if lons is not None else np.full(n, np.nan)
+        self.lats = lats if lats is not None else np.full(n, np.nan)
+
+    @classmethod
+    def from_edges(cls, edge_ids, sources, targets, costs,
+                   reverse_costs=None, directed=True,
+                   vertex_ids=None, lons=None, lats=None):
+        """Build the graph from columns of an edge table, with the same
+        semantics as pgRouting: an edge with a negative cost does not exist
+        in that direction, and undirected graphs can traverse every edge
+        both ways.
+
+        Args:
+            edge_ids, sources, targets, costs: arrays of the edge table.
+            reverse_costs: array of reverse costs, or None if the table has
+                no reverse cost.
+            directed: whether the graph is directed.
+            vertex_ids, lons, lats: arrays of the vertex table giving the
+                coordinates of vertices.
+        """
+        edge_ids = np.asarray(edge_ids, dtype=np.int64)
+        sources = np.asarray(sources, dtype=np.int64)
+        targets = np.asarray(targets, dtype=np.int64)
+        costs = np.asarray(costs, dtype=np.float64)
+
+        ends = [sources, targets]
+        if vertex_ids is not None:
+            vertex_ids = np.asarray(vertex_ids, dtype=np.int64)
+            ends.append(vertex_ids)
+        vids = np.unique(np.concatenate(ends))
+        s = np.searchsorted(vids, sources)
+        t = np.searchsorted(vids, targets)
+
+        # arcs as (tails, heads, weights, edges)
+        arcs = [(s, t, costs, edge_ids)]
+        if reverse_costs is not None:
+            arcs.append((t, s, np.asarray(reverse_costs, dtype=np.float64),
+                         edge_ids))
+        if not directed:
+            arcs += [(head, tail, weight, edge)
+                     for tail, head, weight, edge in arcs]
+        tails, heads, weights, edges = (np.concatenate(column)
+                                        for column in zip(*arcs))
+        valid = weights >= 0
+        forward = CSR.build(len(vids), tails[valid], heads[valid],
+                            weights[valid], edges[valid])
+
+        vertex_lons = vertex_lats = None
+        if vertex_ids is not None:
+            idx = np.searchsorted(vids, vertex_ids)
+            vertex_lons = np.full(len(vids), np.nan)
+            vertex_lats = np.full(len(vids), np.nan)
+            vertex_lons[idx] = lons
+            vertex_lats[idx] = lats
+
+        return cls(vids, forward, lons=vertex_lons, lats=vertex_lats)
+
+    @property
+    def num_vertices(self):
+        return len(self.vids)
+
+    def index(self, vid):
+        """Compact index of vertex id, or None if it is not in the graph."""
+        i = int(np.searchsorted(self.vids, vid))
+        if i < len(self.vids) and self.vids[i] == vid:
+            return i
+        return None
+
+    def node(self, i):
+        """PgrNode of vertex index i."""
+        return PgrNode(int(self.vids[i]), float(self.lons[i]),
+                       float(self.lats[i]))
+
+    def _searches(self, start_vids, end_vids):
+        """Yield (start_vid, source index, {end_vid: end index}, dist, pred)
+        per unique start vertex, with one Dijkstra search each.
+        """
+        ends = {vid: self.index(vid) for vid in set(end_vids)}
+        ends = {vid: i for vid, i in ends.items() if i is not None}
+        targets = set(ends.values())
+        for start_vid in dict.fromkeys(start_vids):
+            source = self.index(start_vid)
+            if source is None:
+                continue
+            dist, pred = self.forward.search(source, targets)
+            yield start_vid, source, ends, dist, pred
+
+    def dijkstra_cost(self, start_vids, end_vids):
+        """Get all-pairs costs among vertices, in the same format as
+        PGRouting.dijkstra_cost: pairs of the same vertex and unreachable
+        pairs are left out.
+        """
+        output = {}
+        for start_vid, source, ends, dist, _ in self._searches(
+                start_vids, end_vids):
+            for end_vid, target in ends.items():
+                if target != source and target in dist:
+                    output[(start_vid, end_vid)] = dist[target]
+        return output
+
+    def dijkstra(self, start_vids, end_vids, compact=False):
+        """Get all-pairs shortest paths with costs among vertices, in the
+        same format as PGRouting.dijkstra. See paths_output for compact.
+        """
+        paths = {}
+        for start_vid, source, ends, dist, pred in self._searches(
+                start_vids, end_vids):
+            for end_vid, target in ends.items():
+                if target == source or target not in dist:
+                    continue
+                arcs = self.forward.unpack(pred, target)
+                paths[(start_vid, end_vid)] = (
+                    dist[target],
+                    [source] + self.forward.heads[arcs].tolist())
+        return paths_output(self.vids, self.lons, self.lats, paths, compact)
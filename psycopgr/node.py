@@ -0,0 +1,4 @@
+from collections import namedtuple
+
+
+PgrNode = namedtuple('PgrNode', ['id', 'lon', 'lat'])
@@ -0,0 +1,85 @@
+"""Thread-safe connection pool used by PGRouting in pooled mode."""
+from contextlib import contextmanager
+import threading
+
+import psycopg2
+import psycopg2.pool
+
+
+class ConnectionPool(object):
+    """A psycopg2 ThreadedConnectionPool with a checkout timeout and a health
+    check of connections on checkout.
+    """
+
+    def __init__(self, minconn, maxconn, *args, timeout=None,
+                 health_check=True, **kwargs):
+        """
+        Args:
+            minconn: number of connections opened up front.
+            maxconn: max number of connections checked out at the same time.
+            timeout: seconds to wait for a free connection before raising
+                PoolError. None waits forever.
+            health_check: ping connections with SELECT 1 on checkout, and
+                replace those that are broken.
+            args, kwargs: database connection arguments that psycopg2
+                accepts.
+        """
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.health_check = health_check
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._pool = psycopg2.pool.ThreadedConnectionPool(
+            minconn, maxconn, *args, **kwargs)
+
+    def getconn(self):
+        """Check out a healthy connection."""
+        if not self._slots.acquire(timeout=self.timeout):
+            raise psycopg2.pool.PoolError(
+                "no connection available within {} s".format(self.timeout))
+        try:
+            conn = self._pool.getconn()
+            if not self._is_healthy(conn):
+                self._pool.putconn(conn, close=True)
+                conn = self._pool.getconn()
+        except Exception:
+            self._slots.release()
+            raise
+        return conn
+
+    def putconn(self, conn, close=False):
+        """Return a connection checked out by getconn."""
+        try:
+            if not conn.closed and not close:
+                conn.rollback()  # end the read-only transaction
+        except psycopg2.Error:
+            close = True
+        finally:
+            self._pool.putconn(conn, close=close)
+            self._slots.release()
+
+    @contextmanager
+    def connection(self):
+        """Context manager checking out a connection and returning it."""
+        conn = self.getconn()
+        try:
+            yield conn
+        finally:
+            self.putconn(conn)
+
+    def closeall(self):
+        if not self._pool.closed:
+            self._pool.closeall()
+
+    def _is_healthy(self, conn):
+        if conn.closed:
+            return False
+        if not self.health_check:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute('SELECT 1')
+            conn.rollback()
+            return True
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            return False
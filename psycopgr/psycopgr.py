@@ -1,10 +1,398 @@
 from collections import namedtuple
-from typing import List
+from contextlib import contextmanager
+from functools import partial
+import io
+from itertools import chain, count
+from typing import Iterator, List
+import threading
+import time
+import weakref
+import numpy as np
 import psycopg2
 import psycopg2.extras
 
+from . import export, queries, snapshot
+from .alt import ALT
+from .cache import fingerprint
+from .ch import ContractionHierarchy
+from .geo import haversine, wkb_linestring, wkb_polygon
+from .graph import Graph
+from .node import PgrNode
+from .pool import ConnectionPool
+from .route import Path
+from .spatial import GridIndex
+from .stats import profiled
+
+
+# cached marker of vertex pairs without a path
+_UNREACHABLE = 'unreachable'
+# suffixes of server-side cursor names, unique among open generators
+_cursor_ids = count()
+
+# costs[i, j] is the cost from start node i to end node j, np.inf if
+# unreachable; start_vids and end_vids are the vertices nodes snap to
+CostMatrix = namedtuple('CostMatrix',
+                        ['costs', 'reachable', 'start_vids', 'end_vids'])
+
+# vertices reachable from a center within its budget of cost, as arrays in
+# order of cost, and the (n, 2) exterior ring of their concave hull if it
+# was asked for, else None
+Isochrone = namedtuple('Isochrone', ['vids', 'costs', 'lons', 'lats', 'hull'])
+
+
+# Building outputs from query results. These are shared with AsyncPGRouting.
+
+def _nearest_vertices_output(nodes, results):
+    results = {r['idx']: r for r in results}
+    output = []
+    for idx, node in enumerate(nodes, 1):
+        r = results.get(idx)
+        if r is not None:
+            output.append(PgrNode(r['id'], r['lon'], r['lat']))
+        else:
+            print('cannot find nearest vid for ({}, {})'.format(
+                  node.lon, node.lat))
+            output.append(None)
+    return output
+
+
+def _node_distances_args(nodes1, nodes2):
+    return ([node.lon for node in nodes1],
+            [node.lat for node in nodes1],
+            [node.lon for node in nodes2],
+            [node.lat for node in nodes2])
+
+
+def _node_distances_local(nodes1, nodes2):
+    return haversine(*_node_distances_args(nodes1, nodes2)).tolist()
+
+
+def _dijkstra_cost_output(results):
+    return {(r['start_vid'], r['end_vid']): r['agg_cost'] for r in results}
+
+
+def _dijkstra_groups(results):
+    """Yield ((start_vid, end_vid), routing) as soon as the rows of a pair
+    are complete. Rows of a pair are contiguous as they are ordered by seq.
+    """
+    key = None
+    routing = None
+    for r in results:
+        if (r['start_vid'], r['end_vid']) != key:
+            if key is not None:
+                yield key, routing
+            key = (r['start_vid'], r['end_vid'])
+            routing = {'path': [], 'cost': -1}
+
+        routing['path'].append(PgrNode(r['node'], r['lon'], r['lat']))
+        if r['edge'] < 0:
+            routing['cost'] = r['agg_cost']
+    if key is not None:
+        yield key, routing
+
+
+def _compact_groups(results, vid_key, key_of):
+    """Path arrays of all rows of results, and the boundaries of the groups
+    of contiguous rows with the same key_of(row).
+    """
+    n = len(results)
+    ids = np.fromiter((r[vid_key] for r in results), np.int64, n)
+    lons = np.fromiter((r['lon'] for r in results), np.float64, n)
+    lats = np.fromiter((r['lat'] for r in results), np.float64, n)
+    keys = [key_of(r) for r in results]
+    bounds = [0] + [i for i in range(1, n) if keys[i] != keys[i - 1]] + [n]
+    return ids, lons, lats, keys, bounds
+
+
+def _edge_geometries(output, results, key_of):
+    """Add the line of the edges of each routing of output as geometry, an
+    array of shape (n, 2) of longitudes and latitudes concatenating the WKB
+    edge geometries of results. Edges share their end points, which are
+    kept once.
+    """
+    lines = {}
+    for r in results:
+        if r['geometry'] is not None:
+            lines.setdefault(key_of(r), []).append(
+                wkb_linestring(r['geometry']))
+    for key, edge_lines in lines.items():
+        output[key]['geometry'] = np.concatenate(
+            edge_lines[:1] + [line[1:] for line in edge_lines[1:]])
+    return output
+
+
+def _dijkstra_output(results, compact=False, geometry=False):
+    if geometry:
+        return _edge_geometries(_dijkstra_output(results, compact), results,
+                                lambda r: (r['start_vid'], r['end_vid']))
+    if not compact:
+        return dict(_dijkstra_groups(results))
+
+    ids, lons, lats, keys, bounds = _compact_groups(
+        results, 'node', lambda r: (r['start_vid'], r['end_vid']))
+    if not results:
+        return {}
+    return {
+        keys[start]: {'path': Path(ids, lons, lats, start, stop),
+                      'cost': results[stop - 1]['agg_cost']}
+        for start, stop in zip(bounds[:-1], bounds[1:])
+    }
+
+
+def _astar_output(results, key, compact=False, geometry=False):
+    if geometry:
+        return _edge_geometries(_astar_output(results, key, compact),
+                                results, lambda r: key)
+    if compact:
+        if not results:
+            return {}
+        ids, lons, lats, _, _ = _compact_groups(results, 'node',
+                                                lambda r: key)
+        return {key: {'path': Path(ids, lons, lats),
+                      'cost': results[-1]['agg_cost']}}
+
+    output = {}
+    for r in results:
+        if output.get(key, None) is None:
+            output[key] = {'path': [], 'cost': 0}
+
+        output[key]['path'].append(
+            PgrNode(r['node'], r['lon'], r['lat']))
+        output[key]['cost'] = r['agg_cost']
+    return output
+
+
+def _bbox_margins(bbox):
+    """Margins of the bbox restriction set by set_bbox, widening on each
+    retry. None stands for the whole edge table.
+    """
+    if bbox is None:
+        yield None
+        return
+    margin = bbox['margin']
+    for _ in range(bbox['max_retries'] + 1):
+        yield margin
+        margin *= bbox['growth']
+    if bbox['fallback']:
+        yield None
+
+
+def _snap_output(nodes, vertices, distances, end_speed):
+    end_speed = end_speed * 1000.0 / 3600.0  # km/h -> m/s
+    return {
+        node: {'vertex': vertex, 'cost': distance / end_speed}
+        for node, vertex, distance in zip(nodes, vertices, distances)
+    }
+
+
+def _all_pairs_nodes(start_nodes, end_nodes):
+    """Returns (unique nodes to snap, end_nodes)."""
+    if end_nodes is not None:
+        node_set = set(start_nodes) | set(end_nodes)
+    else:
+        node_set = set(start_nodes)
+        end_nodes = start_nodes
+    return list(node_set), end_nodes
+
+
+def _framed(path, start_node, end_node):
+    """Path from start_node to end_node through a path between vertices.
+    Compact paths are not copied.
+    """
+    if isinstance(path, Path):
+        return path.framed(start_node, end_node)
+    return [start_node] + path + [end_node]
+
+
+def _pair_routing(routing, start_node, end_node, access_cost):
+    """Route from start_node to end_node through a routing between
+    vertices, with the cost of the access legs added.
+    """
+    output = {'cost': routing['cost'] + access_cost,
+              'path': _framed(routing['path'], start_node, end_node)}
+    if 'geometry' in routing:
+        output['geometry'] = np.concatenate(
+            [[[start_node.lon, start_node.lat]], routing['geometry'],
+             [[end_node.lon, end_node.lat]]])
+    return output
+
+
+def _pair_routings(start_nodes, end_nodes, node_vertex, main_routings,
+                   compact=False, geometry=False):
+    """Combine routings between vertices with the access legs of nodes.
+    See _pairs_routings.
+    """
+    return _pairs_routings(_node_pairs(start_nodes, end_nodes), node_vertex,
+                           main_routings, compact, geometry)
+
+
+def _pair_costs(start_nodes, end_nodes, node_vertex, main_costs):
+    """Combine costs between vertices with the access legs of nodes. See
+    _pairs_costs.
+    """
+    return _pairs_costs(_node_pairs(start_nodes, end_nodes), node_vertex,
+                        main_costs)
+
+
+def _unique_vids(nodes, node_vertex):
+    """Ids of the vertices nodes snap to, without duplicates: nodes close
+    to each other, e.g. addresses along a street, often share a vertex.
+    """
+    return list(dict.fromkeys(node_vertex[node]['vertex'].id
+                              for node in nodes))
+
+
+def _node_pairs(start_nodes, end_nodes):
+    return ((start_node, end_node) for start_node in start_nodes
+            for end_node in end_nodes)
+
+
+def _vertex_costs(node_vertex):
+    """Dict mapping node to (id of its nearest vertex, cost of the access
+    leg), looked up once per node instead of once per pair.
+    """
+    return {node: (value['vertex'].id, value['cost'])
+            for node, value in node_vertex.items()}
+
+
+def _estimated_bytes(rows, sample=100):
+    """Approximate size of rows as text, extrapolated from at most sample
+    of them evenly spaced, so that profiling costs little on large results.
+    """
+    if not rows:
+        return 0
+    step = max(1, len(rows) // sample)
+    sampled = rows[::step]
+    size = sum(len(str(value)) for row in sampled for value in row)
+    return size * len(rows) // len(sampled)
 
-PgrNode = namedtuple('PgrNode', ['id', 'lon', 'lat'])
+
+def _reversed_routing(routing):
+    """Routing between two vertices in the opposite direction, on an
+    undirected graph. Arrays and compact paths are not copied.
+    """
+    path = routing['path']
+    output = {'cost': routing['cost'],
+              'path': path.reversed() if isinstance(path, Path)
+              else path[::-1]}
+    if 'geometry' in routing:
+        output['geometry'] = routing['geometry'][::-1]
+    return output
+
+
+def _mirrored(output, reverse=None, vids=None):
+    """Add (v, u) to output keyed by pairs (u, v) of vertices, with the
+    value of (u, v) transformed by reverse (default: the same value). If
+    vids is given, only pairs of two vertices of vids are mirrored.
+    """
+    for (start_vid, end_vid), value in list(output.items()):
+        if vids is not None and (start_vid not in vids
+                                 or end_vid not in vids):
+            continue
+        output[(end_vid, start_vid)] = value if reverse is None \
+            else reverse(value)
+    return output
+
+
+def _by_start(compute, pairs):
+    """Results of compute(start_vids, end_vids) of an all-pairs engine for
+    pairs only, with a call per start vertex, so work grows with the number
+    of pairs rather than with starts x ends.
+    """
+    ends = {}
+    for start_vid, end_vid in pairs:
+        ends.setdefault(start_vid, []).append(end_vid)
+    output = {}
+    for start_vid, end_vids in ends.items():
+        output.update(compute([start_vid], end_vids))
+    return output
+
+
+def _same_vertex_routing(vertex, compact=False, geometry=False):
+    """Routing between a vertex and itself."""
+    output = {'cost': 0.0,
+              'path': Path.from_nodes([vertex]) if compact else [vertex]}
+    if geometry:
+        output['geometry'] = np.array([[vertex.lon, vertex.lat]])
+    return output
+
+
+def _pairs_routings(pairs, node_vertex, main_routings, compact=False,
+                    geometry=False):
+    """Combine routings between vertices with the access legs of the nodes
+    of pairs. Pairs of the same node, or without path, are left out.
+    """
+    vertex_costs = _vertex_costs(node_vertex)
+    output = {}
+    for start_node, end_node in pairs:
+        if start_node == end_node:
+            continue
+        (start_vid, start_cost), (end_vid, end_cost) = \
+            vertex_costs[start_node], vertex_costs[end_node]
+        if start_vid == end_vid:
+            routing = _same_vertex_routing(node_vertex[start_node]['vertex'],
+                                           compact, geometry)
+        else:
+            routing = main_routings.get((start_vid, end_vid))
+            if routing is None:
+                continue
+        output[(start_node, end_node)] = _pair_routing(
+            routing, start_node, end_node, start_cost + end_cost)
+    return output
+
+
+def _pairs_costs(pairs, node_vertex, main_costs):
+    """Combine costs between vertices with the access legs of the nodes of
+    pairs. Pairs of the same node, or without path, are left out.
+    """
+    vertex_costs = _vertex_costs(node_vertex)
+    output = {}
+    for start_node, end_node in pairs:
+        if start_node == end_node:
+            continue
+        (start_vid, start_cost), (end_vid, end_cost) = \
+            vertex_costs[start_node], vertex_costs[end_node]
+        if start_vid == end_vid:
+            cost = 0.0
+        else:
+            cost = main_costs.get((start_vid, end_vid))
+            if cost is None:
+                continue
+        # total costs = main cost + two ends costs
+        output[(start_node, end_node)] = cost + start_cost + end_cost
+    return output
+
+
+def _driving_distance_output(results, num_centers, hull=False):
+    """Isochrone of each center from rows of driving_distance, which are
+    ordered by center. Arrays of the isochrones are views into arrays of all
+    rows.
+    """
+    columns = list(zip(*results)) if results else [()] * 6
+    idx = np.array(columns[0], dtype=np.int64)
+    vids = np.array(columns[1], dtype=np.int64)
+    costs, lons, lats = (np.array(column, dtype=np.float64)
+                         for column in columns[2:5])
+    bounds = np.searchsorted(idx, np.arange(1, num_centers + 2))
+    output = []
+    for k in range(num_centers):
+        rows = slice(bounds[k], bounds[k + 1])
+        ring = None
+        if hull:
+            wkbs = [wkb for wkb in columns[5][rows] if wkb is not None]
+            ring = wkb_polygon(wkbs[0]) if wkbs else None
+        output.append(Isochrone(vids[rows], costs[rows], lons[rows],
+                                lats[rows], ring))
+    return output
+
+
+def _isochrones_output(nodes, access_costs, isochrones):
+    """Isochrones of nodes, with the cost of the access leg added."""
+    return {
+        node: isochrone._replace(costs=isochrone.costs + access_cost)
+        for node, access_cost, isochrone in zip(nodes, access_costs,
+                                                isochrones)
+    }
 
 
 class PGRouting(object):
@@ -28,8 +416,15 @@ class PGRouting(object):
         'directed': True,
         'srid': 4326
     }
-
-    def __init__(self, *args, **kwargs):
+    _cache = None
+    _bbox = None
+    _profiler = None
+    _compact_paths = False
+    _edge_geometry = False
+
+    def __init__(self, *args, pool_minconn=None, pool_maxconn=None,
+                 pool_timeout=None, pool_health_check=True,
+                 prepare_statements=True, **kwargs):
         """
         Args:
 
@@ -42,10 +437,39 @@ class PGRouting(object):
         - port: connection port number (defaults to 5432 if not provided)
 
         Ref: http://initd.org/psycopg/docs/module.html#psycopg2.connect
+
+        pooled mode, enabled by setting pool_maxconn, which makes the
+        instance safe to use from many threads:
+
+        - pool_minconn: number of connections opened up front (default 1)
+        - pool_maxconn: max number of connections in use at the same time
+        - pool_timeout: seconds to wait for a free connection (default: wait
+          forever)
+        - pool_health_check: ping connections on checkout and replace broken
+          ones (default True)
+
+        prepare_statements: run queries as server-side prepared statements,
+        so repeated calls skip parsing and planning (default True).
         """
         self._conn = None
         self._cur = None
-        self._connect_to_db(*args, **kwargs)
+        self._pool = None
+        self._lock = threading.RLock()
+        self._engines = {}  # in-process routing backends by name
+        self._vertex_index = None
+        self._prepare_statements = prepare_statements
+        # compiled SQL by meta data fingerprint, then by template name
+        self._statements = {}
+        # names of statements prepared on each connection
+        self._prepared = weakref.WeakKeyDictionary()
+        self._prepared_lock = threading.Lock()
+        if pool_maxconn is not None:
+            self._create_pool(
+                pool_minconn if pool_minconn is not None else 1,
+                pool_maxconn, *args, timeout=pool_timeout,
+                health_check=pool_health_check, **kwargs)
+        else:
+            self._connect_to_db(*args, **kwargs)
 
     def __del__(self):
         self._close_db()
@@ -62,261 +486,1004 @@ class PGRouting(object):
         except psycopg2.Error as e:
             print(e.pgerror)
 
+    def _create_pool(self, minconn, maxconn, *args, **kwargs):
+        try:
+            self._pool = ConnectionPool(minconn, maxconn, *args, **kwargs)
+        except psycopg2.Error as e:
+            print(e.pgerror)
+
     def _close_db(self):
-        if not self._cur.closed:
+        if self._pool is not None:
+            self._pool.closeall()
+        if self._cur is not None and not self._cur.closed:
             self._cur.close()
-        if not self._conn.closed:
+        if self._conn is not None and not self._conn.closed:
             self._conn.close()
 
-    def find_nearest_vertices(self, nodes: List[PgrNode]) -> List[PgrNode]:
+    @contextmanager
+    def _cursor(self, cursor_factory=psycopg2.extras.DictCursor, name=None):
+        """Context manager yielding a cursor for one unit of work.
+
+        In pooled mode a connection is checked out from the pool for the
+        duration of the block. Otherwise the shared connection is used while
+        holding the instance lock, so concurrent callers are serialized.
+
+        Args:
+            cursor_factory: cursor class, None for plain tuple rows.
+            name: name of a server-side cursor, None for a client-side one.
+        """
+        if self._pool is not None:
+            with self._pool.connection() as conn:
+                with conn.cursor(name, cursor_factory=cursor_factory) as cur:
+                    yield cur
+        else:
+            with self._lock:
+                try:
+                    if cursor_factory is psycopg2.extras.DictCursor \
+                            and name is None:
+                        yield self._cur
+                    else:
+                        with self._conn.cursor(
+                                name, cursor_factory=cursor_factory) as cur:
+                            yield cur
+                except psycopg2.Error:
+                    self._conn.rollback()
+                    raise
+
+    def _statement(self, name, conn):
+        """SQL of template name compiled for the current meta data.
+
+        Templates are compiled once per meta data fingerprint, so they are
+        rebuilt only after set_meta_data changes something.
+        """
+        fp = fingerprint(self._meta_data)
+        statements = self._statements.setdefault(fp, {})
+        if name not in statements:
+            statements[name] = queries.compile_statement(
+                name, self._meta_data, 'psycopgr_' + fp, conn)
+        return statements[name]
+
+    def _execute(self, cur, name, args, bbox=None, prepared=None):
+        """Execute template name on cursor cur.
+
+        Args:
+            cur: cursor.
+            name: key of queries.TEMPLATES.
+            args: query arguments, without the edges SQL.
+            bbox: (vids, margin) restricting the edges of pgRouting
+                functions to the bbox of vertices vids expanded by margin
+                (default: the whole edge table).
+            prepared: run as prepared statement, which is prepared on the
+                connection first if it is not yet (default: as set by
+                prepare_statements).
+        """
+        statement = self._statement(name, cur.connection)
+        if statement.edges is not None:
+            edges_sql = statement.edges
+            if bbox is not None:
+                edges_sql = queries.TEMPLATES[name].edges(
+                    self._meta_data, where=queries.bbox(
+                        self._meta_data, *bbox)).as_string(cur.connection)
+            args = (edges_sql,) + tuple(args)
+        if prepared is None:
+            prepared = self._prepare_statements
+        stats = self._stats()
+        if stats is not None and self._profiler.explain \
+                and statement.edges is not None and cur.name is None:
+            stats.explains.append(
+                self._explain(cur, name, statement.query, args))
+
+        t0 = time.perf_counter()
+        if not prepared:
+            cur.execute(statement.query, args)
+            round_trips = 1
+        else:
+            with self._prepared_lock:
+                prepared_names = self._prepared.setdefault(cur.connection,
+                                                           set())
+            round_trips = 1
+            if statement.prepare not in prepared_names:
+                cur.execute(statement.prepare)
+                prepared_names.add(statement.prepare)
+                round_trips += 1
+            cur.execute(statement.execute, args)
+        if stats is not None:
+            elapsed = time.perf_counter() - t0
+            stats.add(round_trips=round_trips, server_s=elapsed)
+            stats.queries.append((name, elapsed))
+
+    def _explain(self, cur, name, query, args):
+        """EXPLAIN (ANALYZE, BUFFERS) plans of a pgRouting query and of its
+        edges SQL, which is the first of args.
+        """
+        explain = 'EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) '
+        cur.execute(explain + query, args)
+        plan = cur.fetchone()[0]
+        cur.execute(explain + args[0])
+        edges_plan = cur.fetchone()[0]
+        return {'query': name, 'plan': plan, 'edges_plan': edges_plan}
+
+    def _fetch(self, cur):
+        """Fetch all result rows of cur, recording them in the stats of the
+        running call.
+        """
+        stats = self._stats()
+        if stats is None:
+            return cur.fetchall()
+        t0 = time.perf_counter()
+        rows = cur.fetchall()
+        stats.add(fetch_s=time.perf_counter() - t0, rows=len(rows),
+                  bytes=_estimated_bytes(rows))
+        return rows
+
+    def _fetchall(self, name, args, **kwargs):
+        """Execute template name and fetch all result rows."""
+        with self._cursor() as cur:
+            self._execute(cur, name, args, **kwargs)
+            return self._fetch(cur)
+
+    def _stats(self):
+        """CallStats of the running call, or None if not profiled."""
+        if self._profiler is None:
+            return None
+        return self._profiler.current()
+
+    def _in_call(self, function):
+        """function, recorded by the profiler as part of the call running
+        in this thread when other threads run it.
+        """
+        stats = self._stats()
+        if stats is None:
+            return function
+        profiler = self._profiler
+
+        def attached(*args, **kwargs):
+            with profiler.attach(stats):
+                return function(*args, **kwargs)
+        return attached
+
+    def _build(self, function, *args):
+        """function(*args) building an output, timed in the stats of the
+        running call.
+        """
+        stats = self._stats()
+        if stats is None:
+            return function(*args)
+        t0 = time.perf_counter()
+        output = function(*args)
+        stats.add(build_s=time.perf_counter() - t0)
+        return output
+
+    @profiled
+    def find_nearest_vertices(self, nodes: List[PgrNode],
+                              chunk_size: int = 1000) -> List[PgrNode]:
         """Find nearest vertex of nodes on the way.
 
+        All coordinates of a chunk are sent in one query and snapped with a
+        KNN LATERAL subquery, so the number of round trips is
+        ceil(len(nodes) / chunk_size) instead of len(nodes). If the vertex
+        index is loaded by load_vertex_index, nodes are snapped in-process
+        without any query.
+
         Args:
             nodes: list of PgrNode.
+            chunk_size: max number of nodes snapped per query.
 
         Returns:
-            list of PgrNode.
+            list of PgrNode, in the same order as nodes.
         """
 
-        sql = """
-            SELECT id, lon::double precision, lat::double precision
-            FROM {table}_vertices_pgr
-            ORDER BY the_geom <-> ST_SetSRID(ST_Point(%s,%s),{srid})
-            LIMIT 1
-            """.format(table=self._meta_data['table'],
-                       srid=self._meta_data['srid'])
+        if self._vertex_index is not None:
+            return [vertices[0] if vertices else None
+                    for vertices in self._vertex_index.nearest(nodes)]
 
         output = []
-        for node in nodes:
+        for i in range(0, len(nodes), chunk_size):
+            chunk = nodes[i:i+chunk_size]
             try:
-                self._cur.execute(sql, (node.lon, node.lat))
-                results = self._cur.fetchall()
-                if len(results) > 0:
-                    output.append(
-                        PgrNode(results[0]['id'],
-                                results[0]['lon'],
-                                results[0]['lat'])
-                    )
-                else:
-                    print('cannot find nearest vid for ({}, {})'.format(
-                          node.lon, node.lat))
-                    output.append(None)
+                results = self._fetchall(
+                    'nearest_vertices', ([node.lon for node in chunk],
+                                         [node.lat for node in chunk]))
             except psycopg2.Error as e:
                 print(e.pgerror)
                 return None
+            output += self._build(_nearest_vertices_output, chunk, results)
         return output
 
+    @profiled
+    def load_vertex_index(self) -> GridIndex:
+        """Load the vertex table into an in-process spatial index used by
+        find_nearest_vertices. Call it again to refresh the index after the
+        vertex table changes.
+
+        Returns:
+            The GridIndex, or None on database error. Its nearest method
+            answers k-nearest queries too.
+        """
+        try:
+            with self._cursor(cursor_factory=None) as cur:
+                cur.execute(queries.vertices(self._meta_data))
+                vertices = cur.fetchall()
+        except psycopg2.Error as e:
+            print(e.pgerror)
+            return None
+
+        ids, lons, lats = (np.array(column) for column in zip(*vertices)) \
+            if vertices else [np.empty(0)] * 3
+        self._vertex_index = GridIndex(ids, lons, lats)
+        return self._vertex_index
+
+    def drop_vertex_index(self):
+        """Snap nodes by SQL queries again."""
+        self._vertex_index = None
+
     def set_meta_data(self, **kwargs):
-        """Set meta data of tables if it is different from the default."""
+        """Set meta data of tables if it is different from the default.
+
+        Cached results computed with the previous meta data are dropped.
+        """
+        old_fingerprint = fingerprint(self._meta_data)
+        self._meta_data = dict(self._meta_data)  # own copy of the instance
         for k, v in kwargs.items():
             if k not in self._meta_data.keys():
                 raise ValueError("set_meta_data: invaid key {}".format(k))
             if not isinstance(v, (str, bool, int)):
                 raise ValueError("set_meta_data: invalid value {}".format(v))
             self._meta_data.update({k: v})
+        if self._cache is not None \
+                and fingerprint(self._meta_data) != old_fingerprint:
+            self._cache.invalidate(old_fingerprint)
         return self._meta_data
 
-    def node_distance(self, node1: PgrNode, node2: PgrNode) -> float:
+    def set_bbox(self, margin=0.05, growth=4.0, max_retries=2,
+                 fallback=True):
+        """Restrict the edges dijkstra, dijkstra_cost and astar route on to
+        the bounding box of their vertices, so pgRouting loads only the
+        edges around them instead of the whole table. Pairs that come back
+        unreachable are retried with a wider margin.
+
+        A path leaving the bbox is not found, and a path inside it may cost
+        more than the shortest one, so the margin trades accuracy for
+        speed. See benchmarks/bench_bbox.py. dijkstra_cost_matrix and
+        iter_dijkstra always route on the whole table.
+
+        Args:
+            margin: margin added to each side of the bbox in units of the
+                srid (degrees for 4326), None to route on the whole table.
+            growth: factor the margin is multiplied by on each retry.
+            max_retries: max number of retries with a wider margin.
+            fallback: retry pairs still unreachable on the whole table.
+
+        Returns:
+            The bbox settings.
+        """
+        if margin is None:
+            self._bbox = None
+        else:
+            self._bbox = {'margin': margin, 'growth': growth,
+                          'max_retries': max_retries, 'fallback': fallback}
+        return self._bbox
+
+    def _restricted(self, query, start_vids, end_vids):
+        """Results of query between vertices with edges restricted as set
+        by set_bbox.
+
+        Args:
+            query: function of (start_vids, end_vids, bbox) returning a dict
+                keyed by (start_vid, end_vid), bbox is passed to _execute.
+            start_vids, end_vids: lists of vertex ids.
+        """
+        if self._bbox is None:
+            return query(start_vids, end_vids, None)
+
+        pairs = {(start_vid, end_vid) for start_vid in start_vids
+                 for end_vid in end_vids if start_vid != end_vid}
+        return self._restricted_pairs(
+            lambda pairs, bbox: query(list({pair[0] for pair in pairs}),
+                                      list({pair[1] for pair in pairs}),
+                                      bbox),
+            pairs)
+
+    def _restricted_pairs(self, query, pairs):
+        """Results of query between pairs of vertices with edges restricted
+        as set by set_bbox.
+
+        Args:
+            query: function of (pairs, bbox) returning a dict keyed by
+                (start_vid, end_vid), bbox is passed to _execute.
+            pairs: set of (start_vid, end_vid).
+        """
+        if self._bbox is None:
+            return query(pairs, None)
+
+        output = {}
+        pairs = set(pairs)
+        for margin in _bbox_margins(self._bbox):
+            if not pairs:
+                break
+            bbox = None if margin is None \
+                else ({vid for pair in pairs for vid in pair}, margin)
+            output.update(query(pairs, bbox))
+            pairs -= output.keys()
+        return output
+
+    def set_profiler(self, profiler):
+        """Record statistics of public calls, such as round trips, server
+        and client time, and rows fetched.
+
+        Args:
+            profiler: a stats.Profiler, or None to stop recording.
+
+        Returns:
+            The profiler, whose calls holds a CallStats per call.
+        """
+        self._profiler = profiler
+        return profiler
+
+    def set_compact_paths(self, compact=True):
+        """Return paths of routes as compact route.Path instead of lists of
+        PgrNode.
+
+        A Path keeps vertex ids and coordinates in NumPy arrays shared by
+        all paths of a query, and builds PgrNode only when it is indexed or
+        iterated. It behaves as a read-only list of PgrNode, and its
+        coordinates method returns the arrays directly.
+        """
+        self._compact_paths = compact
+        return compact
+
+    def set_edge_geometry(self, geometry=True):
+        """Add to routes of get_routes, dijkstra and astar their geometry:
+        the line along the geometries of the edges they traverse, from
+        column geometry of the meta data, instead of the straight segments
+        between vertices of their paths.
+
+        The edge geometries are fetched in the routing query itself as WKB
+        and decoded with NumPy, without parsing text. They must be
+        LineStrings. In-process backends and iter_routes return vertex
+        paths only.
+
+        Returns:
+            The setting. Routes then have a 'geometry' array of shape
+            (n, 2) of longitudes and latitudes, framed by the nodes in
+            get_routes, which export.write_routes draws instead of path.
+        """
+        self._edge_geometry = geometry
+        return geometry
+
+    def _geometry_variant(self, name):
+        """Name of a template, suffixed with '_geometry' if edge geometries
+        are fetched as set by set_edge_geometry.
+        """
+        return name + '_geometry' if self._edge_geometry else name
+
+    def _route_kind(self, geometry):
+        """Cache kind of routes, which differ in shape: 'route', suffixed
+        with '_geometry' if they hold edge geometries, and with '_compact'
+        if paths are compact as set by set_compact_paths.
+        """
+        kind = 'route_geometry' if geometry else 'route'
+        return kind + '_compact' if self._compact_paths else kind
+
+    def set_cache(self, cache):
+        """Cache routing results between vertices in get_routes and
+        get_costs, so only pairs missing in cache are computed.
+
+        Args:
+            cache: a cache.LRUCache, a cache.DiskCache, or None to disable
+                caching.
+
+        Returns:
+            The cache, whose stats method returns hit, miss and eviction
+            counters.
+        """
+        self._cache = cache
+        return cache
+
+    def _cached(self, kind, compute, start_vids, end_vids):
+        """Results between vertices, looked up in cache.
+
+        Args:
+            kind: 'cost', or a route kind, see _route_kind.
+            compute: function like dijkstra_cost or dijkstra, called for the
+                start and end vertices of pairs missing in cache.
+            start_vids, end_vids: lists of vertex ids.
+
+        Returns:
+            dict mapping (start_vid, end_vid) to result of compute.
+        """
+        if self._cache is None:
+            return compute(start_vids, end_vids)
+
+        return self._cached_pairs(
+            kind,
+            lambda missing: compute(list({pair[0] for pair in missing}),
+                                    list({pair[1] for pair in missing})),
+            [(start_vid, end_vid) for start_vid in set(start_vids)
+             for end_vid in set(end_vids)])
+
+    def _cached_pairs(self, kind, compute, pairs):
+        """Results between pairs of vertices, looked up in cache.
+
+        Args:
+            kind: see _cached.
+            compute: function of a list of pairs missing in cache, returning
+                a dict mapping (start_vid, end_vid) to result.
+            pairs: list of unique (start_vid, end_vid).
+
+        Returns:
+            dict mapping (start_vid, end_vid) to result of compute.
+        """
+        if self._cache is None:
+            return compute(pairs)
+
+        fp = fingerprint(self._meta_data)
+        output = {}
+        missing = []
+        found = self._cache.get_many([(fp, kind) + pair for pair in pairs])
+        for pair in pairs:
+            value = found.get((fp, kind) + pair)
+            if value is None:
+                missing.append(pair)
+            elif value != _UNREACHABLE:
+                output[pair] = value
+
+        if missing:
+            results = compute(missing)
+            self._cache.set_many([((fp, kind) + pair,
+                                   results.get(pair, _UNREACHABLE))
+                                  for pair in missing])
+            output.update(results)
+        return output
+
+    def node_distance(self, node1: PgrNode, node2: PgrNode,
+                      backend: str = 'local') -> float:
         """Get distance between two nodes (unit: m).
+
+        See node_distances for the backends.
+        """
+        distances = self.node_distances([node1], [node2], backend)
+        if distances is None:
+            return None
+        return distances[0]
+
+    @profiled
+    def node_distances(self, nodes1: List[PgrNode], nodes2: List[PgrNode],
+                       backend: str = 'local') -> List[float]:
+        """Get great-circle distances between nodes pairwise (unit: m).
+
+        Args:
+            nodes1, nodes2: lists of PgrNode with the same length.
+            backend: 'local' computes haversine distances with NumPy in one
+                vectorized call, which needs coordinates in degrees: with
+                an srid other than 4326 it falls back to 'db'. 'db' computes
+                them by PostGIS in one query, which is kept for parity
+                checks.
+
+        Returns:
+            list of distances, distances[i] is between nodes1[i] and
+            nodes2[i].
+
         Ref: https://postgis.net/docs/ST_Distance.html
         """
-        if self._meta_data.get('geometry').strip().lower() == 'the_geom':
-            sql = """
-            SELECT ST_Distance(
-              ST_Transform('SRID={srid};POINT({lon1} {lat1})'::geometry, 3857),
-              ST_Transform('SRID={srid};POINT({lon2} {lat2})'::geometry, 3857)
-            ) * cosd(42.3521);
-            """.format(srid=self._meta_data['srid'],
-                       lon1=node1.lon, lat1=node1.lat,
-                       lon2=node2.lon, lat2=node2.lat)
-        else:  # geography
-            sql = """
-            SELECT ST_Distance(
-                'SRID={srid};POINT({lon1} {lat1})'::geography,
-                'SRID={srid};POINT({lon1} {lat1})'::geography
-            );
-            """.format(srid=self._meta_data['srid'],
-                       lon1=node1.lon, lat1=node1.lat,
-                       lon2=node2.lon, lat2=node2.lat)
+        if len(nodes1) != len(nodes2):
+            raise ValueError("node_distances: lengths of nodes differ")
+
+        if backend == 'local' and self._meta_data['srid'] == 4326:
+            return _node_distances_local(nodes1, nodes2)
+        if backend not in ('local', 'db'):
+            raise ValueError("node_distances: invalid backend {}".format(
+                             backend))
 
         try:
-            self._cur.execute(sql)
-            results = self._cur.fetchall()
-            return results[0][0]
+            results = self._fetchall('node_distances',
+                                     _node_distances_args(nodes1, nodes2))
+            return [r['distance'] for r in results]
         except psycopg2.Error as e:
             print(e.pgerror)
             return None
 
+    @profiled
     def dijkstra_cost(self, start_vids, end_vids):
         """Get all-pairs costs among way nodes without paths using
         pgr_dijkstraCost function.
         """
-        sql = """
-            SELECT *
-            FROM pgr_dijkstraCost(
-                'SELECT {id} as id,
-                        {source} as source,
-                        {target} as target,
-                        {cost} as cost,
-                        {reverse_cost} as reverse_cost
-                 FROM {table}',
-                %s,
-                %s,
-                {directed})
-            """.format(
-                    table=self._meta_data['table'],
-                    id=self._meta_data['id'],
-                    source=self._meta_data['source'],
-                    target=self._meta_data['target'],
-                    cost=self._meta_data['cost'],
-                    reverse_cost=self._meta_data['reverse_cost'],
-                    directed='TRUE'
-                             if self._meta_data['directed']
-                             else 'FALSE')
-
         try:
-            self._cur.execute(sql, (start_vids, end_vids))
-            results = self._cur.fetchall()
-            return {(r['start_vid'], r['end_vid']): r['agg_cost']
-                    for r in results}
-
+            # mirrored in the query, so that _restricted does not retry the
+            # (v, u) pairs of an undirected graph
+            return self._restricted(
+                lambda starts, ends, bbox: self._mirror(self._build(
+                    _dijkstra_cost_output,
+                    self._fetch_all_pairs('dijkstra_cost', starts, ends,
+                                          bbox)), starts, ends),
+                start_vids, end_vids)
         except psycopg2.Error as e:
             print(e.pgerror)
             return {}
 
+    @profiled
     def dijkstra(self, start_vids, end_vids):
         """Get all-pairs shortest paths with costs among way nodes using
         pgr_dijkstra function.
         """
+        try:
+            return self._restricted(
+                lambda starts, ends, bbox: self._mirror(self._build(
+                    _dijkstra_output,
+                    self._fetch_all_pairs(self._geometry_variant('dijkstra'),
+                                          starts, ends, bbox),
+                    self._compact_paths, self._edge_geometry),
+                    starts, ends, _reversed_routing),
+                start_vids, end_vids)
+        except psycopg2.Error as e:
+            print(e.pgerror)
+            return {}
 
-        sql = """
-            SELECT *, v.lon::double precision, v.lat::double precision
-            FROM
-                pgr_dijkstra(
-                    'SELECT {id} as id,
-                            {source} as source,
-                            {target} as target,
-                            {cost} as cost,
-                            {reverse_cost} as reverse_cost
-                     FROM {edge_table}',
-                    %s,
-                    %s,
-                    {directed}) as r,
-                {edge_table}_vertices_pgr as v
-            WHERE r.node=v.id
-            ORDER BY r.seq;
-            """.format(
-                    edge_table=self._meta_data['table'],
-                    id=self._meta_data['id'],
-                    source=self._meta_data['source'],
-                    target=self._meta_data['target'],
-                    cost=self._meta_data['cost'],
-                    reverse_cost=self._meta_data['reverse_cost'],
-                    directed='TRUE'
-                             if self._meta_data['directed']
-                             else 'FALSE')
+    def _mirror(self, output, start_vids, end_vids, reverse=None):
+        """Complete output of _fetch_all_pairs between start_vids x end_vids
+        with _mirrored, on the vertices routed one way only.
+        """
+        vids = self._shared_vids(start_vids, end_vids)
+        if vids is None:
+            return output
+        return self._build(_mirrored, output, reverse, vids)
 
-        try:
-            self._cur.execute(sql, (start_vids, end_vids))
-            results = self._cur.fetchall()
+    def _shared_vids(self, start_vids, end_vids):
+        """Set of the vertices both in start_vids and end_vids, between
+        which only one of (u, v) and (v, u) is routed on an undirected
+        graph, or None if every pair is routed as it is.
+        """
+        if self._meta_data['directed']:
+            return None
+        vids = set(int(vid) for vid in start_vids) & \
+            set(int(vid) for vid in end_vids)
+        return vids if len(vids) > 1 else None
 
-            output = {}
-            for r in results:
-                # print r
-                key = (r['start_vid'], r['end_vid'])
-                if output.get(key, None) is None:
-                    output[key] = {'path': [], 'cost': -1}
+    def _fetch_combinations(self, name, combinations, bbox=None):
+        """Execute template name on a composed combinations SQL and fetch
+        all result rows.
+        """
+        with self._cursor() as cur:
+            self._execute(cur, name, (combinations.as_string(cur.connection),),
+                          bbox=bbox)
+            return self._fetch(cur)
+
+    def _fetch_pairs(self, name, pairs, bbox=None):
+        """Execute template name on the combinations SQL of pairs and fetch
+        all result rows.
+        """
+        return self._fetch_combinations(name, queries.combinations(pairs),
+                                        bbox)
+
+    def _fetch_all_pairs(self, name, start_vids, end_vids, bbox=None):
+        """Execute template name between start_vids x end_vids and fetch all
+        result rows.
+
+        On an undirected graph, where the path from v to u is that from u
+        to v reversed, only the pairs (u, v) with u < v of the vertices
+        both in start_vids and end_vids are routed, by the combinations SQL
+        variant name + '_pairs' of the template; results are completed by
+        _mirror. Without two such vertices the arrays are sent as they are.
+        """
+        if self._shared_vids(start_vids, end_vids) is None:
+            return self._fetchall(name, (start_vids, end_vids), bbox=bbox)
+        return self._fetch_combinations(
+            name + '_pairs', queries.triangle(start_vids, end_vids), bbox)
+
+    def _chunked_pairs(self, query, pairs, chunk_size):
+        """Results of query between pairs of vertices, chunk_size pairs at a
+        time. See _restricted_pairs for query.
+        """
+        pairs = list(pairs)
+        output = {}
+        for i in range(0, len(pairs), chunk_size):
+            output.update(self._restricted_pairs(query,
+                                                 pairs[i:i+chunk_size]))
+        return output
 
-                output[key]['path'].append(
-                    PgrNode(r['node'], r['lon'], r['lat']))
-                if r['edge'] < 0:
-                    output[key]['cost'] = r['agg_cost']
+    @profiled
+    def dijkstra_cost_pairs(self, pairs, chunk_size=10000):
+        """Get costs between pairs of way nodes only, using the
+        combinations SQL variant of pgr_dijkstraCost (pgRouting 3.1+).
 
-            return output
+        Args:
+            pairs: list of (start_vid, end_vid).
+            chunk_size: max number of pairs per query.
+        """
+        try:
+            return self._chunked_pairs(
+                lambda chunk, bbox: self._build(
+                    _dijkstra_cost_output,
+                    self._fetch_pairs('dijkstra_cost_pairs', chunk, bbox)),
+                pairs, chunk_size)
+        except psycopg2.Error as e:
+            print(e.pgerror)
+            return {}
 
+    @profiled
+    def dijkstra_pairs(self, pairs, chunk_size=10000):
+        """Get shortest paths with costs between pairs of way nodes only,
+        using the combinations SQL variant of pgr_dijkstra (pgRouting 3.1+).
+
+        Args:
+            pairs: list of (start_vid, end_vid).
+            chunk_size: max number of pairs per query.
+        """
+        try:
+            return self._chunked_pairs(
+                lambda chunk, bbox: self._build(
+                    _dijkstra_output,
+                    self._fetch_pairs(
+                        self._geometry_variant('dijkstra') + '_pairs', chunk,
+                        bbox),
+                    self._compact_paths, self._edge_geometry),
+                pairs, chunk_size)
         except psycopg2.Error as e:
             print(e.pgerror)
             return {}
 
+    @profiled
+    def dijkstra_cost_matrix(self, start_vids, end_vids):
+        """Get the dense matrix of costs among way nodes using
+        pgr_dijkstraCost function.
+
+        Rows are read with a plain tuple cursor into arrays, without
+        building a dict. On an undirected graph only one of (u, v) and
+        (v, u) of the vertices both in start_vids and end_vids is routed,
+        see _fetch_all_pairs.
+
+        Args:
+            start_vids, end_vids: arrays of unique vertex ids.
+
+        Returns:
+            float64 array of shape (len(start_vids), len(end_vids)), np.inf
+            for unreachable pairs and 0 between a vertex and itself, or
+            None on database error.
+        """
+        start_vids = np.asarray(start_vids, dtype=np.int64)
+        end_vids = np.asarray(end_vids, dtype=np.int64)
+        shared = self._shared_vids(start_vids, end_vids)
+        try:
+            with self._cursor(cursor_factory=None) as cur:
+                if shared is None:
+                    self._execute(cur, 'dijkstra_cost',
+                                  (start_vids.tolist(), end_vids.tolist()))
+                else:
+                    self._execute(cur, 'dijkstra_cost_pairs', (
+                        queries.triangle(start_vids, end_vids).as_string(
+                            cur.connection),))
+                rows = np.array(self._fetch(cur), dtype=np.float64)
+        except psycopg2.Error as e:
+            print(e.pgerror)
+            return None
+
+        if shared is not None and len(rows):
+            shared = np.fromiter(shared, dtype=np.int64)
+            mirrored = rows[np.isin(rows[:, 0], shared)
+                            & np.isin(rows[:, 1], shared)]
+            rows = np.concatenate([rows, mirrored[:, [1, 0, 2]]])
+
+        costs = np.full((len(start_vids), len(end_vids)), np.inf)
+        costs[start_vids[:, None] == end_vids[None, :]] = 0.0
+        if len(rows):
+            start_order = np.argsort(start_vids)
+            end_order = np.argsort(end_vids)
+            i = start_order[np.searchsorted(start_vids, rows[:, 0],
+                                            sorter=start_order)]
+            j = end_order[np.searchsorted(end_vids, rows[:, 1],
+                                          sorter=end_order)]
+            costs[i, j] = rows[:, 2]
+        return costs
+
+    def iter_dijkstra(self, start_vids, end_vids, itersize=10000):
+        """Stream all-pairs shortest paths among way nodes using
+        pgr_dijkstra function.
+
+        Rows are fetched from a server-side cursor itersize at a time, so
+        memory stays flat however many paths there are. Each generator has
+        its own cursor, so several can be iterated together. In non-pooled
+        mode the instance lock is held until the generator is exhausted or
+        closed, as a rollback by another call on the shared connection
+        would close the cursor, so other threads wait for it meanwhile.
+
+        Yields:
+            ((start_vid, end_vid), {'path': [PgrNode], 'cost': cost}) as soon
+            as the path of a pair is complete.
+        """
+        try:
+            with self._cursor(name='psycopgr_iter_dijkstra_{}'.format(
+                    next(_cursor_ids))) as cur:
+                cur.itersize = itersize
+                # a server-side cursor cannot be declared for EXECUTE
+                self._execute(cur, 'dijkstra', (start_vids, end_vids),
+                              prepared=False)
+                yield from _dijkstra_groups(cur)
+        except psycopg2.Error as e:
+            print(e.pgerror)
+
+    @profiled
     def astar(self, start_vid, end_vid):
         """Get one-to-one shortest path between way nodes using pgr_AStar
         function.
         """
+        try:
+            return self._restricted(
+                lambda starts, ends, bbox: self._build(
+                    _astar_output,
+                    self._fetchall(self._geometry_variant('astar'),
+                                   (start_vid, end_vid), bbox=bbox),
+                    (start_vid, end_vid), self._compact_paths,
+                    self._edge_geometry),
+                [start_vid], [end_vid])
+        except psycopg2.Error as e:
+            print(e.pgerror)
+            return {}
+
+    @profiled
+    def driving_distance(self, start_vids, budgets, equicost=False,
+                         hull=None):
+        """Get the way nodes reachable from start vids within budgets of
+        cost, using a single multi-start pgr_drivingDistance run.
+
+        Args:
+            start_vids: list of vertex ids of centers.
+            budgets: list of the budget of cost of each center.
+            equicost: reach each vertex only from the center nearest to it,
+                splitting the network into service areas.
+            hull: None, or the target percent of ST_ConcaveHull in (0, 1]
+                to compute the concave hull of the vertices of each center
+                too. 1.0 is the convex hull.
+
+        Returns:
+            A list of Isochrone in the order of start_vids, or None on
+            database error. Centers with a negative budget reach nothing.
+        """
+        kept = [k for k, budget in enumerate(budgets) if budget >= 0]
+        results = []
+        if kept:
+            name = 'driving_distance' if hull is None \
+                else 'driving_distance_hull'
+            args = ([int(start_vids[k]) for k in kept],
+                    [float(budgets[k]) for k in kept], bool(equicost))
+            if hull is not None:
+                args += (float(hull),)
+            try:
+                with self._cursor(cursor_factory=None) as cur:
+                    self._execute(cur, name, args)
+                    results = self._fetch(cur)
+            except psycopg2.Error as e:
+                print(e.pgerror)
+                return None
 
-        sql = """
-            SELECT *, v.lon::double precision, v.lat::double precision
-            FROM
-                pgr_AStar(
-                    'SELECT {id}::INTEGER as id,
-                            {source}::INTEGER as source,
-                            {target}::INTEGER as target,
-                            {cost} as cost,
-                            {x1} as x1,
-                            {y1} as y1,
-                            {x2} as x2,
-                            {y2} as y2
-                            {reverse_cost}
-                     FROM {edge_table}',
-                    %s,
-                    %s,
-                    {directed},
-                    {has_rcost}) as r,
-                {edge_table}_vertices_pgr as v
-            WHERE r.id1=v.id
-            ORDER BY r.seq;
-            """.format(
-                    edge_table=self._meta_data['table'],
-                    id=self._meta_data['id'],
-                    source=self._meta_data['source'],
-                    target=self._meta_data['target'],
-                    cost=self._meta_data['cost'],
-                    x1=self._meta_data['x1'],
-                    y1=self._meta_data['y1'],
-                    x2=self._meta_data['x2'],
-                    y2=self._meta_data['y2'],
-                    reverse_cost=', {} as reverse_cost'
-                    .format(self._meta_data['reverse_cost'])
-                    if (self._meta_data['directed']
-                        and self._meta_data['has_reverse_cost'])
-                    else '',
-                    directed='TRUE'
-                             if self._meta_data['directed']
-                             else 'FALSE',
-                    has_rcost='TRUE'
-                              if (self._meta_data['directed']
-                                  and self._meta_data['has_reverse_cost'])
-                              else 'FALSE'
-                )
-        # print(sql)
+        isochrones = self._build(_driving_distance_output, results,
+                                 len(kept), hull is not None)
+        # centers reaching nothing share the isochrone of no rows
+        output = _driving_distance_output([], 1) * len(start_vids)
+        for k, isochrone in zip(kept, isochrones):
+            output[k] = isochrone
+        return output
+
+    @profiled
+    def load_graph(self) -> Graph:
+        """Load the edge table described by the meta data, and the vertex
+        coordinates, into an in-memory graph, and register it as the 'local'
+        routing backend of get_routes and get_costs.
 
+        Returns:
+            The Graph, or None on database error.
+        """
         try:
-            self._cur.execute(sql, (start_vid, end_vid))
-            results = self._cur.fetchall()
+            with self._cursor(cursor_factory=None) as cur:
+                cur.execute(queries.edges(self._meta_data))
+                edges = cur.fetchall()
+                cur.execute(queries.vertices(self._meta_data))
+                vertices = cur.fetchall()
+        except psycopg2.Error as e:
+            print(e.pgerror)
+            return None
 
-            output = {}
-            key = (start_vid, end_vid)
-            for r in results:
-                # print r
-                if output.get(key, None) is None:
-                    output[key] = {'path': [], 'cost': 0}
+        edge_ids, sources, targets, costs, reverse_costs = (
+            np.array(column) for column in zip(*edges)) \
+            if edges else [np.empty(0)] * 5
+        vertex_ids, lons, lats = (
+            np.array(column) for column in zip(*vertices)) \
+            if vertices else [np.empty(0)] * 3
 
-                output[key]['path'].append(
-                    PgrNode(r['id1'], r['lon'], r['lat']))
-                if r['id2'] > 0:
-                    output[key]['cost'] += r['cost']
+        graph = Graph.from_edges(
+            edge_ids, sources, targets, costs, reverse_costs,
+            directed=self._meta_data['directed'],
+            vertex_ids=vertex_ids, lons=lons, lats=lats)
+        self._engines['local'] = graph
+        return graph
 
-            return output
+    def build_contraction_hierarchy(self, witness_settle_limit=500,
+                                    file=None) -> ContractionHierarchy:
+        """Preprocess the graph into Contraction Hierarchies, and register
+        them as the 'ch' routing backend of get_routes and get_costs.
+
+        The graph loaded by load_graph is used, and loaded if there is none.
+
+        Args:
+            witness_settle_limit: see ContractionHierarchy.build.
+            file: file to save the hierarchies to, which can be loaded by
+                load_contraction_hierarchy later.
+
+        Returns:
+            The ContractionHierarchy, or None on database error.
+        """
+        graph = self._engines.get('local') or self.load_graph()
+        if graph is None:
+            return None
+        ch = ContractionHierarchy.build(graph, witness_settle_limit,
+                                        meta_data=self._meta_data)
+        if file is not None:
+            ch.save(file)
+        self._engines['ch'] = ch
+        return ch
+
+    def load_contraction_hierarchy(self, file) -> ContractionHierarchy:
+        """Load Contraction Hierarchies saved by build_contraction_hierarchy
+        and register them as the 'ch' routing backend.
+
+        Raises ValueError if they were built with different meta data.
+        """
+        ch = ContractionHierarchy.load(file)
+        if ch.meta_data != self._meta_data:
+            raise ValueError("load_contraction_hierarchy: meta data {} "
+                             "differs from {}".format(ch.meta_data,
+                                                      self._meta_data))
+        self._engines['ch'] = ch
+        return ch
+
+    def build_alt(self, num_landmarks=16, file=None) -> ALT:
+        """Select landmarks on the graph and compute their distance tables
+        for bidirectional ALT searches, and register them as the 'alt'
+        routing backend of get_routes and get_costs.
+
+        ALT answers one-to-one queries in-process with no preprocessing
+        beyond two searches per landmark, so it is much cheaper to build
+        than Contraction Hierarchies. The graph loaded by load_graph is
+        used, and loaded if there is none.
 
+        Args:
+            num_landmarks: see ALT.build.
+            file: file to save the graph and tables to, which can be loaded
+                by load_alt later.
+
+        Returns:
+            The ALT, or None on database error.
+        """
+        graph = self._engines.get('local') or self.load_graph()
+        if graph is None:
+            return None
+        alt = ALT.build(graph, num_landmarks, meta_data=self._meta_data)
+        if file is not None:
+            alt.save(file)
+        self._engines['alt'] = alt
+        return alt
+
+    def load_alt(self, file) -> ALT:
+        """Load the landmarks saved by build_alt and register them as the
+        'alt' routing backend.
+
+        Raises ValueError if they were built with different meta data.
+        """
+        alt = ALT.load(file)
+        if alt.meta_data != self._meta_data:
+            raise ValueError("load_alt: meta data {} differs from {}".format(
+                alt.meta_data, self._meta_data))
+        self._engines['alt'] = alt
+        return alt
+
+    def _edge_signature(self):
+        """Signature of the edge table, see queries.edge_signature."""
+        with self._cursor() as cur:
+            cur.execute(queries.edge_signature(self._meta_data))
+            return {key: str(value) for key, value in cur.fetchone().items()}
+
+    @profiled
+    def save_graph_snapshot(self, file) -> Graph:
+        """Load the graph as load_graph does and save it to a snapshot file,
+        which processes open with load_graph_snapshot without querying the
+        edge table.
+
+        Returns:
+            The Graph, or None on database error.
+        """
+        try:
+            # taken before the graph, so that a change in between makes the
+            # snapshot look stale rather than fresh
+            signature = self._edge_signature()
         except psycopg2.Error as e:
             print(e.pgerror)
-            return {}
+            return None
+        graph = self.load_graph()
+        if graph is not None:
+            snapshot.save(graph, file, self._meta_data, signature)
+        return graph
+
+    @profiled
+    def load_graph_snapshot(self, file, verify=False,
+                            check_table=True) -> Graph:
+        """Open a snapshot saved by save_graph_snapshot and register its
+        graph as the 'local' routing backend.
+
+        The arrays are memory-mapped, so opening is nearly instant and the
+        pages are shared by all processes opening the same file. Searches
+        of the 'local' backend read them in place, so workers hold no copy
+        of the graph. Contraction Hierarchies built from it hold their own
+        arrays.
+
+        Args:
+            file: name of the snapshot file.
+            verify: check the checksums of the arrays, which reads the whole
+                file.
+            check_table: compare the signature of the edge table with the
+                one saved in the snapshot. It takes one aggregate query over
+                the table, which can be skipped by workers once a parent
+                process has checked.
+
+        Raises:
+            ValueError: the file is not a valid snapshot, was saved with
+                different meta data, or is stale.
+        """
+        snap = snapshot.load(file, verify)
+        if snap.meta_data != self._meta_data:
+            raise ValueError("load_graph_snapshot: meta data {} differs "
+                             "from {}".format(snap.meta_data,
+                                              self._meta_data))
+        if check_table:
+            try:
+                signature = self._edge_signature()
+            except psycopg2.Error as e:
+                print(e.pgerror)
+                return None
+            if signature != snap.signature:
+                raise ValueError("load_graph_snapshot: {} is stale, edge "
+                                 "table signature {} differs from {}".format(
+                                     file, snap.signature, signature))
+        self._engines['local'] = snap.graph
+        return snap.graph
+
+    def _engine(self, backend):
+        """Object computing dijkstra and dijkstra_cost for backend.
+
+        'pgrouting' is the database itself, other backends are in-process
+        engines loaded beforehand: 'local' by load_graph, 'ch' by
+        build_contraction_hierarchy or load_contraction_hierarchy, and 'alt'
+        by build_alt or load_alt.
+        """
+        if backend == 'pgrouting':
+            return self
+        engine = self._engines.get(backend)
+        if engine is None:
+            raise ValueError("backend {} is not loaded".format(backend))
+        return engine
+
+    def _snap_nodes(self, nodes, end_speed=10.0):
+        """Snap nodes to their nearest vertices on the way.
 
-    def _get_one_to_one_routing(self, start_node, end_node, end_speed=10.0):
+        Args:
+            nodes: list of PgrNode.
+            end_speed: speed from node to nearest vertex on way (unit: km/h)
+
+        Returns:
+            A dict mapping node to dict of its nearest vertex and the cost of
+            the access leg between them in second.
+        """
+        vertices = self.find_nearest_vertices(nodes)
+        distances = self.node_distances(nodes, vertices)
+        return self._build(_snap_output, nodes, vertices, distances,
+                           end_speed)
+
+    def _get_one_to_one_routing(self, start_node, end_node, end_speed=10.0,
+                                backend='pgrouting'):
         """Get one-to-one shorest path using A* algorithm.
 
         Args:
             start_node and end_node: PgrNode.
             end_speed: speed from node to nearest vertex on way (unit: km/h)
+            backend: 'pgrouting', or name of a loaded in-process engine.
 
         Returns:
             Routing dict with key (start_node, end_node), and path and cost
@@ -326,144 +1493,183 @@ class PGRouting(object):
         if start_node == end_node:
             return {}
 
-        end_speed = end_speed * 1000.0 / 3600.0  # km/h -> m/s
-        vertices = self.find_nearest_vertices([start_node, end_node])
-        node_vertex_costs = [
-            self.node_distance(start_node, vertices[0]) / end_speed,
-            self.node_distance(end_node, vertices[1]) / end_speed
-        ]
+        node_vertex = self._snap_nodes([start_node, end_node], end_speed)
+        start_vertex = node_vertex[start_node]['vertex']
+        end_vertex = node_vertex[end_node]['vertex']
 
         # routing between vertices
-        main_routing = self.astar(vertices[0].id, vertices[1].id)
-
-        routing = {
-            (start_node, end_node): {
-                'cost':
-                    main_routing[(vertices[0].id, vertices[1].id)]['cost']
-                    + node_vertex_costs[0]
-                    + node_vertex_costs[1],
-                'path':
-                    [start_node]
-                    + main_routing[(vertices[0].id, vertices[1].id)]['path']
-                    + [end_node]
-            }
-        }
-
-        return routing
+        engine = self._engine(backend)
+        if engine is self:
+            kind = self._route_kind(self._edge_geometry)
+            astar = lambda start_vids, end_vids: self.astar(start_vids[0],
+                                                            end_vids[0])
+        else:
+            kind, astar = self._route_kind(False), partial(
+                engine.dijkstra, compact=self._compact_paths)
+        main_routing = self._cached(kind, astar, [start_vertex.id],
+                                    [end_vertex.id])
+
+        return self._build(_pair_routings, [start_node], [end_node],
+                           node_vertex, main_routing, self._compact_paths,
+                           self._edge_geometry and engine is self)
+
+    def _all_pairs(self, kind, compute, start_vids, end_vids, tiling=None):
+        """Results of compute between vertices through the cache, split
+        into tiles computed in parallel if tiling is given.
+        """
+        compute = partial(self._cached, kind, compute)
+        if tiling is None:
+            return compute(start_vids, end_vids)
+        return tiling.run(self._in_call(compute), start_vids, end_vids)
 
     def _get_all_pairs_routings(self, start_nodes, end_nodes=None,
-                                end_speed=10.0):
+                                end_speed=10.0, backend='pgrouting',
+                                tiling=None):
         """Get all-pairs shortest paths from start_nodes to end_nodes with costs
         using Dijkstra algorithm.
 
         Args:
             start_nodes and end_nodes: lists of PgrNode.
             end_speed: speed from node to nearest vertex on way (unit: km/h)
+            backend: 'pgrouting', or name of a loaded in-process engine.
+            tiling: tiling.Tiling to compute tiles in parallel, or None.
 
         Returns:
             A dict with key (start_node, end_node), and path and cost in
             values. Cost is travelling time with unit second.
         """
 
-        end_speed = end_speed * 1000.0 / 3600.0  # km/h -> m/s
-
-        if end_nodes is not None:
-            node_set = set(start_nodes) | set(end_nodes)
-        else:
-            node_set = set(start_nodes)
-            end_nodes = start_nodes
+        node_list, end_nodes = _all_pairs_nodes(start_nodes, end_nodes)
+        node_vertex = self._snap_nodes(node_list, end_speed)
 
-        node_list = list(node_set)
-
-        vertices = self.find_nearest_vertices(node_list)
-        node_vertex = {
-            node: {
-                'vertex': vertex,
-                'cost': self.node_distance(node, vertex) / end_speed
-            }
-            for node, vertex in zip(node_list, vertices)
-        }
-
-        start_vids = [node_vertex[node]['vertex'].id for node in start_nodes]
-        end_vids = [node_vertex[node]['vertex'].id for node in end_nodes]
+        start_vids = _unique_vids(start_nodes, node_vertex)
+        end_vids = _unique_vids(end_nodes, node_vertex)
 
         # routings from vertices to vertices on ways
-        main_routings = self.dijkstra(start_vids, end_vids)
-
-        routings = {
-            (start_node, end_node): {
-                'cost':
-                    main_routings[(node_vertex[start_node]['vertex'].id,
-                                  node_vertex[end_node]['vertex'].id)]['cost']
-                    + node_vertex[start_node]['cost']
-                    + node_vertex[end_node]['cost'],
-                'path':
-                    [start_node]
-                    + main_routings[
-                        (node_vertex[start_node]['vertex'].id,
-                         node_vertex[end_node]['vertex'].id)
-                      ]['path']
-                    + [end_node]
-                }
-            for start_node in start_nodes
-            for end_node in end_nodes
-            if start_node != end_node
-        }
-
-        return routings
+        engine = self._engine(backend)
+        if engine is self:
+            kind = self._route_kind(self._edge_geometry)
+            dijkstra = self.dijkstra
+        else:
+            kind = self._route_kind(False)
+            dijkstra = partial(engine.dijkstra, compact=self._compact_paths)
+        main_routings = self._all_pairs(kind, dijkstra, start_vids, end_vids,
+                                        tiling)
+
+        return self._build(_pair_routings, start_nodes, end_nodes,
+                           node_vertex, main_routings, self._compact_paths,
+                           self._edge_geometry and engine is self)
 
     def _get_all_pairs_costs(self, start_nodes, end_nodes=None,
-                             end_speed=10.0):
+                             end_speed=10.0, backend='pgrouting',
+                             tiling=None):
         """Get all-pairs shortest paths' costs without path details.
 
         Args:
             start_nodes and end_nodes: lists of PgrNode. end_nodes is None
                 means it is the same as start_nodes.
             end_speed: speed from node to nearest vertex on way (unit: km/h).
+            backend: 'pgrouting', or name of a loaded in-process engine.
+            tiling: tiling.Tiling to compute tiles in parallel, or None.
 
         Returns:
             A dict with key (start_node, end_node), and values cost. Cost is
             travelling time in second.
         """
 
-        end_speed = end_speed*1000.0/3600.0  # km/h -> m/s
+        node_list, end_nodes = _all_pairs_nodes(start_nodes, end_nodes)
+        node_vertex = self._snap_nodes(node_list, end_speed)
+
+        start_vids = _unique_vids(start_nodes, node_vertex)
+        end_vids = _unique_vids(end_nodes, node_vertex)
+
+        # routings' costs from vertices to vertices on ways
+        main_costs = self._all_pairs(
+            'cost', self._engine(backend).dijkstra_cost, start_vids, end_vids,
+            tiling)
+
+        return self._build(_pair_costs, start_nodes, end_nodes, node_vertex,
+                           main_costs)
+
+    def _snap_pairs(self, pairs, end_speed=10.0):
+        """Snap the nodes of pairs of nodes.
+
+        Returns:
+            (node_vertex as _snap_nodes returns, list of the unique pairs of
+            distinct vertices to route between).
+        """
+        node_vertex = self._snap_nodes(
+            list({node for pair in pairs for node in pair}), end_speed)
+        vid_pairs = dict.fromkeys(
+            (node_vertex[start_node]['vertex'].id,
+             node_vertex[end_node]['vertex'].id)
+            for start_node, end_node in pairs)
+        return node_vertex, [pair for pair in vid_pairs
+                             if pair[0] != pair[1]]
+
+    @profiled
+    def get_routes_for_pairs(self, pairs, end_speed=10.0,
+                             backend='pgrouting', chunk_size=10000):
+        """Get shortest paths between given pairs of nodes only.
+
+        Unlike get_routes, which routes all start x end combinations, work
+        grows with the number of pairs. Pairs snapping to the same vertices
+        are routed once, and with pgrouting, pairs are sent chunk_size at a
+        time to the combinations SQL variant of pgr_dijkstra (pgRouting
+        3.1+).
+
+        Args:
+            pairs: list of (start_node, end_node) of PgrNode.
+            end_speed: speed for travelling from end node to corresponding
+                nearest node on the way.
+            backend: 'pgrouting', or name of a loaded in-process engine.
+            chunk_size: max number of vertex pairs per query.
 
-        if end_nodes is not None:
-            node_set = set(start_nodes) | set(end_nodes)
+        Returns:
+            A dict as get_routes returns, for the pairs with a path between
+            two different nodes.
+        """
+        node_vertex, vid_pairs = self._snap_pairs(pairs, end_speed)
+
+        engine = self._engine(backend)
+        if engine is self:
+            kind = self._route_kind(self._edge_geometry)
+            compute = partial(self.dijkstra_pairs, chunk_size=chunk_size)
         else:
-            node_set = set(start_nodes)
-            end_nodes = start_nodes
+            kind = self._route_kind(False)
+            compute = partial(_by_start, partial(
+                engine.dijkstra, compact=self._compact_paths))
+        main_routings = self._cached_pairs(kind, compute, vid_pairs)
 
-        node_list = list(node_set)
-        vertices = self.find_nearest_vertices(node_list)
-        node_vertex = {
-            node: {'vertex': vertex,
-                   'cost': self.node_distance(node, vertex) / end_speed}
-            for node, vertex in zip(node_list, vertices)
-        }
+        return self._build(_pairs_routings, pairs, node_vertex,
+                           main_routings, self._compact_paths,
+                           self._edge_geometry and engine is self)
 
-        start_vids = [node_vertex[node]['vertex'].id for node in start_nodes]
-        end_vids = [node_vertex[node]['vertex'].id for node in end_nodes]
+    @profiled
+    def get_costs_for_pairs(self, pairs, end_speed=10.0,
+                            backend='pgrouting', chunk_size=10000):
+        """Get costs between given pairs of nodes only, e.g. between each
+        order and its k nearest candidates. See get_routes_for_pairs.
 
-        # routings' costs from vertices to vertices on ways
-        main_costs = self.dijkstra_cost(start_vids, end_vids)
+        Returns:
+            A dict mapping the pairs (start_node, end_node) with a path
+            between two different nodes to their costs in second.
+        """
+        node_vertex, vid_pairs = self._snap_pairs(pairs, end_speed)
 
-        # total costs = main cost + two ends costs
-        costs = {
-            (start_node, end_node):
-            main_costs[(node_vertex[start_node]['vertex'].id,
-                       node_vertex[end_node]['vertex'].id)]
-            + node_vertex[start_node]['cost']
-            + node_vertex[end_node]['cost']
-            for start_node in start_nodes
-            for end_node in end_nodes
-            if start_node != end_node
-        }
+        engine = self._engine(backend)
+        if engine is self:
+            compute = partial(self.dijkstra_cost_pairs,
+                              chunk_size=chunk_size)
+        else:
+            compute = partial(_by_start, engine.dijkstra_cost)
+        main_costs = self._cached_pairs('cost', compute, vid_pairs)
 
-        return costs
+        return self._build(_pairs_costs, pairs, node_vertex, main_costs)
 
+    @profiled
     def get_routes(self, start_nodes, end_nodes, end_speed=10.0,
-                   gpx_file=None):
+                   gpx_file=None, backend='pgrouting', tiling=None):
         """Get shortest paths from nodes to nodes.
 
         Args:
@@ -472,6 +1678,12 @@ class PGRouting(object):
             end_speed: speed for travelling from end node to corresponding
                 nearest node on the way.
             gpx_file: name of file for saving the paths as gpx format.
+            backend: 'pgrouting' routes in the database. 'local' routes
+                in-process on the graph loaded by load_graph, 'ch' on the
+                Contraction Hierarchies built from it, and 'alt' with the
+                landmarks of build_alt, which suits one-to-one routing.
+            tiling: tiling.Tiling splitting many-to-many routing into tiles
+                computed in parallel, with progress and cancellation.
 
         Returns:
             A dict mapping node pair (start_node, end_node) to dict of
@@ -484,26 +1696,80 @@ class PGRouting(object):
         if not isinstance(end_nodes, list):
             end_nodes = [end_nodes]
 
-        routes = {}
+        # one-to-one
+        if len(start_nodes) == 1 and len(end_nodes) == 1:
+            routes = self._get_one_to_one_routing(
+                start_nodes[0], end_nodes[0], end_speed, backend)
 
-        # many-to-one or one-to-one
-        if len(end_nodes) == 1:
-            for start_node in start_nodes:
-                r = self._get_one_to_one_routing(
-                    start_node, end_nodes[0], end_speed)
-                routes.update(r)
-
-        # one-to-many or many-to-many
+        # many-to-one, one-to-many or many-to-many
         else:
             routes = self._get_all_pairs_routings(
-                start_nodes, end_nodes, end_speed)
+                start_nodes, end_nodes, end_speed, backend, tiling)
 
         if gpx_file is not None:
             self.get_gpx(routes, gpx_file)
 
         return routes
 
-    def get_costs(self, start_nodes, end_nodes, end_speed=10.0):
+    def iter_routes(self, start_nodes, end_nodes, end_speed=10.0,
+                    itersize=10000) -> Iterator:
+        """Stream shortest paths from nodes to nodes, one pair at a time.
+
+        Unlike get_routes, paths are not all held in memory: rows are read
+        from a server-side cursor itersize at a time, and each route is
+        yielded as soon as it is complete. In non-pooled mode the instance
+        is locked until the generator is exhausted or closed.
+
+        Args:
+            start_nodes: PgrNode list for many nodes, or PgrNode for one node.
+            end_nodes: PgrNode list for many nodes, or PgrNode for one node.
+            end_speed: speed for travelling from end node to corresponding
+                nearest node on the way.
+            itersize: number of rows fetched per round trip.
+
+        Yields:
+            (start_node, end_node, route), route is a dict of path and cost
+            as the values returned by get_routes.
+        """
+        if not isinstance(start_nodes, list):
+            start_nodes = [start_nodes]
+        if not isinstance(end_nodes, list):
+            end_nodes = [end_nodes]
+
+        node_list, end_nodes = _all_pairs_nodes(start_nodes, end_nodes)
+        node_vertex = self._snap_nodes(node_list, end_speed)
+
+        starts_of_vertex = {}
+        for node in dict.fromkeys(start_nodes):
+            starts_of_vertex.setdefault(
+                node_vertex[node]['vertex'].id, []).append(node)
+        ends_of_vertex = {}
+        for node in dict.fromkeys(end_nodes):
+            ends_of_vertex.setdefault(
+                node_vertex[node]['vertex'].id, []).append(node)
+
+        # pgr_dijkstra has no row for nodes snapped to the same vertex,
+        # which get_routes routes through that vertex
+        same_vertex = (
+            ((vid, vid), _same_vertex_routing(
+                node_vertex[nodes[0]]['vertex']))
+            for vid, nodes in starts_of_vertex.items()
+            if vid in ends_of_vertex)
+        for (start_vid, end_vid), routing in chain(
+                same_vertex, self.iter_dijkstra(
+                    list(starts_of_vertex), list(ends_of_vertex), itersize)):
+            for start_node in starts_of_vertex[start_vid]:
+                for end_node in ends_of_vertex[end_vid]:
+                    if start_node == end_node:
+                        continue
+                    yield start_node, end_node, _pair_routing(
+                        routing, start_node, end_node,
+                        node_vertex[start_node]['cost']
+                        + node_vertex[end_node]['cost'])
+
+    @profiled
+    def get_costs(self, start_nodes, end_nodes, end_speed=10.0,
+                  backend='pgrouting', tiling=None):
         """Get costs from nodes to nodes without paths.
 
         Args:
@@ -511,6 +1777,12 @@ class PGRouting(object):
             end_nodes: PgrNode list for many nodes, or PgrNode for one node.
             end_speed: speed for travelling from end node to corresponding
                 nearest node on the way.
+            backend: 'pgrouting' routes in the database. 'local' routes
+                in-process on the graph loaded by load_graph, 'ch' on the
+                Contraction Hierarchies built from it, and 'alt' with the
+                landmarks of build_alt, which suits one-to-one routing.
+            tiling: tiling.Tiling splitting many-to-many routing into tiles
+                computed in parallel, with progress and cancellation.
 
         Returns:
             A dict mapping all node pairs (start_node, end_node) to
@@ -522,23 +1794,132 @@ class PGRouting(object):
         if not isinstance(end_nodes, list):
             end_nodes = [end_nodes]
 
-        output = {}
-        # many-to-one or one-to-one
-        if len(end_nodes) == 1:
-            for start_node in start_nodes:
-                routing = self._get_one_to_one_routing(
-                    start_node, end_nodes[0], end_speed)
-                for k, v in routing.items():
-                    output.update({k: v['cost']})
-            return output
+        # one-to-one with A* in the database, in-process engines compute
+        # the cost alone with dijkstra_cost below
+        if len(start_nodes) == 1 and len(end_nodes) == 1 \
+                and backend == 'pgrouting':
+            routing = self._get_one_to_one_routing(
+                start_nodes[0], end_nodes[0], end_speed)
+            return {k: v['cost'] for k, v in routing.items()}
+
+        return self._get_all_pairs_costs(start_nodes, end_nodes, end_speed,
+                                         backend, tiling)
+
+    @profiled
+    def get_cost_matrix(self, start_nodes, end_nodes, end_speed=10.0,
+                        backend='pgrouting') -> CostMatrix:
+        """Get costs from nodes to nodes as a dense NumPy matrix.
 
-        return self._get_all_pairs_costs(start_nodes, end_nodes, end_speed)
+        Much more compact than the dict of get_costs for large matrices.
+        Each unique vertex the nodes snap to is routed once.
 
+        Args:
+            start_nodes: PgrNode list.
+            end_nodes: PgrNode list.
+            end_speed: speed for travelling from end node to corresponding
+                nearest node on the way.
+            backend: 'pgrouting', or name of a loaded in-process engine.
+
+        Returns:
+            CostMatrix, whose costs[i, j] is the cost from start_nodes[i] to
+            end_nodes[j] in second: np.inf and reachable[i, j] False if
+            there is no path, 0 if the two nodes are the same.
+        """
+        node_list, end_nodes = _all_pairs_nodes(start_nodes, end_nodes)
+        node_vertex = self._snap_nodes(node_list, end_speed)
+
+        start_vids = np.array(
+            [node_vertex[node]['vertex'].id for node in start_nodes],
+            dtype=np.int64)
+        end_vids = np.array(
+            [node_vertex[node]['vertex'].id for node in end_nodes],
+            dtype=np.int64)
+        unique_starts, start_inverse = np.unique(start_vids,
+                                                 return_inverse=True)
+        unique_ends, end_inverse = np.unique(end_vids, return_inverse=True)
+
+        if backend == 'pgrouting':
+            main_costs = self.dijkstra_cost_matrix(unique_starts, unique_ends)
+        else:
+            main_costs = np.full((len(unique_starts), len(unique_ends)),
+                                 np.inf)
+            main_costs[unique_starts[:, None] == unique_ends[None, :]] = 0.0
+            costs = self._engine(backend).dijkstra_cost(
+                unique_starts.tolist(), unique_ends.tolist())
+            for (start_vid, end_vid), cost in costs.items():
+                main_costs[np.searchsorted(unique_starts, start_vid),
+                           np.searchsorted(unique_ends, end_vid)] = cost
+        if main_costs is None:
+            return None
+
+        # total costs = main cost + two ends costs
+        costs = (main_costs[start_inverse][:, end_inverse]
+                 + np.array([node_vertex[node]['cost']
+                             for node in start_nodes])[:, None]
+                 + np.array([node_vertex[node]['cost']
+                             for node in end_nodes])[None, :])
+        end_positions = {}
+        for j, node in enumerate(end_nodes):
+            end_positions.setdefault(node, []).append(j)
+        for i, node in enumerate(start_nodes):
+            costs[i, end_positions.get(node, [])] = 0.0
+
+        return CostMatrix(costs, np.isfinite(costs), start_vids, end_vids)
+
+    @profiled
+    def get_isochrones(self, nodes, max_costs, end_speed=10.0,
+                       equicost=False, hull=None):
+        """Get the way nodes reachable from nodes within costs.
+
+        Much cheaper than thresholding get_costs against a dense grid of
+        points: nodes are snapped in one pass and all isochrones come from a
+        single multi-start pgr_drivingDistance query.
+
+        Args:
+            nodes: PgrNode list of centers, or PgrNode for one center.
+            max_costs: list of the maximum cost from each node, or one
+                maximum cost for all (unit: second). The access leg from a
+                node to its nearest vertex is taken from its budget.
+            end_speed: speed for travelling from a node to its nearest node
+                on the way.
+            equicost: reach each vertex only from the center nearest to it,
+                splitting the network into service areas.
+            hull: None, or the target percent of ST_ConcaveHull in (0, 1]
+                to compute the concave hull of the vertices of each node
+                too. 1.0 is the convex hull.
+
+        Returns:
+            A dict mapping node to Isochrone, whose costs are from the node
+            in second, or None on database error.
+        """
+        if not isinstance(nodes, list):
+            nodes = [nodes]
+        if np.ndim(max_costs) == 0:
+            max_costs = [max_costs] * len(nodes)
+
+        node_vertex = self._snap_nodes(list(set(nodes)), end_speed)
+        start_vids = [node_vertex[node]['vertex'].id for node in nodes]
+        access_costs = [node_vertex[node]['cost'] for node in nodes]
+        budgets = [max_cost - access_cost
+                   for max_cost, access_cost in zip(max_costs, access_costs)]
+
+        isochrones = self.driving_distance(start_vids, budgets, equicost,
+                                           hull)
+        if isochrones is None:
+            return None
+        return self._build(_isochrones_output, nodes, access_costs,
+                           isochrones)
+
+    @profiled
     def get_gpx(self, routes, gpx_file=None):
         """Get gpx representation of routes.
 
+        To write large route sets without holding the document in memory,
+        use write_routes.
+
         Args:
-            routes: routes returned by get_routes.
+            routes: routes returned by get_routes, or an iterable of
+                (start_node, end_node, route) such as iter_routes returns.
             gpx_file: name of file for saving gpx data.
 
         Returns:
@@ -546,33 +1927,9 @@ class PGRouting(object):
             specified.
         """
 
-        output = ''
-        output += "<?xml version='1.0'?>\n"
-        output += ("<gpx version='1.1' creator='psycopgr' "
-                   "xmlns='http://www.topografix.com/GPX/1/1' "
-                   "xmlns:xsi='http://www.w3.org/2001/XMLSchema-instance' "
-                   "xsi:schemaLocation='http://www.topografix.com/GPX/1/1 "
-                   "http://www.topografix.com/GPX/1/1/gpx.xsd'>\n")
-
-        for key, value in routes.items():
-            output = output + " <trk>\n"
-            output = output + "  <name>{},{}->{},{}: {}</name>\n".format(
-                              key[0].lon,
-                              key[0].lat,
-                              key[1].lon,
-                              key[1].lat,
-                              value.get('cost', None))
-            output = output + "  <trkseg>\n"
-
-            for node in value['path']:
-                # print(node)
-                output = output + "   <trkpt lat='{}' lon='{}'>\n".format(
-                                  node.lat,
-                                  node.lon)
-                output = output + "   </trkpt>\n"
-            output = output + "  </trkseg>\n  </trk>\n"
-
-        output = output + "</gpx>\n"
+        buffer = io.StringIO()
+        export.write_gpx(routes, buffer)
+        output = buffer.getvalue()
 
         if gpx_file is not None:
             with open(gpx_file, "w") as f:
@@ -580,3 +1937,17 @@ class PGRouting(object):
             print("gpx saved to {}".format(gpx_file))
 
         return output
+
+    @profiled
+    def write_routes(self, routes, file, format='gpx'):
+        """Write routes to a file incrementally, one route at a time.
+
+        Args:
+            routes: routes returned by get_routes, or an iterable of
+                (start_node, end_node, route) such as iter_routes returns,
+                which is consumed as it is written.
+            file: name of the file, or a file-like object to write to.
+            format: 'gpx', 'geojson' (a FeatureCollection of LineStrings),
+                or 'polyline' (JSON lines with Google encoded polylines).
+        """
+        export.write_routes(routes, file, format)
@@ -0,0 +1,590 @@
+"""SQL templates of the routing queries.
+
+The templates are shared by PGRouting and AsyncPGRouting so that the two
+clients cannot drift. Each query function takes the edge table meta data,
+the placeholders of the query arguments, and the sql module of the driver
+(psycopg2.sql or psycopg.sql, which have the same interface), and returns
+a composed query. Table and column names are quoted as identifiers.
+
+The pgRouting functions take the SQL selecting edges as their first
+argument, which is passed as a query argument too (see EDGES), so the
+composed query does not change with it and can be prepared once.
+"""
+from collections import namedtuple
+
+import psycopg2.sql
+
+
+def _bool(value, sql):
+    return sql.SQL('TRUE' if value else 'FALSE')
+
+
+def _table(meta_data, sql, suffix=''):
+    """Identifier of the edge table, or of its vertex table with suffix
+    '_vertices_pgr'. The table may be qualified by schema.
+    """
+    parts = meta_data['table'].split('.')
+    parts[-1] += suffix
+    return sql.Identifier(*parts)
+
+
+def _columns(meta_data, sql, *keys):
+    return {key: sql.Identifier(meta_data[key]) for key in keys}
+
+
+def edges(meta_data, sql=psycopg2.sql, where=None):
+    """Edges SQL of pgr_dijkstra and pgr_dijkstraCost.
+
+    Columns: id, source, target, cost, reverse_cost.
+
+    Args:
+        where: WHERE clause filtering edges, e.g. by bbox.
+    """
+    return sql.SQL("""
+        SELECT {id} as id,
+               {source} as source,
+               {target} as target,
+               {cost} as cost,
+               {reverse_cost} as reverse_cost
+        FROM {table}{where}""").format(
+            table=_table(meta_data, sql),
+            where=where if where is not None else sql.SQL(''),
+            **_columns(meta_data, sql, 'id', 'source', 'target', 'cost',
+                       'reverse_cost'))
+
+
+def astar_edges(meta_data, sql=psycopg2.sql, where=None):
+    """Edges SQL of pgr_aStar: those of edges plus the coordinates of the
+    ends of each edge, x1, y1, x2, y2. See edges for where.
+    """
+    return sql.SQL("""
+        SELECT {id} as id,
+               {source} as source,
+               {target} as target,
+               {cost} as cost,
+               {reverse_cost} as reverse_cost,
+               {x1} as x1,
+               {y1} as y1,
+               {x2} as x2,
+               {y2} as y2
+        FROM {table}{where}""").format(
+            table=_table(meta_data, sql),
+            where=where if where is not None else sql.SQL(''),
+            **_columns(meta_data, sql, 'id', 'source', 'target', 'cost',
+                       'reverse_cost', 'x1', 'y1', 'x2', 'y2'))
+
+
+def bbox(meta_data, vids, margin, sql=psycopg2.sql):
+    """WHERE clause of the edges SQL keeping edges whose geometry overlaps
+    the bounding box of vertices vids, expanded by margin in units of the
+    srid (degrees for 4326). Overlap is tested by the && operator, which
+    uses the spatial index of the geometry column.
+    """
+    return sql.SQL("""
+        WHERE {geometry} && (
+            SELECT ST_Expand(ST_Envelope(ST_Collect(the_geom)), {margin})
+            FROM {vertex_table}
+            WHERE id = ANY({vids}::BIGINT[]))""").format(
+        geometry=sql.Identifier(meta_data['geometry']),
+        vertex_table=_table(meta_data, sql, '_vertices_pgr'),
+        vids=sql.Literal([int(vid) for vid in vids]),
+        margin=sql.Literal(float(margin)))
+
+
+def combinations(pairs, sql=psycopg2.sql):
+    """Combinations SQL of pgr_dijkstra and pgr_dijkstraCost selecting pairs
+    of vertex ids (start_vid, end_vid).
+
+    Columns: source, target.
+    """
+    return sql.SQL("""
+        SELECT *
+        FROM unnest({}::BIGINT[], {}::BIGINT[]) AS c(source, target)
+        """).format(sql.Literal([int(pair[0]) for pair in pairs]),
+                    sql.Literal([int(pair[1]) for pair in pairs]))
+
+
+def triangle(start_vids, end_vids, sql=psycopg2.sql):
+    """Combinations SQL of start_vids x end_vids on an undirected graph: of
+    each two pairs (u, v) and (v, u) of vertices both in start_vids and
+    end_vids, only the one with u < v is kept, and other pairs are kept as
+    they are. Every source is a start vertex, so pgRouting runs no more
+    searches than on the arrays. Pairs of the same vertex are left out.
+
+    Columns: source, target.
+    """
+    starts = dict.fromkeys(int(vid) for vid in start_vids)
+    ends = dict.fromkeys(int(vid) for vid in end_vids)
+    common = [vid for vid in starts if vid in ends]
+    return sql.SQL("""
+        SELECT s AS source, t AS target
+        FROM unnest({0}::BIGINT[]) AS s, unnest({0}::BIGINT[]) AS t
+        WHERE s < t
+        UNION ALL
+        SELECT s, t FROM unnest({1}::BIGINT[]) AS s, unnest({2}::BIGINT[]) AS t
+        UNION ALL
+        SELECT s, t FROM unnest({0}::BIGINT[]) AS s, unnest({3}::BIGINT[]) AS t
+        """).format(sql.Literal(common),
+                    sql.Literal([vid for vid in starts if vid not in ends]),
+                    sql.Literal(list(ends)),
+                    sql.Literal([vid for vid in ends if vid not in starts]))
+
+
+def vertices(meta_data, sql=psycopg2.sql):
+    """Columns: id, lon, lat."""
+    return sql.SQL("""
+        SELECT id, lon::double precision, lat::double precision
+        FROM {table}""").format(
+            table=_table(meta_data, sql, '_vertices_pgr'))
+
+
+def edge_signature(meta_data, sql=psycopg2.sql):
+    """Columns: edges, vertices (counts), and sums of edge ids, sources,
+    targets, and costs and reverse costs in thousandths, which change with
+    almost any change of the tables. Sums are exact and do not depend on the
+    order of rows.
+    """
+    return sql.SQL("""
+        SELECT count(*) AS edges,
+               (SELECT count(*) FROM {vertex_table}) AS vertices,
+               sum({id}) AS ids,
+               sum({source}) AS sources,
+               sum({target}) AS targets,
+               sum(round({cost} * 1000)::BIGINT) AS costs,
+               sum(round({reverse_cost} * 1000)::BIGINT) AS reverse_costs
+        FROM {table}""").format(
+            table=_table(meta_data, sql),
+            vertex_table=_table(meta_data, sql, '_vertices_pgr'),
+            **_columns(meta_data, sql, 'id', 'source', 'target', 'cost',
+                       'reverse_cost'))
+
+
+def _change_names(meta_data, sql):
+    """Identifiers of the delta table, trigger function and trigger of the
+    change feed of the edge table.
+    """
+    return {'changes': _table(meta_data, sql, '_changes'),
+            'function': _table(meta_data, sql, '_changes_notify'),
+            'trigger': sql.Identifier(
+                meta_data['table'].split('.')[-1] + '_changes_trigger')}
+
+
+def install_changes(meta_data, channel, sql=psycopg2.sql):
+    """Create the delta table of cost changes of the edge table, and the
+    trigger filling it and notifying channel on each update of costs.
+    """
+    return sql.SQL("""
+        CREATE TABLE IF NOT EXISTS {changes} (
+            seq BIGSERIAL PRIMARY KEY,
+            edge BIGINT NOT NULL,
+            source BIGINT NOT NULL,
+            target BIGINT NOT NULL,
+            old_cost DOUBLE PRECISION,
+            old_reverse_cost DOUBLE PRECISION,
+            cost DOUBLE PRECISION,
+            reverse_cost DOUBLE PRECISION,
+            changed_at TIMESTAMPTZ NOT NULL DEFAULT clock_timestamp());
+        CREATE OR REPLACE FUNCTION {function}() RETURNS trigger
+        LANGUAGE plpgsql AS $$
+        BEGIN
+            INSERT INTO {changes} (edge, source, target, old_cost,
+                                   old_reverse_cost, cost, reverse_cost)
+            VALUES (NEW.{id}, NEW.{source}, NEW.{target}, OLD.{cost},
+                    OLD.{reverse_cost}, NEW.{cost}, NEW.{reverse_cost});
+            PERFORM pg_notify({channel}, '');
+            RETURN NULL;
+        END $$;
+        DROP TRIGGER IF EXISTS {trigger} ON {table};
+        CREATE TRIGGER {trigger}
+            AFTER UPDATE OF {cost}, {reverse_cost} ON {table}
+            FOR EACH ROW
+            WHEN (OLD.{cost} IS DISTINCT FROM NEW.{cost}
+                  OR OLD.{reverse_cost} IS DISTINCT FROM NEW.{reverse_cost})
+            EXECUTE PROCEDURE {function}();
+        """).format(table=_table(meta_data, sql),
+                    channel=sql.Literal(channel),
+                    **_change_names(meta_data, sql),
+                    **_columns(meta_data, sql, 'id', 'source', 'target',
+                               'cost', 'reverse_cost'))
+
+
+def uninstall_changes(meta_data, sql=psycopg2.sql):
+    """Drop what install_changes creates."""
+    return sql.SQL("""
+        DROP TRIGGER IF EXISTS {trigger} ON {table};
+        DROP FUNCTION IF EXISTS {function}();
+        DROP TABLE IF EXISTS {changes};
+        """).format(table=_table(meta_data, sql),
+                    **_change_names(meta_data, sql))
+
+
+def changes(meta_data, params, sql=psycopg2.sql):
+    """Args: last seq read.
+
+    Columns: those of the delta table of install_changes after the last
+    seq, in order, and lag_s, the seconds since the change.
+    """
+    return sql.SQL("""
+        SELECT *, extract(epoch FROM clock_timestamp() - changed_at)
+                  ::double precision AS lag_s
+        FROM {changes}
+        WHERE seq > {0}
+        ORDER BY seq
+        """).format(*params, **_change_names(meta_data, sql))
+
+
+def prune_changes(meta_data, params, sql=psycopg2.sql):
+    """Args: seconds. Delete changes older than that from the delta table.
+    """
+    return sql.SQL("""
+        DELETE FROM {changes}
+        WHERE changed_at < clock_timestamp() - {0} * interval '1 second'
+        """).format(*params, **_change_names(meta_data, sql))
+
+
+def last_change(meta_data, sql=psycopg2.sql):
+    """Columns: seq, the last seq of the delta table, 0 if empty."""
+    return sql.SQL(
+        "SELECT coalesce(max(seq), 0) AS seq FROM {changes}").format(
+            **_change_names(meta_data, sql))
+
+
+def nearest_vertices(meta_data, params, sql=psycopg2.sql):
+    """Args: array of longitudes, array of latitudes.
+
+    Columns: idx (1-based position in the arrays), id, lon, lat.
+    """
+    return sql.SQL("""
+        SELECT q.idx, v.id, v.lon, v.lat
+        FROM unnest({0}::double precision[], {1}::double precision[])
+             WITH ORDINALITY AS q(lon, lat, idx)
+        CROSS JOIN LATERAL (
+            SELECT id, lon::double precision, lat::double precision
+            FROM {table}
+            ORDER BY the_geom <-> ST_SetSRID(ST_Point(q.lon, q.lat),{srid})
+            LIMIT 1
+        ) AS v
+        """).format(*params,
+                    table=_table(meta_data, sql, '_vertices_pgr'),
+                    srid=sql.Literal(meta_data['srid']))
+
+
+def node_distances(meta_data, params, sql=psycopg2.sql):
+    """Args: arrays of lon1, lat1, lon2 and lat2.
+
+    Columns: distance (unit: m), in the order of the arrays.
+    """
+    return sql.SQL("""
+        SELECT ST_Distance(
+            ST_Transform(ST_SetSRID(ST_Point(q.lon1, q.lat1), {srid}),
+                         4326)::geography,
+            ST_Transform(ST_SetSRID(ST_Point(q.lon2, q.lat2), {srid}),
+                         4326)::geography,
+            false) AS distance
+        FROM unnest({0}::double precision[], {1}::double precision[],
+                    {2}::double precision[], {3}::double precision[])
+             WITH ORDINALITY AS q(lon1, lat1, lon2, lat2, idx)
+        ORDER BY q.idx
+        """).format(*params, srid=sql.Literal(meta_data['srid']))
+
+
+def dijkstra_cost(meta_data, params, sql=psycopg2.sql):
+    """Args: edges SQL, array of start vids, array of end vids.
+
+    Columns: start_vid, end_vid, agg_cost.
+    """
+    return sql.SQL("""
+        SELECT start_vid, end_vid, agg_cost
+        FROM pgr_dijkstraCost(
+            {0}::TEXT,
+            {1}::BIGINT[],
+            {2}::BIGINT[],
+            {directed})
+        """).format(*params, directed=_bool(meta_data['directed'], sql))
+
+
+def dijkstra(meta_data, params, sql=psycopg2.sql):
+    """Args: edges SQL, array of start vids, array of end vids.
+
+    Columns: those of pgr_dijkstra, plus lon and lat of node.
+    """
+    return sql.SQL("""
+        SELECT r.*, v.lon::double precision, v.lat::double precision
+        FROM
+            pgr_dijkstra(
+                {0}::TEXT,
+                {1}::BIGINT[],
+                {2}::BIGINT[],
+                {directed}) as r,
+            {vertex_table} as v
+        WHERE r.node=v.id
+        ORDER BY r.seq
+        """).format(*params,
+                    vertex_table=_table(meta_data, sql, '_vertices_pgr'),
+                    directed=_bool(meta_data['directed'], sql))
+
+
+def dijkstra_cost_pairs(meta_data, params, sql=psycopg2.sql):
+    """Args: edges SQL, combinations SQL.
+
+    Columns: those of dijkstra_cost, for the pairs of combinations only.
+    """
+    return sql.SQL("""
+        SELECT start_vid, end_vid, agg_cost
+        FROM pgr_dijkstraCost(
+            {0}::TEXT,
+            {1}::TEXT,
+            {directed})
+        """).format(*params, directed=_bool(meta_data['directed'], sql))
+
+
+def dijkstra_pairs(meta_data, params, sql=psycopg2.sql):
+    """Args: edges SQL, combinations SQL.
+
+    Columns: those of dijkstra, for the pairs of combinations only.
+    """
+    return sql.SQL("""
+        SELECT r.*, v.lon::double precision, v.lat::double precision
+        FROM
+            pgr_dijkstra(
+                {0}::TEXT,
+                {1}::TEXT,
+                {directed}) as r,
+            {vertex_table} as v
+        WHERE r.node=v.id
+        ORDER BY r.seq
+        """).format(*params,
+                    vertex_table=_table(meta_data, sql, '_vertices_pgr'),
+                    directed=_bool(meta_data['directed'], sql))
+
+
+def astar(meta_data, params, sql=psycopg2.sql):
+    """Args: edges SQL, start vid, end vid.
+
+    Columns: those of pgr_aStar, plus lon and lat of node.
+    """
+    return sql.SQL("""
+        SELECT r.*, v.lon::double precision, v.lat::double precision
+        FROM
+            pgr_aStar(
+                {0}::TEXT,
+                {1}::BIGINT,
+                {2}::BIGINT,
+                {directed}) as r,
+            {vertex_table} as v
+        WHERE r.node=v.id
+        ORDER BY r.seq
+        """).format(*params,
+                    vertex_table=_table(meta_data, sql, '_vertices_pgr'),
+                    directed=_bool(meta_data['directed'], sql))
+
+
+def _edge_geometry(meta_data, sql, node, edge):
+    """Column geometry of the WKB of the edge of each result row r, in the
+    direction it is traversed from r.node, and the join of the edge table
+    providing it. Rows without edge (the last of a path) get NULL.
+    """
+    column = sql.SQL("""
+        ST_AsBinary(CASE WHEN e.{source} = r.{node} THEN e.{geometry}
+                         ELSE ST_Reverse(e.{geometry}) END) AS geometry
+        """).format(node=sql.Identifier(node),
+                    **_columns(meta_data, sql, 'source', 'geometry'))
+    join = sql.SQL("LEFT JOIN {table} AS e ON r.{edge} = e.{id}").format(
+        table=_table(meta_data, sql), edge=sql.Identifier(edge),
+        **_columns(meta_data, sql, 'id'))
+    return column, join
+
+
+def dijkstra_geometry(meta_data, params, sql=psycopg2.sql):
+    """Args: edges SQL, array of start vids, array of end vids.
+
+    Columns: those of dijkstra, plus geometry, the WKB of the edge of the
+    row oriented from node to the next node.
+    """
+    column, join = _edge_geometry(meta_data, sql, 'node', 'edge')
+    return sql.SQL("""
+        SELECT r.*, v.lon::double precision, v.lat::double precision,
+        {column}
+        FROM
+            pgr_dijkstra(
+                {0}::TEXT,
+                {1}::BIGINT[],
+                {2}::BIGINT[],
+                {directed}) as r
+            JOIN {vertex_table} as v ON r.node=v.id
+            {join}
+        ORDER BY r.seq
+        """).format(*params, column=column, join=join,
+                    vertex_table=_table(meta_data, sql, '_vertices_pgr'),
+                    directed=_bool(meta_data['directed'], sql))
+
+
+def dijkstra_geometry_pairs(meta_data, params, sql=psycopg2.sql):
+    """Args: edges SQL, combinations SQL.
+
+    Columns: those of dijkstra_geometry, for the pairs of combinations only.
+    """
+    column, join = _edge_geometry(meta_data, sql, 'node', 'edge')
+    return sql.SQL("""
+        SELECT r.*, v.lon::double precision, v.lat::double precision,
+        {column}
+        FROM
+            pgr_dijkstra(
+                {0}::TEXT,
+                {1}::TEXT,
+                {directed}) as r
+            JOIN {vertex_table} as v ON r.node=v.id
+            {join}
+        ORDER BY r.seq
+        """).format(*params, column=column, join=join,
+                    vertex_table=_table(meta_data, sql, '_vertices_pgr'),
+                    directed=_bool(meta_data['directed'], sql))
+
+
+def astar_geometry(meta_data, params, sql=psycopg2.sql):
+    """Args: edges SQL, start vid, end vid.
+
+    Columns: those of astar, plus geometry, the WKB of the edge of the row
+    oriented from node to the next node.
+    """
+    column, join = _edge_geometry(meta_data, sql, 'node', 'edge')
+    return sql.SQL("""
+        SELECT r.*, v.lon::double precision, v.lat::double precision,
+        {column}
+        FROM
+            pgr_aStar(
+                {0}::TEXT,
+                {1}::BIGINT,
+                {2}::BIGINT,
+                {directed}) as r
+            JOIN {vertex_table} as v ON r.node=v.id
+            {join}
+        ORDER BY r.seq
+        """).format(*params, column=column, join=join,
+                    vertex_table=_table(meta_data, sql, '_vertices_pgr'),
+                    directed=_bool(meta_data['directed'], sql))
+
+
+def _driving_distance(meta_data, params, sql, hull):
+    """Isochrones of centers from a single multi-start pgr_drivingDistance
+    run to the largest budget, each cut to the budget of its center.
+    Arguments appear in the query in their order, as %s placeholders of
+    the unprepared query are positional.
+    """
+    hull_cte, hull_column, hull_join = sql.SQL(''), sql.SQL(''), sql.SQL('')
+    if hull:
+        # the hull is sent on one row of each center only
+        hull_cte = sql.SQL(""",
+        h AS (
+            SELECT r.idx,
+                   ST_AsBinary(ST_ConcaveHull(ST_Collect(v.the_geom),
+                                              {4}::double precision))
+                   AS hull
+            FROM r JOIN {vertex_table} AS v ON r.node = v.id
+            GROUP BY r.idx)""").format(
+                *params, vertex_table=_table(meta_data, sql, '_vertices_pgr'))
+        hull_column = sql.SQL(""",
+               CASE WHEN row_number() OVER (PARTITION BY r.idx) = 1
+                    THEN h.hull END AS hull""")
+        hull_join = sql.SQL("LEFT JOIN h ON r.idx = h.idx")
+    return sql.SQL("""
+        WITH e AS (
+            SELECT {0}::TEXT AS edges),
+        b AS (
+            SELECT *
+            FROM unnest({1}::BIGINT[], {2}::double precision[])
+                 WITH ORDINALITY AS b(vid, budget, idx)),
+        r AS (
+            SELECT b.idx, d.node, d.agg_cost
+            FROM pgr_drivingDistance(
+                (SELECT edges FROM e),
+                (SELECT array_agg(DISTINCT vid) FROM b),
+                (SELECT max(budget) FROM b),
+                {directed},
+                {3}::BOOLEAN) AS d
+            JOIN b ON d.from_v = b.vid AND d.agg_cost <= b.budget){hull_cte}
+        SELECT r.idx, r.node, r.agg_cost,
+               v.lon::double precision, v.lat::double precision{hull_column}
+        FROM r JOIN {vertex_table} AS v ON r.node = v.id
+        {hull_join}
+        ORDER BY r.idx, r.agg_cost
+        """).format(*params, hull_cte=hull_cte, hull_column=hull_column,
+                    hull_join=hull_join,
+                    vertex_table=_table(meta_data, sql, '_vertices_pgr'),
+                    directed=_bool(meta_data['directed'], sql))
+
+
+def driving_distance(meta_data, params, sql=psycopg2.sql):
+    """Args: edges SQL, array of the start vids of centers, array of their
+    budgets of cost, equicost (each vertex is only reached from its nearest
+    start vid).
+
+    Columns: idx (1-based position of the center in the arrays), node,
+    agg_cost, lon and lat of node, ordered by idx and agg_cost.
+    """
+    return _driving_distance(meta_data, params, sql, hull=False)
+
+
+def driving_distance_hull(meta_data, params, sql=psycopg2.sql):
+    """Args: those of driving_distance, and the target percent of the area
+    of the convex hull that ST_ConcaveHull shrinks to.
+
+    Columns: those of driving_distance, plus hull, the WKB of the concave
+    hull of the vertices of the center on one of its rows, NULL on others.
+    """
+    return _driving_distance(meta_data, params, sql, hull=True)
+
+
+# query function, number of arguments, and function of the edges SQL which
+# is the first argument (None if there is none)
+Template = namedtuple('Template', ['query', 'num_params', 'edges'])
+
+TEMPLATES = {
+    'nearest_vertices': Template(nearest_vertices, 2, None),
+    'node_distances': Template(node_distances, 4, None),
+    'dijkstra_cost': Template(dijkstra_cost, 3, edges),
+    'dijkstra': Template(dijkstra, 3, edges),
+    'astar': Template(astar, 3, astar_edges),
+    'dijkstra_geometry': Template(dijkstra_geometry, 3, edges),
+    'astar_geometry': Template(astar_geometry, 3, astar_edges),
+    'dijkstra_cost_pairs': Template(dijkstra_cost_pairs, 2, edges),
+    'dijkstra_pairs': Template(dijkstra_pairs, 2, edges),
+    'dijkstra_geometry_pairs': Template(dijkstra_geometry_pairs, 2, edges),
+    'driving_distance': Template(driving_distance, 4, edges),
+    'driving_distance_hull': Template(driving_distance_hull, 5, edges),
+}
+
+
+# A template compiled for one meta data: query with %s placeholders,
+# PREPARE and EXECUTE statements of it, and the default edges SQL text
+Statement = namedtuple('Statement',
+                       ['query', 'prepare', 'execute', 'edges'])
+
+
+def compile_statement(name, meta_data, prefix, context, sql=psycopg2.sql):
+    """Compile template name to a Statement.
+
+    Args:
+        name: key of TEMPLATES.
+        meta_data: edge table meta data.
+        prefix: prefix of the name of the prepared statement, which must
+            differ between meta data.
+        context: connection used to quote identifiers and literals.
+        sql: sql module of the driver.
+    """
+    template = TEMPLATES[name]
+    statement = '{}_{}'.format(prefix, name)
+    query = template.query(meta_data, [sql.Placeholder()] * template.num_params,
+                           sql)
+    numbered = [sql.SQL('${}'.format(i + 1))
+                for i in range(template.num_params)]
+    prepare = sql.SQL('PREPARE {} AS {}').format(
+        sql.Identifier(statement),
+        template.query(meta_data, numbered, sql))
+    execute = sql.SQL('EXECUTE {} ({})').format(
+        sql.Identifier(statement),
+        sql.SQL(', ').join([sql.Placeholder()] * template.num_params))
+    edges_sql = template.edges(meta_data, sql).as_string(context) \
+        if template.edges is not None else None
+    return Statement(query.as_string(context), prepare.as_string(context),
+                     execute.as_string(context), edges_sql)
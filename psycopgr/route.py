@@ -0,0 +1,121 @@
+"""Compact paths backed by arrays shared across routes."""
+from collections.abc import Sequence
+
+import numpy as np
+
+from .node import PgrNode
+
+
+class Path(Sequence):
+    """Path of PgrNode stored as the slice start:stop of arrays of vertex
+    ids, longitudes and latitudes.
+
+    The arrays hold the rows of a whole query result and are shared by all
+    its paths, so a path costs a few references instead of a PgrNode of
+    three Python objects per point. PgrNode are built lazily when the path
+    is indexed or iterated, so it can be used wherever a list of PgrNode is.
+
+    head and tail are optional nodes before and after the slice, such as the
+    nodes of get_routes framing the path between their nearest vertices.
+    """
+    __slots__ = ('ids', 'lons', 'lats', 'start', 'stop', 'head', 'tail')
+
+    def __init__(self, ids, lons, lats, start=0, stop=None, head=None,
+                 tail=None):
+        self.ids = ids
+        self.lons = lons
+        self.lats = lats
+        self.start = start
+        self.stop = len(ids) if stop is None else stop
+        self.head = head
+        self.tail = tail
+
+    @classmethod
+    def from_nodes(cls, nodes):
+        """Path holding a copy of a list of PgrNode. Ids are kept in an
+        object array if some of them are not integers, e.g. None.
+        """
+        ids = [node.id for node in nodes]
+        ids = np.array(ids, dtype=np.int64 if all(
+            isinstance(i, (int, np.integer)) for i in ids) else object)
+        return cls(ids,
+                   np.array([node.lon for node in nodes], dtype=np.float64),
+                   np.array([node.lat for node in nodes], dtype=np.float64))
+
+    def framed(self, head, tail):
+        """The same path between nodes head and tail, without copying."""
+        return Path(self.ids, self.lons, self.lats, self.start, self.stop,
+                    head, tail)
+
+    def reversed(self):
+        """The same path in reverse order, as views into the arrays."""
+        s = slice(self.start, self.stop)
+        return Path(self.ids[s][::-1], self.lons[s][::-1],
+                    self.lats[s][::-1], head=self.tail, tail=self.head)
+
+    def __len__(self):
+        return (self.stop - self.start + (self.head is not None)
+                + (self.tail is not None))
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        n = len(self)
+        if i < 0:
+            i += n
+        if not 0 <= i < n:
+            raise IndexError('Path index out of range')
+        if self.head is not None:
+            if i == 0:
+                return self.head
+            i -= 1
+        if self.start + i == self.stop:
+            return self.tail
+        k = self.start + i
+        return PgrNode(self.ids[k:k+1].tolist()[0], float(self.lons[k]),
+                       float(self.lats[k]))
+
+    def __iter__(self):
+        if self.head is not None:
+            yield self.head
+        for vid, lon, lat in zip(self.ids[self.start:self.stop].tolist(),
+                                 self.lons[self.start:self.stop].tolist(),
+                                 self.lats[self.start:self.stop].tolist()):
+            yield PgrNode(vid, lon, lat)
+        if self.tail is not None:
+            yield self.tail
+
+    def coordinates(self):
+        """(lons, lats) arrays of the path. They are views into the shared
+        arrays if the path has no head and tail.
+        """
+        lons = self.lons[self.start:self.stop]
+        lats = self.lats[self.start:self.stop]
+        if self.head is None and self.tail is None:
+            return lons, lats
+        frame_lons = ([self.head.lon] if self.head is not None else [],
+                      [self.tail.lon] if self.tail is not None else [])
+        frame_lats = ([self.head.lat] if self.head is not None else [],
+                      [self.tail.lat] if self.tail is not None else [])
+        return (np.concatenate([frame_lons[0], lons, frame_lons[1]]),
+                np.concatenate([frame_lats[0], lats, frame_lats[1]]))
+
+    def __eq__(self, other):
+        if not isinstance(other, Sequence):
+            return NotImplemented
+        return len(self) == len(other) and list(self) == list(other)
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        return equal if equal is NotImplemented else not equal
+
+    __hash__ = None
+
+    def __repr__(self):
+        return 'Path({})'.format(list(self))
+
+    def __reduce__(self):
+        # pickle only the slice, not the arrays shared with other paths
+        s = slice(self.start, self.stop)
+        return (Path, (self.ids[s].copy(), self.lons[s].copy(),
+                       self.lats[s].copy(), 0, None, self.head, self.tail))
@@ -0,0 +1,140 @@
+"""Memory-mapped snapshots of in-memory graphs.
+
+A snapshot is one binary file holding the arrays of a graph.Graph, so a
+process opens it in milliseconds instead of loading the edge table from the
+database, and processes opening the same file share its pages. Layout:
+
+    MAGIC, VERSION and length of the header (struct HEADER)
+    header: JSON of the meta data of the edge table, the signature of the
+        table when the snapshot was taken, and the dtype, shape, offset
+        and CRC-32 of each array
+    arrays, each at an offset aligned to ALIGN bytes
+"""
+from collections import namedtuple
+import json
+import struct
+import zlib
+
+import numpy as np
+
+from .graph import CSR, Graph
+
+MAGIC = b'PSYCOPGR-GRAPH\0\0'
+VERSION = 1
+HEADER = struct.Struct('<16sII')  # magic, version, length of header JSON
+ALIGN = 64
+
+CSR_ARRAYS = ('offsets', 'heads', 'tails', 'weights', 'edges')
+
+# graph opened from a snapshot, with the meta data and table signature it
+# was taken with
+Snapshot = namedtuple('Snapshot', ['graph', 'meta_data', 'signature'])
+
+
+def _aligned(offset):
+    return -(-offset // ALIGN) * ALIGN
+
+
+def _graph_arrays(graph):
+    arrays = {'vids': graph.vids, 'lons': graph.lons, 'lats': graph.lats}
+    for direction in ('forward', 'backward'):
+        csr = getattr(graph, direction)
+        for name in CSR_ARRAYS:
+            arrays['{}.{}'.format(direction, name)] = getattr(csr, name)
+    return {name: np.ascontiguousarray(array)
+            for name, array in arrays.items()}
+
+
+def save(graph, file, meta_data, signature=None):
+    """Write graph to a snapshot file.
+
+    Args:
+        graph: graph.Graph.
+        file: name of the file.
+        meta_data: meta data of the edge table the graph is loaded from.
+        signature: JSON-serializable signature of the edge table, compared
+            by PGRouting.load_graph_snapshot to detect a stale snapshot.
+    """
+    arrays = _graph_arrays(graph)
+    layout = {}
+    offset = 0
+    for name, array in arrays.items():
+        layout[name] = {'dtype': array.dtype.str, 'shape': list(array.shape),
+                        'offset': offset,
+                        'crc32': zlib.crc32(memoryview(array).cast('B'))}
+        offset = _aligned(offset + array.nbytes)
+    header = json.dumps({'meta_data': meta_data, 'signature': signature,
+                         'arrays': layout}, sort_keys=True).encode('utf-8')
+    # array offsets are relative to the first aligned byte after the header
+    base = _aligned(HEADER.size + len(header))
+
+    with open(file, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(header)))
+        f.write(header)
+        for name, array in arrays.items():
+            f.seek(base + layout[name]['offset'])
+            f.write(memoryview(array).cast('B'))
+        f.truncate(base + offset)
+
+
+def read_header(file):
+    """Header dict of a snapshot file and the offset of its arrays.
+
+    Raises ValueError if file is not a snapshot of this VERSION.
+    """
+    with open(file, 'rb') as f:
+        prefix = f.read(HEADER.size)
+        if len(prefix) < HEADER.size:
+            raise ValueError('{} is not a graph snapshot'.format(file))
+        magic, version, length = HEADER.unpack(prefix)
+        if magic != MAGIC:
+            raise ValueError('{} is not a graph snapshot'.format(file))
+        if version != VERSION:
+            raise ValueError('{} is a graph snapshot of version {}, '
+                             'expected {}'.format(file, version, VERSION))
+        header = f.read(length)
+        if len(header) < length:
+            raise ValueError('{} is a truncated graph snapshot'.format(file))
+    header = json.loads(header.decode('utf-8'))
+    return header, _aligned(HEADER.size + length)
+
+
+def load(file, verify=False):
+    """Open a snapshot file written by save.
+
+    Arrays are memory-mapped copy-on-write: pages are read on first access
+    and shared between processes until they are written to, e.g. to update
+    weights in place.
+
+    Args:
+        file: name of the file.
+        verify: check the CRC-32 of each array, which reads the whole file.
+
+    Returns:
+        Snapshot.
+
+    Raises:
+        ValueError: file is not a snapshot, or is corrupted.
+    """
+    header, base = read_header(file)
+    arrays = {}
+    for name, spec in header['arrays'].items():
+        shape = tuple(spec['shape'])
+        if int(np.prod(shape)) == 0:  # an empty array cannot be mapped
+            array = np.empty(shape, dtype=spec['dtype'])
+        else:
+            array = np.memmap(file, dtype=spec['dtype'], mode='c',
+                              offset=base + spec['offset'], shape=shape)
+        if verify and zlib.crc32(memoryview(array).cast('B')) \
+                != spec['crc32']:
+            raise ValueError('{}: checksum of array {} does not '
+                             'match'.format(file, name))
+        arrays[name] = array
+
+    forward, backward = (
+        CSR(*(arrays['{}.{}'.format(direction, name)]
+              for name in CSR_ARRAYS), shared=True)
+        for direction in ('forward', 'backward'))
+    graph = Graph(arrays['vids'], forward, backward, arrays['lons'],
+                  arrays['lats'])
+    return Snapshot(graph, header['meta_data'], header['signature'])
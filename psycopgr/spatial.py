@@ -0,0 +1,178 @@
+"""In-process spatial index of vertices for nearest vertex snapping."""
+import numpy as np
+
+from .node import PgrNode
+
+
+class GridIndex(object):
+    """Uniform grid over vertex coordinates held in NumPy arrays.
+
+    Points are sorted by the cell they fall in, so the points of cell c are
+    order[starts[c]:starts[c+1]]. Distances are planar in coordinate units,
+    the same as the <-> operator of PostGIS on geometries, so results equal
+    those of the KNN SQL queries.
+    """
+
+    def __init__(self, ids, lons, lats, points_per_cell=2.0):
+        """
+        Args:
+            ids, lons, lats: arrays of vertex ids and coordinates.
+            points_per_cell: average number of points per cell the grid is
+                sized for.
+        """
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.lons = np.asarray(lons, dtype=np.float64)
+        self.lats = np.asarray(lats, dtype=np.float64)
+        n = len(self.ids)
+
+        self.x0 = self.lons.min() if n else 0.0
+        self.y0 = self.lats.min() if n else 0.0
+        width = (self.lons.max() - self.x0) if n else 0.0
+        height = (self.lats.max() - self.y0) if n else 0.0
+        # the short side counts as at least 1/64 of the long one, so that
+        # near collinear points do not make a grid of one long row of tiny
+        # cells
+        extent = max(width, height)
+        area = max(width * height, extent * extent / 64, 1e-18)
+        cell = np.sqrt(area * points_per_cell / max(n, 1))
+        self.cell = max(cell, 1e-9)
+        self.nx = int(width / self.cell) + 1
+        self.ny = int(height / self.cell) + 1
+
+        cells = self._cells(self.lons, self.lats)
+        self.order = np.argsort(cells, kind='stable')
+        self.starts = np.zeros(self.nx * self.ny + 1, dtype=np.int64)
+        np.cumsum(np.bincount(cells, minlength=self.nx * self.ny),
+                  out=self.starts[1:])
+
+    def _cell_xy(self, lons, lats):
+        cx = np.clip(((lons - self.x0) / self.cell).astype(np.int64),
+                     0, self.nx - 1)
+        cy = np.clip(((lats - self.y0) / self.cell).astype(np.int64),
+                     0, self.ny - 1)
+        return cx, cy
+
+    def _cells(self, lons, lats):
+        cx, cy = self._cell_xy(lons, lats)
+        return cy * self.nx + cx
+
+    def _ring(self, r):
+        """Offsets (dx, dy) of the cells of ring r around a cell, left out
+        where they are beyond the size of the grid.
+        """
+        if r == 0:
+            return [(0, 0)]
+        xs = range(max(-r, 1 - self.nx), min(r, self.nx - 1) + 1)
+        ys = range(max(-r + 1, 1 - self.ny), min(r - 1, self.ny - 1) + 1)
+        rows = [dy for dy in (-r, r) if r < self.ny]
+        columns = [dx for dx in (-r, r) if r < self.nx]
+        return ([(dx, dy) for dx in xs for dy in rows]
+                + [(dx, dy) for dx in columns for dy in ys])
+
+    def _outside(self, x, n):
+        """Distance from offsets x to the n cells along an axis."""
+        return np.maximum(np.maximum(-x, x - n * self.cell), 0.0)
+
+    def _gap(self, x, cx, r, n):
+        """Distance along an axis from offsets x to the cells farther than r
+        from cells cx, inf if there are none of the n cells.
+        """
+        with np.errstate(invalid='ignore'):
+            after = np.where(cx + r + 1 < n, (cx + r + 1) * self.cell - x,
+                             np.inf)
+            before = np.where(cx - r > 0, x - (cx - r) * self.cell, np.inf)
+        return np.maximum(np.minimum(after, before), 0.0)
+
+    def nbytes(self):
+        """Memory held by the arrays of the index."""
+        return sum(a.nbytes for a in (self.ids, self.lons, self.lats,
+                                      self.order, self.starts))
+
+    def query(self, lons, lats, k=1):
+        """k nearest vertices of points, vectorized over the points.
+
+        Rings of cells around the cell of each point, clipped to the grid,
+        are scanned outwards until the k-th best distance is within the
+        distance from the point to the cells left, so that points outside
+        the grid start at its border.
+
+        Args:
+            lons, lats: arrays of coordinates of the query points.
+            k: number of nearest vertices per point.
+
+        Returns:
+            (positions, distances): arrays of shape (len(lons), k) sorted by
+            distance. positions index into ids, lons and lats, -1 if there
+            are fewer than k vertices.
+        """
+        lons = np.asarray(lons, dtype=np.float64)
+        lats = np.asarray(lats, dtype=np.float64)
+        nq = len(lons)
+        best_pos = np.full((nq, k), -1, dtype=np.int64)
+        best_d2 = np.full((nq, k), np.inf)
+        if nq == 0 or len(self.ids) == 0:
+            return best_pos, np.sqrt(best_d2)
+
+        qx, qy = self._cell_xy(lons, lats)
+        # distances from the points to the grid along each axis
+        ox = self._outside(lons - self.x0, self.nx)
+        oy = self._outside(lats - self.y0, self.ny)
+        active = np.arange(nq)
+        r = 0
+        while len(active) > 0:
+            offsets = self._ring(r)
+            if not offsets:
+                break
+            dx, dy = (np.array(a) for a in zip(*offsets))
+
+            # (query, cell) pairs of the ring that are inside the grid
+            pq = np.repeat(active, len(offsets))
+            cx = qx[pq] + np.tile(dx, len(active))
+            cy = qy[pq] + np.tile(dy, len(active))
+            inside = (cx >= 0) & (cx < self.nx) & (cy >= 0) & (cy < self.ny)
+            pq, c = pq[inside], (cy * self.nx + cx)[inside]
+
+            # expand pairs to (query, point) candidates
+            counts = self.starts[c + 1] - self.starts[c]
+            cq = np.repeat(pq, counts)
+            first = np.repeat(self.starts[c] - np.cumsum(counts) + counts,
+                              counts)
+            cpos = self.order[first + np.arange(counts.sum())]
+            cd2 = ((self.lons[cpos] - lons[cq]) ** 2
+                   + (self.lats[cpos] - lats[cq]) ** 2)
+
+            # merge candidates into the k best of each query
+            keep = best_pos[active] >= 0
+            q = np.concatenate([np.repeat(active, k)[keep.ravel()], cq])
+            pos = np.concatenate([best_pos[active][keep], cpos])
+            d2 = np.concatenate([best_d2[active][keep], cd2])
+            order = np.lexsort((d2, q))
+            q, pos, d2 = q[order], pos[order], d2[order]
+            group_first = np.searchsorted(q, q)
+            rank = np.arange(len(q)) - group_first
+            top = rank < k
+            best_pos[q[top], rank[top]] = pos[top]
+            best_d2[q[top], rank[top]] = d2[top]
+
+            # done when the k-th best is not farther than the cells outside
+            # the ring, inf when the ring covers the grid
+            gx = self._gap(lons[active] - self.x0, qx[active], r, self.nx)
+            gy = self._gap(lats[active] - self.y0, qy[active], r, self.ny)
+            done = best_d2[active, k - 1] <= np.minimum(
+                gx ** 2 + oy[active] ** 2, gy ** 2 + ox[active] ** 2)
+            active = active[~done]
+            r += 1
+
+        return best_pos, np.sqrt(best_d2)
+
+    def nearest(self, nodes, k=1):
+        """k nearest vertices of nodes as PgrNode.
+
+        Returns:
+            list with a list of PgrNode sorted by distance for each node.
+        """
+        positions, _ = self.query([node.lon for node in nodes],
+                                  [node.lat for node in nodes], k)
+        return [[PgrNode(int(self.ids[p]), float(self.lons[p]),
+                         float(self.lats[p])) for p in row if p >= 0]
+                for row in positions]
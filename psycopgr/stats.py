@@ -0,0 +1,193 @@
+"""Instrumentation of the public calls of PGRouting.
+
+A Profiler set on PGRouting by set_profiler records a CallStats for each
+public call. Calls made inside another one, like find_nearest_vertices
+inside get_routes, are not recorded on their own but timed as phases of
+the outer call, also when made by its worker threads, like those
+computing tiles. Phases of parallel workers add up, so they may exceed
+the wall time of the call.
+"""
+from collections import deque
+from contextlib import contextmanager
+import functools
+import threading
+import time
+
+
+class CallStats(object):
+    """Statistics of one public call.
+
+    Attributes:
+        name: name of the method called.
+        total_s: wall time of the call.
+        round_trips: number of SQL statements sent.
+        server_s: time waiting for statements to execute, which includes
+            the transfer of their result rows.
+        fetch_s: time converting result rows to Python objects.
+        rows: number of rows fetched.
+        bytes: approximate size of the rows fetched, as text, estimated
+            from a sample of them.
+        build_s: time building outputs (PgrNode lists and dicts) from rows.
+        phases: dict mapping the name of a nested public call to its wall
+            time.
+        queries: list of (template name, seconds executing it).
+        explains: list of dicts of the EXPLAIN (ANALYZE, BUFFERS) plans of
+            the query ('plan') and of its edges SQL ('edges_plan'), keyed by
+            template name ('query'), if the profiler captures them.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.total_s = 0.0
+        self.round_trips = 0
+        self.server_s = 0.0
+        self.fetch_s = 0.0
+        self.rows = 0
+        self.bytes = 0
+        self.build_s = 0.0
+        self.phases = {}
+        self.queries = []
+        self.explains = []
+        self._lock = threading.Lock()
+
+    def add(self, **amounts):
+        """Add amounts to the attributes of their names, safely from the
+        threads working for the call, e.g. those of a tiling.Tiling.
+        """
+        with self._lock:
+            for name, amount in amounts.items():
+                setattr(self, name, getattr(self, name) + amount)
+
+    def add_phase(self, name, seconds):
+        """Add seconds to the time of phase name."""
+        with self._lock:
+            self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    @property
+    def client_s(self):
+        """Time spent in Python, i.e. not waiting for the server."""
+        return self.total_s - self.server_s
+
+    def as_dict(self):
+        return {'name': self.name, 'total_s': self.total_s,
+                'round_trips': self.round_trips, 'server_s': self.server_s,
+                'client_s': self.client_s, 'fetch_s': self.fetch_s,
+                'rows': self.rows, 'bytes': self.bytes,
+                'build_s': self.build_s, 'phases': dict(self.phases),
+                'queries': list(self.queries),
+                'explains': list(self.explains)}
+
+    def __repr__(self):
+        return ('CallStats({name}: {total_s:.3f} s, {round_trips} round '
+                'trips, server {server_s:.3f} s, client {client_s:.3f} s, '
+                '{rows} rows)').format(**self.as_dict())
+
+
+class Profiler(object):
+    """Recorder of CallStats, which are kept in calls and passed to hooks.
+
+    Usage:
+        profiler = pgr.set_profiler(Profiler(hooks=[print]))
+        pgr.get_routes(nodes, nodes)
+        profiler.summary()
+    """
+
+    def __init__(self, hooks=(), explain=False, keep=1000):
+        """
+        Args:
+            hooks: functions called with the CallStats of each call once it
+                is done, in the thread of the call.
+            explain: capture EXPLAIN (ANALYZE, BUFFERS) plans of the
+                pgRouting queries, and of their edges SQL. This runs each of
+                them once more, so it is for debugging only.
+            keep: number of the latest CallStats kept in calls.
+        """
+        self.hooks = list(hooks)
+        self.explain = explain
+        self.calls = deque(maxlen=keep)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def add_hook(self, hook):
+        self.hooks.append(hook)
+
+    def current(self):
+        """CallStats of the call running in this thread, or None."""
+        return getattr(self._local, 'stats', None)
+
+    @contextmanager
+    def call(self, name):
+        """Context manager recording the call name, or timing it as a phase
+        of the call already running in this thread.
+        """
+        stats = self.current()
+        t0 = time.perf_counter()
+        if stats is not None:
+            try:
+                yield stats
+            finally:
+                stats.add_phase(name, time.perf_counter() - t0)
+            return
+
+        stats = CallStats(name)
+        self._local.stats = stats
+        try:
+            yield stats
+        finally:
+            self._local.stats = None
+            stats.total_s = time.perf_counter() - t0
+            with self._lock:
+                self.calls.append(stats)
+            for hook in self.hooks:
+                hook(stats)
+
+    @contextmanager
+    def attach(self, stats):
+        """Context manager recording what runs in this thread as part of
+        the call of stats, running in another thread: worker threads of a
+        call use it so that their queries count in the call rather than as
+        calls of their own.
+        """
+        previous = self.current()
+        self._local.stats = stats
+        try:
+            yield stats
+        finally:
+            self._local.stats = previous
+
+    def summary(self):
+        """Totals of the kept calls by method name.
+
+        Returns:
+            dict mapping name to dict of calls, total_s, server_s, client_s,
+            round_trips, rows, bytes and build_s.
+        """
+        output = {}
+        with self._lock:
+            calls = list(self.calls)
+        for stats in calls:
+            total = output.setdefault(stats.name, {
+                'calls': 0, 'total_s': 0.0, 'server_s': 0.0, 'client_s': 0.0,
+                'round_trips': 0, 'rows': 0, 'bytes': 0, 'build_s': 0.0})
+            total['calls'] += 1
+            for key in ('total_s', 'server_s', 'client_s', 'round_trips',
+                        'rows', 'bytes', 'build_s'):
+                total[key] += getattr(stats, key)
+        return output
+
+    def clear(self):
+        with self._lock:
+            self.calls.clear()
+
+
+def profiled(method):
+    """Decorator of public methods of PGRouting recording them in the
+    profiler set by set_profiler.
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if self._profiler is None:
+            return method(self, *args, **kwargs)
+        with self._profiler.call(method.__name__):
+            return method(self, *args, **kwargs)
+    return wrapper
@@ -0,0 +1,123 @@
+"""Tiled parallel computation of many-to-many routing results.
+
+A call over start_vids x end_vids is split into tiles of at most
+rows x cols vertex pairs, which are computed concurrently by a thread pool
+and merged into one dict. With PGRouting in pooled mode, each tile runs
+over its own connection and so on its own database backend.
+"""
+from concurrent.futures import CancelledError, ThreadPoolExecutor, \
+    as_completed
+import threading
+
+
+def split(start_vids, end_vids, tile_size):
+    """Split start_vids x end_vids into tiles.
+
+    Args:
+        start_vids, end_vids: lists of vertex ids, duplicates are dropped.
+        tile_size: max number of start and end vertices of a tile, as an int
+            or a tuple (rows, cols).
+
+    Returns:
+        list of tiles (start_vids, end_vids).
+    """
+    rows, cols = tile_size if isinstance(tile_size, tuple) \
+        else (tile_size, tile_size)
+    starts = list(dict.fromkeys(start_vids))
+    ends = list(dict.fromkeys(end_vids))
+    return [(starts[i:i+rows], ends[j:j+cols])
+            for i in range(0, len(starts), rows)
+            for j in range(0, len(ends), cols)]
+
+
+class Tiling(object):
+    """Scheduler of tiled many-to-many computations, passed to
+    PGRouting.get_costs and get_routes.
+
+    Tiles are looked up in and stored to the cache of PGRouting one by one,
+    so a tile computed once is reused by any later call covering the same
+    pairs. The number of tiles running at a time is bounded by workers, and
+    by pool_maxconn of PGRouting, which should not be smaller.
+
+    Usage:
+        tiling = Tiling(tile_size=200, workers=8,
+                        progress=lambda done, total: print(done, total))
+        costs = pgr.get_costs(nodes, nodes, tiling=tiling)
+        # from another thread, to stop early:
+        tiling.cancel()
+    """
+
+    def __init__(self, tile_size=256, workers=4, progress=None):
+        """
+        Args:
+            tile_size: max number of start and end vertices of a tile, as an
+                int or a tuple (rows, cols).
+            workers: number of tiles computed at the same time.
+            progress: function called with (done, total) numbers of tiles
+                each time a tile completes, in the thread calling run.
+        """
+        self.tile_size = tile_size
+        self.workers = workers
+        self.progress = progress
+        self._lock = threading.Lock()
+        # events of the runs in progress, and of the last run started
+        self._running = set()
+        self._cancelled = threading.Event()
+
+    def cancel(self):
+        """Stop the runs in progress: tiles not started yet are skipped,
+        and run raises CancelledError. Queries in flight finish. Later runs
+        are not affected, so the tiling can be reused.
+        """
+        with self._lock:
+            for cancelled in self._running:
+                cancelled.set()
+
+    @property
+    def cancelled(self):
+        """Whether the last run started was cancelled."""
+        return self._cancelled.is_set()
+
+    @staticmethod
+    def _compute(cancelled, compute, start_vids, end_vids):
+        if cancelled.is_set():
+            raise CancelledError()
+        return compute(start_vids, end_vids)
+
+    def run(self, compute, start_vids, end_vids):
+        """Compute all tiles of start_vids x end_vids and merge the results.
+
+        Args:
+            compute: function of (start_vids, end_vids) returning a dict
+                keyed by (start_vid, end_vid), such as PGRouting.dijkstra.
+            start_vids, end_vids: lists of vertex ids.
+
+        Returns:
+            dict merging the results of all tiles.
+
+        Raises:
+            CancelledError: cancel was called during the run.
+        """
+        tiles = split(start_vids, end_vids, self.tile_size)
+        cancelled = threading.Event()
+        with self._lock:
+            self._running.add(cancelled)
+            self._cancelled = cancelled
+        output = {}
+        try:
+            with ThreadPoolExecutor(self.workers) as executor:
+                futures = [executor.submit(self._compute, cancelled, compute,
+                                           *tile)
+                           for tile in tiles]
+                try:
+                    for done, future in enumerate(as_completed(futures), 1):
+                        output.update(future.result())
+                        if self.progress is not None:
+                            self.progress(done, len(tiles))
+                finally:
+                    for future in futures:
+                        future.cancel()
+        finally:
+            with self._lock:
+                self._running.discard(cancelled)
+        return output
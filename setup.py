@@ -25,12 +25,14 @@ VERSION = '1.0.6'
 
 # What packages are required for this module to be executed?
 REQUIRED = [
+    'numpy',
     'psycopg2',
 ]
 
 # What packages are optional?
 EXTRAS = {
     # 'fancy feature': ['django'],
+    'async': ['psycopg>=3.1', 'psycopg-pool'],
 }
 
 # The rest you shouldn't have to touch too much :)